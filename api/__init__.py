@@ -1,2 +1,37 @@
-from .tools import *
-from .weather_api import *
+import importlib
+from .cache import *
+from .coalescing import *
+from .geocoding import *
+from .keys import *
+from .locks import *
+from .metrics import *
+from .quota import *
+from .snapshot import *
+
+# Public names of the modules that depend on httpx, requests, NumPy or LangChain. A module is only imported on first
+# access of one of its names.
+_lazy_modules = {
+    "cassettes": ("Cassette", "CassetteAdapter", "CassetteTransport"),
+    "icons": ("ICON_URL", "ICON_IDS", "ICON_BUNDLE_DIR", "IconStore"),
+    "timeline": ("WeatherTimeline",),
+    "transport": ("CircuitOpenError", "QuotaExhaustedError", "CircuitBreaker", "HTTPTransport", "AsyncHTTPTransport"),
+    "weather_api": ("QUOTA_EXHAUSTED", "MAX_LOCATIONS", "count_tokens", "OpenWeatherMapAPIWrapper",
+                    "AsyncOpenWeatherMapAPIWrapper"),
+    "tools": ("WEATHER_DATA_EVENT", "LocationInput", "ForecastInput", "OpenWeatherMapInput",
+              "OpenWeatherMapComparisonInput", "OpenWeatherMapHourlyInput", "OpenWeatherMapQuery",
+              "OpenWeatherMapComparison", "OpenWeatherMapHourly"),
+}
+_lazy_names = {name: module_name for module_name, names in _lazy_modules.items() for name in names}
+
+
+def __getattr__(name: str):
+    # unknown names are rejected without importing anything, e.g. for hasattr checks
+    if name not in _lazy_names:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    module = importlib.import_module(f".{_lazy_names[name]}", __name__)
+    globals()[name] = value = getattr(module, name)
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(_lazy_names))
@@ -0,0 +1,212 @@
+import os
+import json
+import time
+import sqlite3
+import threading
+from collections import OrderedDict
+from dotenv import load_dotenv
+from .locks import ForkSafeLock, GuardedConnection, fork_guard
+from .metrics import metrics
+from .snapshot import WeatherSnapshot
+
+__all__ = ["MemoryCache", "SQLiteCache", "create_cache_backend", "WeatherCache"]
+
+load_dotenv()
+
+
+class MemoryCache:
+    """In-process LRU cache backend."""
+    def __init__(self, maxsize: int = 1024):
+        self.maxsize = maxsize
+        self._data = OrderedDict()
+        self._lock = ForkSafeLock()
+
+    def get(self, key: str) -> dict | None:
+        """Get a value and mark it as recently used."""
+        with self._lock:
+            if key not in self._data:
+                return None
+            self._data.move_to_end(key)
+            return self._data[key]
+
+    def set(self, key: str, value: dict) -> None:
+        """Store a value and evict the least recently used entries."""
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def delete(self, key: str) -> None:
+        """Remove a value from the cache."""
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self) -> None:
+        """Remove all values from the cache."""
+        with self._lock:
+            self._data.clear()
+
+
+class SQLiteCache:
+    """On-disk cache backend that can be shared by several worker processes."""
+    def __init__(self, path: str, table: str = "cache", maxsize: int = 100_000):
+        self.path = path
+        self.table = table
+        self.maxsize = maxsize
+        self._local = threading.local()
+        self._writes = 0
+        with fork_guard, self._connect() as conn:
+            conn.execute(
+                f"CREATE TABLE IF NOT EXISTS {self.table} (key TEXT PRIMARY KEY, value TEXT, updated REAL)"
+            )
+
+    def _connect(self) -> sqlite3.Connection:
+        """Get a connection for the current thread and process."""
+        conn = getattr(self._local, "conn", None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=5, check_same_thread=False, factory=GuardedConnection)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def get(self, key: str) -> dict | None:
+        """Get a value from the database."""
+        with fork_guard:
+            row = self._connect().execute(f"SELECT value FROM {self.table} WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return None
+        return json.loads(row[0])
+
+    def set(self, key: str, value: dict) -> None:
+        """Store a value and occasionally prune the least recently written entries."""
+        with fork_guard, self._connect() as conn:
+            conn.execute(
+                f"INSERT OR REPLACE INTO {self.table} (key, value, updated) VALUES (?, ?, ?)",
+                (key, json.dumps(value, separators=(",", ":")), time.time())
+            )
+            self._writes += 1
+            if self._writes % 1000 == 0:
+                conn.execute(
+                    f"DELETE FROM {self.table} WHERE key IN "
+                    f"(SELECT key FROM {self.table} ORDER BY updated DESC LIMIT -1 OFFSET ?)",
+                    (self.maxsize,)
+                )
+
+    def delete(self, key: str) -> None:
+        """Remove a value from the database."""
+        with fork_guard, self._connect() as conn:
+            conn.execute(f"DELETE FROM {self.table} WHERE key = ?", (key,))
+
+    def clear(self) -> None:
+        """Remove all values from the database."""
+        with fork_guard, self._connect() as conn:
+            conn.execute(f"DELETE FROM {self.table}")
+
+
+def create_cache_backend(table: str, maxsize: int = 1024) -> MemoryCache | SQLiteCache:
+    """Create a SQLite backend if CACHE_DB_PATH is set, otherwise an in-process LRU backend."""
+    path = os.getenv("CACHE_DB_PATH", "")
+    if path:
+        return SQLiteCache(path, table=table)
+    return MemoryCache(maxsize=maxsize)
+
+
+class WeatherCache:
+    """TTL-aware cache for weather snapshots keyed by coordinates rounded to a given precision.
+
+    The current conditions and the daily forecast expire independently. Expired data is still served for up to
+    `stale_ttl` seconds while the caller refreshes it in the background. The hourly and minutely forecasts are only
+    fetched on demand and only returned to callers that ask for them. They expire after `hourly_ttl` and `minutely_ttl`
+    seconds and are never served stale, since the queries over the next hours and minutes start at the current time.
+    """
+    parts = ("current", "daily")
+    timeline_parts = ("hourly", "minutely")
+
+    def __init__(self, backend: MemoryCache | SQLiteCache | None = None, precision: int = 2,
+                 current_ttl: float = 600, daily_ttl: float = 3600, stale_ttl: float = 3600,
+                 hourly_ttl: float = 600, minutely_ttl: float = 60):
+        self.backend = backend if backend is not None else create_cache_backend("weather")
+        self.precision = precision
+        self.ttl = {"current": current_ttl, "daily": daily_ttl, "hourly": hourly_ttl, "minutely": minutely_ttl}
+        self.stale_ttl = {"current": stale_ttl, "daily": stale_ttl, "hourly": 0, "minutely": 0}
+        self._refreshing = set()
+        self._lock = ForkSafeLock()
+
+    def key(self, lat: float, lon: float) -> str:
+        """Create the cache key for a pair of coordinates."""
+        return f"{lat:.{self.precision}f},{lon:.{self.precision}f}"
+
+    def get(self, lat: float, lon: float,
+            parts: tuple[str, ...] = parts) -> tuple[WeatherSnapshot | None, list[str]]:
+        """Get the given parts of cached weather data and the parts of it that have expired.
+
+        Returns no data if nothing is cached or any part is older than its TTL plus the time it may be served stale.
+        """
+        entry = self._entry(lat, lon)
+        if entry is None:
+            metrics.inc("chatbot_cache_requests_total", cache="weather", result="miss")
+            return None, list(parts)
+
+        # check the age of each part
+        now = time.time()
+        expired = []
+        for part in parts:
+            age = now - entry["fetched"].get(part, 0)
+            if age > self.ttl[part] + self.stale_ttl[part]:
+                metrics.inc("chatbot_cache_requests_total", cache="weather", result="miss")
+                return None, list(parts)
+            if age > self.ttl[part]:
+                expired.append(part)
+        metrics.inc("chatbot_cache_requests_total", cache="weather", result="stale" if expired else "hit")
+        return self.select(WeatherSnapshot.from_dict(entry["snapshot"]), parts), expired
+
+    def get_outdated(self, lat: float, lon: float, parts: tuple[str, ...] = parts) -> WeatherSnapshot | None:
+        """Get the given parts of cached weather data regardless of their age, e.g. while no data can be requested."""
+        entry = self._entry(lat, lon)
+        if entry is None or any(part not in entry["fetched"] for part in parts):
+            return None
+        metrics.inc("chatbot_cache_requests_total", cache="weather", result="outdated")
+        return self.select(WeatherSnapshot.from_dict(entry["snapshot"]), parts)
+
+    def select(self, weather: WeatherSnapshot, parts: tuple[str, ...]) -> WeatherSnapshot:
+        """Remove the hourly and minutely forecasts from weather data unless they are among the given parts."""
+        return weather.select(self.parts + tuple(part for part in self.timeline_parts if part in parts))
+
+    def set(self, lat: float, lon: float, weather: WeatherSnapshot, parts: list[str]) -> WeatherSnapshot:
+        """Merge freshly fetched parts into the cache and return the merged weather data with these parts."""
+        key = self.key(lat, lon)
+        entry = self._entry(lat, lon) or {"snapshot": {"timezone_offset": weather.timezone_offset}, "fetched": {}}
+
+        # keep cached parts that were not fetched
+        merged = WeatherSnapshot.from_dict(entry["snapshot"]).merge(weather)
+        fetched = dict(entry["fetched"])
+        now = time.time()
+        for part in parts:
+            fetched[part] = now
+
+        self.backend.set(key, {"snapshot": merged.to_dict(), "fetched": fetched})
+        return self.select(merged, parts)
+
+    def _entry(self, lat: float, lon: float) -> dict | None:
+        """Get the cache entry of a pair of coordinates, ignoring entries of earlier versions with raw responses."""
+        entry = self.backend.get(self.key(lat, lon))
+        if entry is None or "snapshot" not in entry:
+            return None
+        return entry
+
+    def start_refresh(self, lat: float, lon: float) -> bool:
+        """Mark a key as being refreshed. Returns False if a refresh is already running."""
+        key = self.key(lat, lon)
+        with self._lock:
+            if key in self._refreshing:
+                return False
+            self._refreshing.add(key)
+            return True
+
+    def end_refresh(self, lat: float, lon: float) -> None:
+        """Unmark a key as being refreshed."""
+        with self._lock:
+            self._refreshing.discard(self.key(lat, lon))
@@ -0,0 +1,217 @@
+import os
+import glob
+import gzip
+import json
+import httpx
+import hashlib
+import requests
+from urllib.parse import urlparse, parse_qsl
+from requests.adapters import HTTPAdapter
+from requests.structures import CaseInsensitiveDict
+from dotenv import load_dotenv
+from .locks import ForkSafeLock
+
+load_dotenv()
+
+# Query parameters that are not part of the recorded requests, e.g. API keys
+IGNORED_PARAMS = {"appid"}
+
+# Status and content of requests without a recorded response
+MISSING_STATUS = 404
+MISSING_CONTENT = json.dumps({"error": {"message": "No recorded response for this request", "code": 404}})
+
+
+class Cassette:
+    """Recorded HTTP exchanges in gzip-compressed JSON lines files that are replayed without network access.
+
+    New exchanges are appended to `recorded.jsonl.gz` in `directory` or CASSETTE_DIR. For replay, all `*.jsonl.gz`
+    files of the directory are indexed on first use. Requests are matched exactly or, for chat completions, by the
+    messages of the latest question, so that replays do not depend on the earlier conversation.
+    """
+    def __init__(self, directory: str = None):
+        self.directory = directory or os.getenv("CASSETTE_DIR", "cassettes")
+        self.path = os.path.join(self.directory, "recorded.jsonl.gz")
+        self._index = None
+        self._lock = ForkSafeLock()
+
+    def has_recordings(self) -> bool:
+        """Check if there are cassette files to replay."""
+        return bool(glob.glob(os.path.join(self.directory, "*.jsonl.gz")))
+
+    @staticmethod
+    def _digest(value) -> str:
+        return hashlib.sha256(json.dumps(value, sort_keys=True).encode()).hexdigest()[:32]
+
+    @classmethod
+    def keys(cls, method: str, url: str, body: bytes | None) -> tuple[str, str]:
+        """Get the exact and the loose key of a request."""
+        parsed = urlparse(url)
+        params = sorted((key, value) for key, value in parse_qsl(parsed.query) if key not in IGNORED_PARAMS)
+        try:
+            data = json.loads(body) if body else None
+        except ValueError:
+            data = body.decode(errors="replace")
+        exact = [method, parsed.path, params, data]
+        if not isinstance(data, dict) or "messages" not in data:
+            return cls._digest(exact), cls._digest(exact)
+
+        # match chat completions by the messages since the latest question and the tool calls without their ids
+        messages = data["messages"]
+        start = max((i for i, message in enumerate(messages) if message.get("role") == "user"), default=0)
+        turn = [
+            (message.get("role"), message.get("content"),
+             [call["function"] for call in message.get("tool_calls") or []])
+            for message in messages[start:]
+        ]
+        loose = [method, parsed.path, data.get("stream", False), bool(data.get("tools")), turn]
+        return cls._digest(exact), cls._digest(loose)
+
+    def record(self, method: str, url: str, body: bytes | None, status: int, content_type: str,
+               content: bytes) -> None:
+        """Append an exchange to the cassette."""
+        exact, loose = self.keys(method, url, body)
+        entry = {
+            "key": exact,
+            "loose": loose,
+            "method": method,
+            "path": urlparse(url).path,
+            "status": status,
+            "content_type": content_type,
+            "content": content.decode(errors="replace"),
+        }
+        # a single gzip member per exchange is appended at once, so several processes can record to the same file
+        data = gzip.compress((json.dumps(entry) + "\n").encode())
+        os.makedirs(self.directory, exist_ok=True)
+        fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        try:
+            os.write(fd, data)
+        finally:
+            os.close(fd)
+
+    def _load(self) -> dict:
+        """Index the recorded responses by their exact and loose keys, the first recording of a key wins."""
+        with self._lock:
+            if self._index is None:
+                index = {}
+                for path in sorted(glob.glob(os.path.join(self.directory, "*.jsonl.gz"))):
+                    with gzip.open(path, "rt", encoding="utf-8") as file:
+                        for line in file:
+                            entry = json.loads(line)
+                            index.setdefault(("exact", entry["key"]), entry)
+                            index.setdefault(("loose", entry["loose"]), entry)
+                self._index = index
+            return self._index
+
+    def find(self, method: str, url: str, body: bytes | None) -> dict | None:
+        """Find the recorded response to a request."""
+        index = self._load()
+        exact, loose = self.keys(method, url, body)
+        return index.get(("exact", exact)) or index.get(("loose", loose))
+
+    def replay(self, method: str, url: str, body: bytes | None) -> tuple[int, str, bytes]:
+        """Get the status, content type and content of the recorded response or a 404 response if there is none."""
+        entry = self.find(method, url, body)
+        if entry is None:
+            return MISSING_STATUS, "application/json", MISSING_CONTENT.encode()
+        return entry["status"], entry["content_type"], entry["content"].encode()
+
+
+class CassetteAdapter(HTTPAdapter):
+    """Transport adapter for requests sessions that records responses to a cassette or replays them from it."""
+    def __init__(self, cassette: Cassette, replay: bool = False, **kwargs):
+        super().__init__(**kwargs)
+        self.cassette = cassette
+        self.replay = replay
+
+    def send(self, request: requests.PreparedRequest, *args, **kwargs) -> requests.Response:
+        """Send a request or replay its response."""
+        body = request.body.encode() if isinstance(request.body, str) else request.body
+        if not self.replay:
+            response = super().send(request, *args, **kwargs)
+            self.cassette.record(request.method, request.url, body, response.status_code,
+                                 response.headers.get("Content-Type", ""), response.content)
+            return response
+
+        status, content_type, content = self.cassette.replay(request.method, request.url, body)
+        response = requests.Response()
+        response.status_code = status
+        response.headers = CaseInsensitiveDict({"Content-Type": content_type})
+        response._content = content
+        response.encoding = "utf-8"
+        response.url = request.url
+        response.request = request
+        response.connection = self
+        return response
+
+
+class _RecordingStream(httpx.SyncByteStream, httpx.AsyncByteStream):
+    """Response stream that passes on the chunks and records the complete content once the stream is consumed."""
+    def __init__(self, stream, record):
+        self.stream = stream
+        self.record = record
+        self.chunks = []
+
+    def __iter__(self):
+        for chunk in self.stream:
+            self.chunks.append(chunk)
+            yield chunk
+        self.record(b"".join(self.chunks))
+
+    async def __aiter__(self):
+        async for chunk in self.stream:
+            self.chunks.append(chunk)
+            yield chunk
+        self.record(b"".join(self.chunks))
+
+    def close(self) -> None:
+        self.stream.close()
+
+    async def aclose(self) -> None:
+        await self.stream.aclose()
+
+
+class CassetteTransport(httpx.BaseTransport, httpx.AsyncBaseTransport):
+    """Transport for httpx clients that records responses to a cassette or replays them from it.
+
+    Responses are passed on while they are streamed and recorded once they are complete. Recorded requests ask for
+    uncompressed responses, so that the cassettes can be read without knowing the encoding.
+    """
+    def __init__(self, cassette: Cassette, replay: bool = False,
+                 transport: httpx.BaseTransport | httpx.AsyncBaseTransport | None = None):
+        self.cassette = cassette
+        self.replay = replay
+        self.transport = transport
+
+    def _replay(self, request: httpx.Request) -> httpx.Response:
+        status, content_type, content = self.cassette.replay(request.method, str(request.url), request.content)
+        return httpx.Response(status, headers={"Content-Type": content_type}, content=content, request=request)
+
+    def _recording(self, request: httpx.Request, response: httpx.Response) -> httpx.Response:
+        def record(content: bytes) -> None:
+            self.cassette.record(request.method, str(request.url), request.content, response.status_code,
+                                 response.headers.get("Content-Type", ""), content)
+
+        return httpx.Response(response.status_code, headers=response.headers, request=request,
+                              stream=_RecordingStream(response.stream, record), extensions=response.extensions)
+
+    def handle_request(self, request: httpx.Request) -> httpx.Response:
+        """Send a request or replay its response."""
+        if self.replay:
+            return self._replay(request)
+        request.headers["Accept-Encoding"] = "identity"
+        return self._recording(request, self.transport.handle_request(request))
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        """Send a request or replay its response asynchronously."""
+        if self.replay:
+            return self._replay(request)
+        request.headers["Accept-Encoding"] = "identity"
+        return self._recording(request, await self.transport.handle_async_request(request))
+
+    def close(self) -> None:
+        if self.transport is not None:
+            self.transport.close()
+
+    async def aclose(self) -> None:
+        if self.transport is not None:
+            await self.transport.aclose()
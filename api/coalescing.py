@@ -0,0 +1,162 @@
+import os
+import time
+import zlib
+import asyncio
+import threading
+from typing import Any, Awaitable, Callable
+from concurrent.futures import Future
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+from .locks import ForkSafeLock, reset_after_fork
+from .metrics import metrics
+
+__all__ = ["LOCK_STRIPES", "SingleFlight"]
+
+# Number of byte ranges of the lock file that keys are spread over
+LOCK_STRIPES = 4096
+
+
+class SingleFlight:
+    """Coalescing of concurrent calls with the same key into a single call whose result is shared.
+
+    Within a process, the first caller of a key runs the call and callers that arrive meanwhile wait for its result.
+    If `lock_path` is set, the first callers of all processes also take turns through a byte-range lock of that file.
+    A caller that had to wait for another process first runs `recheck`, e.g. a cache lookup, and only makes the call
+    if it returns None. Lock files are not available on Windows, where calls are only coalesced within a process.
+    """
+    def __init__(self, lock_path: str = "", timeout: float = 15):
+        self.lock_path = lock_path if fcntl is not None else ""
+        self.timeout = timeout
+        self._calls = {}
+        self._stripes = {}
+        self._lock = ForkSafeLock()
+        self._fd = None
+        self._pid = None
+        reset_after_fork(self)
+
+    def run(self, key: str, func: Callable[[], Any], recheck: Callable[[], Any] | None = None) -> Any:
+        """Call `func` or wait for the result of a running call with the same key."""
+        future, leader = self._join(key)
+        if not leader:
+            metrics.inc("chatbot_http_requests_skipped_total", reason="coalesced")
+            return future.result()
+        try:
+            # wait until the same call of other processes is done
+            deadline = time.monotonic() + self.timeout
+            waited = False
+            locked = self._try_lock(key)
+            while not locked and time.monotonic() <= deadline:
+                waited = True
+                time.sleep(0.02)
+                locked = self._try_lock(key)
+            try:
+                result = self._recheck(recheck) if waited else None
+                if result is None:
+                    result = func()
+            finally:
+                # the key is not unlocked after a timeout, since another thread of this process may hold its stripe
+                if locked:
+                    self._unlock(key)
+            future.set_result(result)
+            return result
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        finally:
+            self._leave(key)
+
+    async def arun(self, key: str, func: Callable[[], Awaitable], recheck: Callable[[], Any] | None = None) -> Any:
+        """Await `func` or the result of a running call with the same key, see `run`."""
+        future, leader = self._join(key)
+        if not leader:
+            metrics.inc("chatbot_http_requests_skipped_total", reason="coalesced")
+            return await asyncio.wrap_future(future)
+        try:
+            # wait until the same call of other processes is done
+            deadline = time.monotonic() + self.timeout
+            waited = False
+            locked = self._try_lock(key)
+            while not locked and time.monotonic() <= deadline:
+                waited = True
+                await asyncio.sleep(0.02)
+                locked = self._try_lock(key)
+            try:
+                result = self._recheck(recheck) if waited else None
+                if result is None:
+                    result = await func()
+            finally:
+                # the key is not unlocked after a timeout, since another thread of this process may hold its stripe
+                if locked:
+                    self._unlock(key)
+            future.set_result(result)
+            return result
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        finally:
+            self._leave(key)
+
+    def _reset(self) -> None:
+        # the calls of a forked process are run by threads of the parent, which also hold its stripes
+        self._calls.clear()
+        self._stripes.clear()
+
+    def _join(self, key: str) -> tuple[Future, bool]:
+        """Get the future of the running call with the key and whether the caller has to make the call."""
+        with self._lock:
+            if key in self._calls:
+                return self._calls[key], False
+            future = self._calls[key] = Future()
+            return future, True
+
+    def _leave(self, key: str) -> None:
+        """Unregister the call with the key."""
+        with self._lock:
+            self._calls.pop(key, None)
+
+    @staticmethod
+    def _recheck(recheck: Callable[[], Any] | None) -> Any:
+        """Get the result of another process or None."""
+        if recheck is None:
+            return None
+        result = recheck()
+        if result is not None:
+            metrics.inc("chatbot_http_requests_skipped_total", reason="coalesced")
+        return result
+
+    def _stripe(self, key: str) -> int:
+        """Get the byte of the lock file that guards a key, which is the same in all processes."""
+        return zlib.crc32(key.encode()) % LOCK_STRIPES
+
+    def _try_lock(self, key: str) -> bool:
+        """Try to lock the key in the lock file, which always succeeds without a lock file."""
+        if not self.lock_path:
+            return True
+        stripe = self._stripe(key)
+        with self._lock:
+            # byte-range locks belong to the process, so threads with keys of the same stripe take turns through a
+            # thread lock of the stripe first
+            lock = self._stripes.setdefault(stripe, threading.Lock())
+            if not lock.acquire(blocking=False):
+                return False
+            # byte-range locks are released when any descriptor of the file closes, so each process keeps a single one
+            if self._fd is None or self._pid != os.getpid():
+                self._fd = os.open(self.lock_path, os.O_RDWR | os.O_CREAT, 0o644)
+                self._pid = os.getpid()
+            try:
+                fcntl.lockf(self._fd, fcntl.LOCK_EX | fcntl.LOCK_NB, 1, stripe)
+                return True
+            except OSError:
+                lock.release()
+                return False
+
+    def _unlock(self, key: str) -> None:
+        """Unlock the key in the lock file."""
+        if not self.lock_path or self._pid != os.getpid():
+            return
+        stripe = self._stripe(key)
+        with self._lock:
+            fcntl.lockf(self._fd, fcntl.LOCK_UN, 1, stripe)
+            self._stripes[stripe].release()
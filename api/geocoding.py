@@ -0,0 +1,193 @@
+import os
+import re
+import mmap
+import struct
+import unicodedata
+from typing import Iterator
+from .locks import ForkSafeLock
+
+__all__ = ["GAZETTEER_PATH", "normalize_name", "location_key", "Gazetteer", "write_gazetteer"]
+
+# Location of the bundled city index built by scripts/build_gazetteer.py
+GAZETTEER_PATH = os.path.join(os.path.dirname(__file__), "data", "cities.bin")
+
+# Binary layout of the city index: header, sorted record offsets, records
+MAGIC = b"GAZ1"
+HEADER = struct.Struct("<4sI")
+OFFSET = struct.Struct("<I")
+RECORD = struct.Struct("<ffH")
+SEPARATOR = b"\x1f"
+
+# Capitalized words that may be joined by lowercase particles as in "Frankfurt am Main"
+PLACE_PATTERN = re.compile(
+    r"[A-Z][\w.-]*(?: (?:(?:am|an|de|del|der|di|do|du|la|le|on|sur|upon) )?[A-Z][\w.-]*)*"
+)
+# Two letter state or country code following a place name as in "Portland, OR"
+CODE_PATTERN = re.compile(r",? ([A-Z]{2})\b")
+# Words after which a capitalized phrase is most likely a place name
+PREPOSITIONS = {"in", "for", "at", "near", "around", "from", "to", "of"}
+# Capitalized names of months and days, which are hardly ever meant as places like March in Cambridgeshire
+CALENDAR_NAMES = {
+    "january", "february", "march", "april", "may", "june", "july", "august", "september", "october", "november",
+    "december", "monday", "tuesday", "wednesday", "thursday", "friday", "saturday", "sunday"
+}
+
+
+def normalize_name(name: str | None) -> str:
+    """Casefold a place name and strip accents, punctuation and repeated whitespace."""
+    if not name:
+        return ""
+    name = unicodedata.normalize("NFKD", name)
+    name = "".join(c for c in name if not unicodedata.combining(c))
+    name = "".join(c if c.isalnum() else " " for c in name.casefold())
+    return " ".join(name.split())
+
+
+def location_key(city_name: str, country: str = None, state: str = None) -> str:
+    """Create the geocoding cache key for a location query."""
+    state = state if country == "US" else None
+    return "|".join(normalize_name(x) for x in (city_name, country, state))
+
+
+class Gazetteer:
+    """Memory-mapped index of the world's largest cities used to geocode without network requests."""
+    def __init__(self, path: str = GAZETTEER_PATH):
+        self.path = path
+        self._mm = None
+        self._count = 0
+        self._lock = ForkSafeLock()
+
+    def _open(self) -> bool:
+        """Map the index file into memory. Returns False if the file is missing."""
+        if self._mm is not None:
+            return True
+        with self._lock:
+            if self._mm is None:
+                if not os.path.isfile(self.path):
+                    return False
+                with open(self.path, "rb") as f:
+                    mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+                magic, count = HEADER.unpack_from(mm, 0)
+                if magic != MAGIC:
+                    raise ValueError(f"Invalid city index file: {self.path}")
+                self._count = count
+                self._mm = mm
+        return True
+
+    def _record(self, i: int) -> tuple[float, float, list[bytes]]:
+        """Read the coordinates and text fields of the i-th record."""
+        (offset,) = OFFSET.unpack_from(self._mm, HEADER.size + i * OFFSET.size)
+        lat, lon, length = RECORD.unpack_from(self._mm, offset)
+        start = offset + RECORD.size
+        return lat, lon, self._mm[start:start + length].split(SEPARATOR)
+
+    def _key(self, i: int) -> bytes:
+        """Read the search key of the i-th record."""
+        return self._record(i)[2][0]
+
+    def lookup(self, city_name: str, country: str = None, state: str = None) -> dict | None:
+        """Find the most populous city matching the query or return None."""
+        if not self._open():
+            return None
+
+        # binary search for the first record with the city name
+        key = normalize_name(city_name).encode()
+        lo, hi = 0, self._count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._key(mid) < key:
+                lo = mid + 1
+            else:
+                hi = mid
+
+        # records with the same name are sorted by population
+        country = (country or "").upper()
+        state = (state or "").upper() if country == "US" else ""
+        for i in range(lo, self._count):
+            lat, lon, (name_key, name, country_code, state_code, state_name) = self._record(i)
+            if name_key != key:
+                return None
+            if country and country_code.decode() != country:
+                continue
+            if state and state_code.decode() != state:
+                continue
+            loc = {"name": name.decode(), "lat": round(lat, 4), "lon": round(lon, 4), "country": country_code.decode()}
+            if state_name:
+                loc["state"] = state_name.decode()
+            return loc
+        return None
+
+    def extract(self, text: str) -> dict | None:
+        """Find a city mentioned in a text or return None."""
+        return next(self._extract(text), None)
+
+    def extract_all(self, text: str) -> list[dict]:
+        """Find all distinct cities mentioned in a text, in the order of `extract`."""
+        locations = {}
+        for loc in self._extract(text):
+            locations.setdefault((loc["lat"], loc["lon"]), loc)
+        return list(locations.values())
+
+    def _extract(self, text: str) -> Iterator[dict]:
+        """Yield the cities mentioned in a text.
+
+        Capitalized phrases after prepositions like "in" are tried first, followed by other capitalized phrases that
+        do not start a sentence. Of each phrase, the longest leading words that name a known city are used, except for
+        the names of months and days.
+        """
+        text = re.sub(r"'s\b", "", " ".join(text.split()))
+
+        # collect candidate phrases, phrases at the start of a sentence are mostly question words
+        candidates = []
+        for match in PLACE_PATTERN.finditer(text):
+            before = text[:match.start()].split()
+            if before and before[-1].casefold() in PREPOSITIONS:
+                candidates.append((0, match))
+            elif before and not before[-1].endswith((".", "!", "?")):
+                candidates.append((1, match))
+
+        for _, match in sorted(candidates, key=lambda x: x[0]):
+            words = match.group().split()
+            code = CODE_PATTERN.match(text, match.end())
+            for n in range(len(words), 0, -1):
+                name = " ".join(words[:n])
+                if name.casefold() in CALENDAR_NAMES:
+                    continue
+                # a trailing code is either a US state or a country
+                if code and n == len(words):
+                    loc = self.lookup(name, "US", code.group(1)) or self.lookup(name, code.group(1))
+                    if loc is not None:
+                        yield loc
+                        break
+                loc = self.lookup(name)
+                if loc is not None:
+                    yield loc
+                    break
+
+
+def write_gazetteer(path: str, cities: list[tuple]) -> int:
+    """Write a city index file from (name, country, state code, state name, lat, lon, population) tuples."""
+
+    # index every city under its normalized name, most populous first
+    records = sorted(
+        (normalize_name(name).encode(), -population, name, country, state_code, state_name, lat, lon)
+        for name, country, state_code, state_name, lat, lon, population in cities
+    )
+
+    # serialize records and their offsets
+    offsets, blobs = [], []
+    position = HEADER.size + OFFSET.size * len(records)
+    for key, _, name, country, state_code, state_name, lat, lon in records:
+        payload = SEPARATOR.join([key] + [x.encode() for x in (name, country, state_code, state_name)])
+        blob = RECORD.pack(lat, lon, len(payload)) + payload
+        offsets.append(position)
+        blobs.append(blob)
+        position += len(blob)
+
+    # write the index file
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with open(path, "wb") as f:
+        f.write(HEADER.pack(MAGIC, len(records)))
+        f.write(b"".join(OFFSET.pack(offset) for offset in offsets))
+        f.write(b"".join(blobs))
+    return len(records)
@@ -0,0 +1,87 @@
+import os
+import hashlib
+import requests
+from dotenv import load_dotenv
+from .locks import ForkSafeLock
+from .metrics import metrics
+
+load_dotenv()
+
+# Weather icons of OpenWeatherMap, which are the only icons that are served
+ICON_URL = "https://openweathermap.org/img/wn/{icon}@2x.png"
+ICON_IDS = frozenset(
+    f"{code}{time}" for code in ("01", "02", "03", "04", "09", "10", "11", "13", "50") for time in ("d", "n")
+)
+
+# Location of icons that are bundled with the app and served without fetching them
+ICON_BUNDLE_DIR = os.path.join(os.path.dirname(__file__), "data", "icons")
+
+
+class IconStore:
+    """Store of the weather icons that serves them from the bundle, the disk or memory instead of OpenWeatherMap.
+
+    Icons that are not bundled are fetched once and written to `directory`, which is shared by all worker processes.
+    Each icon has an ETag derived from its content, since the icon of an id never changes.
+    """
+    def __init__(self, directory: str = None, url: str = None, timeout: float = 5):
+        self.directory = directory or os.getenv("ICON_CACHE_DIR", os.path.join("cache", "icons"))
+        self.url = url or os.getenv("OPENWEATHERMAP_ICON_URL", ICON_URL)
+        self.timeout = timeout
+        self._icons = {}
+        self._lock = ForkSafeLock()
+
+    def get(self, icon: str) -> tuple[bytes, str] | None:
+        """Get the PNG image and ETag of an icon or None if it is unknown or cannot be fetched."""
+        if icon not in ICON_IDS:
+            return None
+        with self._lock:
+            if icon in self._icons:
+                metrics.inc("chatbot_cache_requests_total", cache="icons", result="hit")
+                return self._icons[icon]
+
+        # load the icon from the bundle or the disk, otherwise fetch it
+        image = self._read(icon)
+        metrics.inc("chatbot_cache_requests_total", cache="icons", result="miss" if image is None else "hit")
+        if image is None:
+            image = self._fetch(icon)
+            if image is None:
+                return None
+        entry = image, hashlib.sha256(image).hexdigest()[:16]
+        with self._lock:
+            self._icons[icon] = entry
+        return entry
+
+    def source_url(self, icon: str) -> str:
+        """Get the URL of an icon at OpenWeatherMap."""
+        return self.url.format(icon=icon)
+
+    def _read(self, icon: str) -> bytes | None:
+        """Read an icon from the bundle or the icon directory."""
+        for directory in (ICON_BUNDLE_DIR, self.directory):
+            try:
+                with open(os.path.join(directory, f"{icon}.png"), "rb") as f:
+                    return f.read()
+            except OSError:
+                continue
+        return None
+
+    def _fetch(self, icon: str) -> bytes | None:
+        """Fetch an icon from OpenWeatherMap and write it to the icon directory."""
+        try:
+            response = requests.get(self.source_url(icon), timeout=self.timeout)
+            response.raise_for_status()
+        except requests.RequestException:
+            return None
+        if not response.headers.get("Content-Type", "").startswith("image/"):
+            return None
+
+        # write to a temporary file first, so that other workers never read a partial icon
+        path = os.path.join(self.directory, f"{icon}.png")
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            with open(f"{path}.{os.getpid()}.tmp", "wb") as f:
+                f.write(response.content)
+            os.replace(f"{path}.{os.getpid()}.tmp", path)
+        except OSError:
+            pass
+        return response.content
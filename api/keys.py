@@ -0,0 +1,22 @@
+import os
+from dotenv import load_dotenv
+
+__all__ = ["check_open_ai_key", "check_open_weather_key"]
+
+load_dotenv()
+
+
+def check_open_ai_key() -> bool:
+    """Check if the OpenAI API key is set."""
+    open_ai = os.getenv("OPENAI_API_KEY", "")
+    if len(open_ai) < 16:
+        return False
+    return True
+
+
+def check_open_weather_key() -> bool:
+    """Check if OpenWeatherMap API key is valid."""
+    open_weather = os.getenv("OPENWEATHERMAP_API_KEY", "")
+    if len(open_weather) < 16:
+        return False
+    return True
@@ -0,0 +1,117 @@
+import os
+import sqlite3
+import weakref
+import threading
+
+__all__ = ["reset_after_fork", "ForkSafeLock", "ForkGuard", "fork_guard", "GuardedConnection"]
+
+# Objects whose state is reset in forked processes, they are removed as they are garbage collected
+_fork_resets = weakref.WeakSet()
+
+
+def _reset_after_fork() -> None:
+    for obj in list(_fork_resets):
+        obj._reset()
+
+
+os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+def reset_after_fork(obj) -> None:
+    """Call the `_reset` method of an object in forked processes without keeping the object alive.
+
+    Handlers of os.register_at_fork cannot be removed, so a single handler serves all objects.
+    """
+    _fork_resets.add(obj)
+
+
+class ForkSafeLock:
+    """Lock that is replaced by an unlocked lock in forked processes.
+
+    Processes are forked from the web server, e.g. the warm-up, while other threads may hold a lock. A copied lock
+    would stay locked in the child forever, since the thread that holds it does not exist there.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        reset_after_fork(self)
+
+    def _reset(self) -> None:
+        self._lock = threading.Lock()
+
+    def acquire(self, blocking: bool = True, timeout: float = -1) -> bool:
+        """Acquire the lock."""
+        return self._lock.acquire(blocking, timeout)
+
+    def release(self) -> None:
+        """Release the lock."""
+        self._lock.release()
+
+    def locked(self) -> bool:
+        """Check if the lock is held."""
+        return self._lock.locked()
+
+    def __enter__(self) -> bool:
+        return self._lock.acquire()
+
+    def __exit__(self, *args) -> None:
+        self._lock.release()
+
+
+class ForkGuard:
+    """Guard of code that must not run while the process forks, e.g. SQLite calls.
+
+    Background jobs are forked from threads of the web server. If another thread is inside SQLite at that moment, the
+    job inherits its internal mutexes in a locked state and hangs on its first connection. A fork waits until no other
+    thread is inside a guarded section and new sections wait until the fork is done.
+    """
+    def __init__(self):
+        self._reset()
+        os.register_at_fork(before=self._before_fork, after_in_parent=self._after_fork, after_in_child=self._reset)
+
+    def _reset(self) -> None:
+        self._condition = threading.Condition(threading.Lock())
+        self._local = threading.local()
+        self._active = 0
+        self._forks = 0
+
+    def __enter__(self) -> None:
+        depth = getattr(self._local, "depth", 0)
+        with self._condition:
+            # nested sections do not wait, since the fork waits for the outer section of this thread
+            if depth == 0:
+                self._condition.wait_for(lambda: not self._forks)
+            self._active += 1
+        self._local.depth = depth + 1
+
+    def __exit__(self, *args) -> None:
+        # sections that were entered before a fork end in the child with a reset guard
+        self._local.depth = max(getattr(self._local, "depth", 0) - 1, 0)
+        with self._condition:
+            self._active = max(self._active - 1, 0)
+            self._condition.notify_all()
+
+    def _before_fork(self) -> None:
+        depth = getattr(self._local, "depth", 0)
+        with self._condition:
+            self._forks += 1
+            self._condition.wait_for(lambda: self._active == depth)
+
+    def _after_fork(self) -> None:
+        with self._condition:
+            self._forks -= 1
+            self._condition.notify_all()
+
+
+# guard of all SQLite calls
+fork_guard = ForkGuard()
+
+
+class GuardedConnection(sqlite3.Connection):
+    """SQLite connection that is closed inside the fork guard when it is garbage collected, e.g. as its thread ends.
+
+    The local data of a thread may be collected by another thread, so the connection must allow this with
+    `check_same_thread=False`.
+    """
+    def __del__(self):
+        with fork_guard:
+            self.close()
@@ -0,0 +1,233 @@
+import os
+import json
+import time
+import atexit
+import sqlite3
+import threading
+import functools
+import contextvars
+from typing import Callable
+from contextlib import closing, contextmanager
+from dotenv import load_dotenv
+from .locks import ForkSafeLock, fork_guard
+
+__all__ = ["DEFAULT_BUCKETS", "MetricsRegistry", "metrics"]
+
+load_dotenv()
+
+# Upper bounds of the histogram buckets in seconds
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+# Observations of the request that is handled in the current context
+_trace = contextvars.ContextVar("metrics_trace", default=None)
+
+
+class MetricsRegistry:
+    """Registry of counters and histograms that are exposed in the Prometheus text format.
+
+    Values are kept in memory of each process. If `path` or the environment variable METRICS_DB_PATH is set, they are
+    added to a SQLite database every `flush_interval` seconds by a thread of each process, on `flush` and before they
+    are rendered, so that the measurements of background jobs in other processes are included without writing to the
+    database on each measurement. The path is resolved on first use.
+    """
+    def __init__(self, path: str = None, flush_interval: float = 5):
+        self.path = path
+        self.flush_interval = flush_interval
+        self.metrics = {}
+        self._values = {}
+        self._values_pid = os.getpid()
+        self._flusher_pid = None
+        self._lock = ForkSafeLock()
+        self._ready = False
+
+    def counter(self, name: str, documentation: str) -> None:
+        """Define a counter."""
+        self.metrics[name] = ("counter", documentation, None)
+
+    def histogram(self, name: str, documentation: str, buckets: tuple = DEFAULT_BUCKETS) -> None:
+        """Define a histogram."""
+        self.metrics[name] = ("histogram", documentation, buckets)
+
+    def _setup(self) -> bool:
+        """Create the database on first use and return whether values are added to it."""
+        if not self._ready:
+            self.path = self.path or os.getenv("METRICS_DB_PATH", "")
+            if self.path:
+                with fork_guard, closing(sqlite3.connect(self.path, timeout=5)) as conn, conn:
+                    conn.execute("PRAGMA journal_mode=WAL")
+                    conn.execute(
+                        "CREATE TABLE IF NOT EXISTS metrics "
+                        "(name TEXT, labels TEXT, sample TEXT, value REAL, PRIMARY KEY (name, labels, sample))"
+                    )
+            self._ready = True
+        return bool(self.path)
+
+    def _pending(self) -> dict:
+        """Get the values of the current process, values that a forked process copied from its parent are dropped."""
+        if self._values_pid != os.getpid():
+            self._values = {}
+            self._values_pid = os.getpid()
+        return self._values
+
+    def _add(self, samples: list[tuple[str, str, str, float]]) -> None:
+        """Add values to the (name, labels, sample) series."""
+        with self._lock:
+            values = self._pending()
+            for name, labels, sample, value in samples:
+                key = (name, labels, sample)
+                values[key] = values.get(key, 0) + value
+        if self._flusher_pid != os.getpid():
+            self._start_flusher()
+
+    def _start_flusher(self) -> None:
+        """Start the thread that flushes the values of the current process periodically and at exit."""
+        if not self._setup():
+            return
+        with self._lock:
+            if self._flusher_pid == os.getpid():
+                return
+            self._flusher_pid = os.getpid()
+        threading.Thread(target=self._flush_periodically, name="metrics-flush", daemon=True).start()
+        atexit.register(self.flush)
+
+    def _flush_periodically(self) -> None:
+        """Flush the values of the current process every `flush_interval` seconds."""
+        while True:
+            time.sleep(self.flush_interval)
+            self.flush()
+
+    def flush(self) -> None:
+        """Add the values of the current process to the database in a single transaction."""
+        if not self._setup():
+            return
+        with self._lock:
+            samples = [(*key, value) for key, value in self._pending().items()]
+            self._values = {}
+        if not samples:
+            return
+        try:
+            with fork_guard, closing(sqlite3.connect(self.path, timeout=5)) as conn, conn:
+                conn.executemany(
+                    "INSERT INTO metrics (name, labels, sample, value) VALUES (?, ?, ?, ?) "
+                    "ON CONFLICT (name, labels, sample) DO UPDATE SET value = value + excluded.value",
+                    samples
+                )
+        except sqlite3.Error:
+            # keep the values for the next flush
+            self._add(samples)
+
+    def _samples(self) -> list[tuple[str, str, str, float]]:
+        """Get the values of all series."""
+        if not self._setup():
+            with self._lock:
+                return [(*key, value) for key, value in self._pending().items()]
+        self.flush()
+        with fork_guard, closing(sqlite3.connect(self.path, timeout=5)) as conn:
+            return conn.execute("SELECT name, labels, sample, value FROM metrics").fetchall()
+
+    @staticmethod
+    def _labels(labels: dict) -> str:
+        """Render labels in the Prometheus format."""
+        escaped = {key: str(value).replace("\\", "\\\\").replace('"', '\\"') for key, value in labels.items()}
+        return ",".join(f'{key}="{value}"' for key, value in sorted(escaped.items()))
+
+    def inc(self, name: str, value: float = 1, **labels) -> None:
+        """Increase a counter."""
+        self._add([(name, self._labels(labels), "", value)])
+        self._record(name, labels, value)
+
+    def observe(self, name: str, value: float, **labels) -> None:
+        """Add an observation to a histogram."""
+        buckets = self.metrics[name][2]
+        bucket = next((str(bound) for bound in buckets if value <= bound), "+Inf")
+        rendered = self._labels(labels)
+        self._add([(name, rendered, bucket, 1), (name, rendered, "sum", value), (name, rendered, "count", 1)])
+        self._record(name, labels, value)
+
+    @contextmanager
+    def timer(self, name: str, **labels):
+        """Observe the duration of a block in a histogram."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start, **labels)
+
+    @staticmethod
+    def _record(name: str, labels: dict, value: float) -> None:
+        """Add a measurement to the trace of the current request."""
+        trace = _trace.get()
+        if trace is not None:
+            trace["metrics"].append((name, labels, value))
+
+    @contextmanager
+    def trace(self, **fields):
+        """Collect the measurements of a request in the current context and its copies.
+
+        Yields a dict with the given fields. If the environment variable METRICS_LOG is true, the measurements are
+        printed as a single JSON log line at the end of the request.
+        """
+        trace = {**fields, "metrics": []}
+        token = _trace.set(trace)
+        start = time.perf_counter()
+        try:
+            yield trace
+        finally:
+            _trace.reset(token)
+            if os.getenv("METRICS_LOG", "false").lower() == "true":
+                print(json.dumps(self.format_trace(trace, time.perf_counter() - start)), flush=True)
+
+    def traced(self, **fields) -> Callable:
+        """Decorate a function to collect the measurements of each call, see `trace`."""
+        def decorator(func: Callable) -> Callable:
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                with self.trace(**fields):
+                    return func(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    @staticmethod
+    def format_trace(trace: dict, duration: float) -> dict:
+        """Group the measurements of a request by metric."""
+        record = {key: value for key, value in trace.items() if key != "metrics"}
+        record["duration"] = round(duration, 4)
+        for name, labels, value in trace["metrics"]:
+            key = name.removeprefix("chatbot_")
+            record.setdefault(key, []).append({**labels, "value": round(value, 4)})
+        return record
+
+    def render(self) -> str:
+        """Render all metrics in the Prometheus text format."""
+        series = {}
+        for name, labels, sample, value in self._samples():
+            series.setdefault(name, {}).setdefault(labels, {})[sample] = value
+
+        lines = []
+        for name, (kind, documentation, buckets) in self.metrics.items():
+            lines.append(f"# HELP {name} {documentation}")
+            lines.append(f"# TYPE {name} {kind}")
+            for labels, samples in sorted(series.get(name, {}).items()):
+                if kind == "counter":
+                    lines.append(f"{name}{{{labels}}} {samples.get('', 0)}")
+                    continue
+                # buckets are stored individually and exposed cumulatively
+                total = 0
+                for bound in [str(bound) for bound in buckets] + ["+Inf"]:
+                    total += samples.get(bound, 0)
+                    le = f'{labels},le="{bound}"' if labels else f'le="{bound}"'
+                    lines.append(f"{name}_bucket{{{le}}} {total}")
+                lines.append(f"{name}_sum{{{labels}}} {samples.get('sum', 0)}")
+                lines.append(f"{name}_count{{{labels}}} {samples.get('count', 0)}")
+        return "\n".join(lines) + "\n"
+
+
+# Metrics of the chatbot
+metrics = MetricsRegistry()
+metrics.histogram("chatbot_stage_duration_seconds", "Duration of the stages of a chatbot answer.")
+metrics.histogram("chatbot_http_request_duration_seconds", "Duration of requests to OpenWeatherMap API.")
+metrics.counter("chatbot_http_requests_total", "Requests to OpenWeatherMap API by endpoint and status.")
+metrics.counter("chatbot_http_requests_skipped_total", "Requests to OpenWeatherMap API that were not sent by reason.")
+metrics.counter("chatbot_llm_tokens_total", "Tokens processed by the LLM by type.")
+metrics.counter("chatbot_cache_requests_total", "Cache lookups by cache and result.")
+metrics.histogram("chatbot_callback_duration_seconds", "Duration of Dash callback requests.")
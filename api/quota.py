@@ -0,0 +1,105 @@
+import os
+import time
+import sqlite3
+from typing import Iterator
+from contextlib import closing, contextmanager
+from dotenv import load_dotenv
+from .locks import ForkSafeLock, fork_guard
+
+__all__ = ["QuotaBudget", "SQLiteQuotaBudget", "create_quota_budget"]
+
+load_dotenv()
+
+# Lengths of the periods of the request limits in seconds
+QUOTA_PERIODS = {"minute": 60, "day": 86400}
+
+# Limits that are hard caps per calendar day in UTC, like the daily quota of OpenWeatherMap, instead of rates
+FIXED_WINDOWS = {"day"}
+
+
+class QuotaBudget:
+    """Budget of requests per minute and per day.
+
+    Each limit is a bucket that holds up to `limit` tokens. The minute bucket refills evenly over its period, while the
+    day bucket is refilled at once at midnight UTC, so that no more than `per_day` requests are sent on any day. A
+    request takes a token of each bucket and is refused while any bucket is empty. Limits of 0 are disabled.
+    """
+    def __init__(self, per_minute: int = 60, per_day: int = 1000):
+        self.limits = {name: limit for name, limit in (("minute", per_minute), ("day", per_day)) if limit > 0}
+        self._buckets = {}
+        self._lock = ForkSafeLock()
+
+    def acquire(self) -> bool:
+        """Take a token for a request or return False if the budget is exhausted."""
+        if not self.limits:
+            return True
+        with self._lock:
+            allowed, self._buckets = self._take(self._buckets, time.time())
+            return allowed
+
+    def _take(self, buckets: dict[str, tuple[float, float]], now: float) -> tuple[bool, dict[str, tuple[float, float]]]:
+        """Refill the (tokens, updated) buckets and take a token of each if none is empty.
+
+        Buckets of fixed windows keep the start of their window as update time, so a new window is recognized.
+        """
+        refilled = {}
+        for name, limit in self.limits.items():
+            period = QUOTA_PERIODS[name]
+            if name in FIXED_WINDOWS:
+                window = now - now % period
+                tokens, start = buckets.get(name, (limit, window))
+                refilled[name] = (limit, window) if start < window else (tokens, start)
+            else:
+                tokens, updated = buckets.get(name, (limit, now))
+                refilled[name] = (min(limit, tokens + (now - updated) * limit / period), now)
+        if any(tokens < 1 for tokens, _ in refilled.values()):
+            return False, refilled
+        return True, {name: (tokens - 1, updated) for name, (tokens, updated) in refilled.items()}
+
+
+class SQLiteQuotaBudget(QuotaBudget):
+    """Budget of requests that is shared by all worker processes through a SQLite database.
+
+    The `updated` column of the day bucket holds the start of its day, so all processes reset it at the same time.
+    """
+    def __init__(self, path: str, per_minute: int = 60, per_day: int = 1000):
+        super().__init__(per_minute, per_day)
+        self.path = path
+        with self._connect() as conn:
+            conn.execute("CREATE TABLE IF NOT EXISTS quota (name TEXT PRIMARY KEY, tokens REAL, updated REAL)")
+
+    @contextmanager
+    def _connect(self) -> Iterator[sqlite3.Connection]:
+        """Open a connection to the database that commits and closes on exit."""
+        with fork_guard, closing(sqlite3.connect(self.path, timeout=5)) as conn, conn:
+            yield conn
+
+    def acquire(self) -> bool:
+        """Take a token for a request or return False if the budget is exhausted."""
+        if not self.limits:
+            return True
+        with self._connect() as conn:
+            # lock the database for writing before reading, so that no other process takes the same tokens
+            conn.execute("BEGIN IMMEDIATE")
+            buckets = {name: (tokens, updated) for name, tokens, updated in conn.execute(
+                "SELECT name, tokens, updated FROM quota"
+            )}
+            allowed, buckets = self._take(buckets, time.time())
+            conn.executemany(
+                "INSERT OR REPLACE INTO quota (name, tokens, updated) VALUES (?, ?, ?)",
+                [(name, tokens, updated) for name, (tokens, updated) in buckets.items()]
+            )
+            return allowed
+
+
+def create_quota_budget() -> QuotaBudget:
+    """Create the budget of OpenWeatherMap requests, shared via SQLite if CACHE_DB_PATH is set.
+
+    The limits are set with OPENWEATHERMAP_CALLS_PER_MINUTE and OPENWEATHERMAP_CALLS_PER_DAY.
+    """
+    per_minute = int(os.getenv("OPENWEATHERMAP_CALLS_PER_MINUTE", 60))
+    per_day = int(os.getenv("OPENWEATHERMAP_CALLS_PER_DAY", 1000))
+    path = os.getenv("CACHE_DB_PATH", "")
+    if path:
+        return SQLiteQuotaBudget(path, per_minute=per_minute, per_day=per_day)
+    return QuotaBudget(per_minute=per_minute, per_day=per_day)
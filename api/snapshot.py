@@ -0,0 +1,121 @@
+from datetime import datetime, timezone
+
+__all__ = ["WeatherSnapshot"]
+
+
+def _volume(value: float | dict) -> float:
+    """Get the precipitation volume of the last hour, which is given as dict in the current and hourly weather."""
+    return value.get("1h", 0) if isinstance(value, dict) else value
+
+
+# Values of the One Call API that are kept per part and how they are extracted from the response
+CURRENT_FIELDS = {
+    "dt": lambda data: data["dt"],
+    "temp": lambda data: data["temp"],
+    "humidity": lambda data: data["humidity"],
+    "uvi": lambda data: data["uvi"],
+    "clouds": lambda data: data["clouds"],
+    "wind_speed": lambda data: data["wind_speed"],
+    "rain": lambda data: _volume(data.get("rain", 0)),
+    "snow": lambda data: _volume(data.get("snow", 0)),
+    "description": lambda data: data["weather"][0]["description"],
+    "icon": lambda data: data["weather"][0]["icon"],
+}
+DAILY_FIELDS = {
+    "dt": lambda data: data["dt"],
+    "summary": lambda data: data.get("summary", ""),
+    "temp_morn": lambda data: data["temp"]["morn"],
+    "temp_day": lambda data: data["temp"]["day"],
+    "temp_eve": lambda data: data["temp"]["eve"],
+    "temp_night": lambda data: data["temp"]["night"],
+    "humidity": lambda data: data["humidity"],
+    "uvi": lambda data: data["uvi"],
+    "clouds": lambda data: data["clouds"],
+    "wind_speed": lambda data: data["wind_speed"],
+    "pop": lambda data: data.get("pop", 0),
+    "rain": lambda data: data.get("rain", 0),
+    "snow": lambda data: data.get("snow", 0),
+    "description": lambda data: data["weather"][0]["description"],
+    "icon": lambda data: data["weather"][0]["icon"],
+}
+HOURLY_FIELDS = {
+    "dt": lambda data: data["dt"],
+    "temp": lambda data: data["temp"],
+    "pop": lambda data: data.get("pop", 0),
+    "rain": lambda data: _volume(data.get("rain", 0)),
+    "snow": lambda data: _volume(data.get("snow", 0)),
+    "wind_speed": lambda data: data.get("wind_speed", 0),
+    "wind_gust": lambda data: data.get("wind_gust", data.get("wind_speed", 0)),
+}
+MINUTELY_FIELDS = {
+    "dt": lambda data: data["dt"],
+    "precipitation": lambda data: data.get("precipitation", 0),
+}
+
+
+class WeatherSnapshot:
+    """Weather data of a location that only holds the values of the One Call API that are used.
+
+    A snapshot is parsed once per response. The current weather is a dict of values and the daily, hourly and minutely
+    forecasts are stored column-wise as one list per value, e.g. `snapshot.daily["temp_day"]`. Parts that were not
+    requested are None. `to_dict` and `from_dict` convert it to and from plain JSON data without copying the lists,
+    so that it can be cached in other processes and passed to the Dash stores.
+    """
+    __slots__ = ("timezone_offset", "current", "daily", "hourly", "minutely")
+
+    def __init__(self, timezone_offset: int, current: dict | None = None, daily: dict[str, list] | None = None,
+                 hourly: dict[str, list] | None = None, minutely: dict[str, list] | None = None):
+        self.timezone_offset = timezone_offset
+        self.current = current
+        self.daily = daily
+        self.hourly = hourly
+        self.minutely = minutely
+
+    @classmethod
+    def from_onecall(cls, response: dict) -> "WeatherSnapshot":
+        """Parse a response of the One Call API."""
+
+        def columns(rows: list[dict] | None, fields: dict) -> dict[str, list] | None:
+            if rows is None:
+                return None
+            return {field: [extract(row) for row in rows] for field, extract in fields.items()}
+
+        current = response.get("current")
+        return cls(
+            timezone_offset=response["timezone_offset"],
+            current={field: extract(current) for field, extract in CURRENT_FIELDS.items()} if current else None,
+            daily=columns(response.get("daily"), DAILY_FIELDS),
+            hourly=columns(response.get("hourly"), HOURLY_FIELDS),
+            minutely=columns(response.get("minutely"), MINUTELY_FIELDS)
+        )
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "WeatherSnapshot":
+        """Create a snapshot from the data of `to_dict`."""
+        return cls(**data)
+
+    def to_dict(self) -> dict:
+        """Convert the snapshot to plain JSON data that leaves out the parts that were not requested."""
+        return {name: getattr(self, name) for name in self.__slots__ if getattr(self, name) is not None}
+
+    def merge(self, other: "WeatherSnapshot") -> "WeatherSnapshot":
+        """Create a snapshot with the parts of another snapshot and the parts of this one that the other lacks."""
+        return WeatherSnapshot(**{**self.to_dict(), **other.to_dict()})
+
+    def select(self, parts: tuple[str, ...]) -> "WeatherSnapshot":
+        """Create a snapshot that only has the given parts."""
+        data = {name: value for name, value in self.to_dict().items() if name in parts}
+        return WeatherSnapshot(self.timezone_offset, **data)
+
+    @property
+    def days(self) -> int:
+        """Get the number of days of the daily forecast."""
+        return len(self.daily["dt"]) if self.daily else 0
+
+    def day(self, index: int) -> dict:
+        """Get the values of a day of the daily forecast, where 0 is today."""
+        return {field: values[index] for field, values in self.daily.items()}
+
+    def local_time(self, timestamp: int, fmt: str = "%A %Y-%m-%d %H:%M") -> str:
+        """Format a timestamp in the local time of the location."""
+        return datetime.fromtimestamp(timestamp + self.timezone_offset, timezone.utc).strftime(fmt)
@@ -0,0 +1,86 @@
+import numpy as np
+from datetime import datetime, timezone
+from .snapshot import WeatherSnapshot
+
+
+class WeatherTimeline:
+    """Hourly and minutely forecasts as NumPy arrays with vectorized queries over the next hours.
+
+    The hourly arrays hold the temperature in °C, the probability of precipitation in %, the rain and snow volume in mm
+    and the wind speed and gusts in m/s of each hour. The minutely array holds the precipitation in mm/h of each
+    minute of the next hour. Hours and minutes before the current time are ignored by the queries.
+    """
+    def __init__(self, weather: WeatherSnapshot):
+        hourly = weather.hourly or {}
+        minutely = weather.minutely or {}
+        self.weather = weather
+        # the current conditions of cached weather data may be older than the forecasts, so the clock is used instead
+        self.now = int(datetime.now(timezone.utc).timestamp())
+
+        # hourly forecast, the columns of the snapshot are converted without walking the hours
+        self.time = np.asarray(hourly.get("dt", []), dtype=np.int64)
+        self.temp = np.asarray(hourly.get("temp", []), dtype=np.float64)
+        self.pop = np.asarray(hourly.get("pop", []), dtype=np.float64) * 100
+        self.rain = np.asarray(hourly.get("rain", []), dtype=np.float64)
+        self.snow = np.asarray(hourly.get("snow", []), dtype=np.float64)
+        self.wind_speed = np.asarray(hourly.get("wind_speed", []), dtype=np.float64)
+        self.wind_gust = np.asarray(hourly.get("wind_gust", []), dtype=np.float64)
+
+        # minutely forecast of the precipitation
+        self.minute_time = np.asarray(minutely.get("dt", []), dtype=np.int64)
+        self.precipitation = np.asarray(minutely.get("precipitation", []), dtype=np.float64)
+
+    def window(self, hours: int) -> slice:
+        """Get the slice of the arrays from the current hour to `hours` hours later."""
+        start = int(np.searchsorted(self.time, self.now - 3600, side="right"))
+        return slice(start, start + hours)
+
+    def hours(self, hours: int) -> np.ndarray:
+        """Get the times of the hours in the window."""
+        return self.time[self.window(hours)]
+
+    def first_hour(self, field: str, threshold: float, hours: int) -> int | None:
+        """Get the time of the first hour in the window whose value exceeds the threshold or None."""
+        window = self.window(hours)
+        index = np.flatnonzero(getattr(self, field)[window] > threshold)
+        return int(self.time[window][index[0]]) if index.size else None
+
+    def maximum(self, field: str, hours: int) -> tuple[float, int] | None:
+        """Get the maximum value in the window and the time of its first hour or None without data."""
+        window = self.window(hours)
+        values = getattr(self, field)[window]
+        if not values.size:
+            return None
+        index = int(np.argmax(values))
+        return float(values[index]), int(self.time[window][index])
+
+    def minimum(self, field: str, hours: int) -> tuple[float, int] | None:
+        """Get the minimum value in the window and the time of its first hour or None without data."""
+        window = self.window(hours)
+        values = getattr(self, field)[window]
+        if not values.size:
+            return None
+        index = int(np.argmin(values))
+        return float(values[index]), int(self.time[window][index])
+
+    def total(self, field: str, hours: int) -> float:
+        """Get the sum of the values in the window, e.g. the rain volume in mm."""
+        return float(getattr(self, field)[self.window(hours)].sum())
+
+    def precipitation_minutes(self, threshold: float = 0.1) -> tuple[int | None, int | None, float]:
+        """Get the minutes until the precipitation of the next hour starts and stops and its maximum in mm/h.
+
+        The start is 0 if it is precipitating now and None if it stays dry, the end is None if it does not stop.
+        """
+        upcoming = self.minute_time > self.now - 60
+        wet = self.precipitation[upcoming] > threshold
+        if not wet.any():
+            return None, None, 0.0
+        start = int(np.argmax(wet))
+        dry = np.flatnonzero(~wet[start:])
+        end = start + int(dry[0]) if dry.size else None
+        return start, end, float(self.precipitation[upcoming].max())
+
+    def local_time(self, timestamp: int) -> str:
+        """Format a timestamp in the local time of the location."""
+        return self.weather.local_time(timestamp, "%a %H:%M")
@@ -1,12 +1,17 @@
 from langchain_core.tools import BaseTool
-from langchain_core.pydantic_v1 import BaseModel, Field
-from langchain_core.callbacks import CallbackManagerForToolRun
-from .weather_api import OpenWeatherMapAPIWrapper
-from typing import Optional, Type
+from langchain_core.pydantic_v1 import BaseModel, Field, conint, conlist
+from langchain_core.callbacks import CallbackManagerForToolRun, AsyncCallbackManagerForToolRun
+from langchain_core.callbacks.manager import dispatch_custom_event, adispatch_custom_event
+from .weather_api import OpenWeatherMapAPIWrapper, AsyncOpenWeatherMapAPIWrapper, MAX_LOCATIONS
+from concurrent.futures import Future
+from typing import List, Literal, Optional, Type
 
+# Name of the custom callback event that carries the location and weather data of a tool call
+WEATHER_DATA_EVENT = "weather_data"
 
-class OpenWeatherMapInput(BaseModel):
-    """Input schema for OpenWeatherMap tool."""
+
+class LocationInput(BaseModel):
+    """Input schema of a location."""
 
     city: str = Field(
         description="The city for which to fetch weather information as string e.g. 'London' or 'Berlin'."
@@ -25,22 +30,186 @@ class OpenWeatherMapInput(BaseModel):
     )
 
 
+class ForecastInput(BaseModel):
+    """Input schema of the forecast days and weather values to include."""
+
+    days: Optional[List[conint(ge=0, le=7)]] = Field(
+        default=None,
+        description="The forecast days to include if the question is about specific days, where 0 is today and 1 is "
+                    "tomorrow e.g. [1]. Leave empty for the full 7-day forecast."
+    )
+    fields: Optional[List[Literal[
+        "weather", "temp", "humidity", "uvi", "clouds", "wind_speed", "pop", "rain", "snow", "summary"
+    ]]] = Field(
+        default=None,
+        description="The weather values to include if the question is about specific values e.g. ['wind_speed']. "
+                    "Leave empty for all values."
+    )
+
+
+class OpenWeatherMapInput(ForecastInput, LocationInput):
+    """Input schema for OpenWeatherMap tool."""
+
+
+class OpenWeatherMapComparisonInput(ForecastInput):
+    """Input schema for OpenWeatherMap comparison tool."""
+
+    locations: conlist(LocationInput, min_items=2, max_items=MAX_LOCATIONS) = Field(
+        description="The locations to compare e.g. [{'city': 'Berlin'}, {'city': 'Paris', 'country': 'FR'}]."
+    )
+
+
+class OpenWeatherMapHourlyInput(LocationInput):
+    """Input schema for OpenWeatherMap hourly tool."""
+
+    hours: conint(ge=1, le=48) = Field(
+        default=12,
+        description="The number of hours from now the question is about e.g. 3 for 'this afternoon' or 24 for 'the "
+                    "next day'."
+    )
+    pop_threshold: conint(ge=0, le=100) = Field(
+        default=50,
+        description="The probability of precipitation in % above which the first hour is reported e.g. 30."
+    )
+
+
 class OpenWeatherMapQuery(BaseTool):
-    """Tool that queries the OpenWeatherMap API."""
+    """Tool that queries the OpenWeatherMap API.
+
+    The tool responds with the weather information and, as artifact, the location and weather data it is based on.
+    Since agent executors only pass on the content, the data is also sent as WEATHER_DATA_EVENT to the callbacks.
+    """
 
-    api_wrapper: OpenWeatherMapAPIWrapper = Field(default_factory=OpenWeatherMapAPIWrapper)
+    api_wrapper: OpenWeatherMapAPIWrapper = Field(default_factory=AsyncOpenWeatherMapAPIWrapper)
 
     name: str = "OpenWeatherMap"
     description: str = """A wrapper around OpenWeatherMap API.
     Useful for fetching current and future weather information for a specified location.
     Input must be at least a city string (e.g. 'London').
     To avoid ambiguity, in addition to the city, a two letter country code can be passed (e.g. 'London', 'GB').
-    Additionally, only for the US a two letter state code can be passed (e.g. 'Ontario', 'US', 'NY')."""
+    Additionally, only for the US a two letter state code can be passed (e.g. 'Ontario', 'US', 'NY').
+    To keep the answer short, the forecast days and weather values the question is about can be selected.
+    For questions about several locations, use OpenWeatherMapComparison instead.
+    For questions about the next hours, use OpenWeatherMapHourly instead."""
 
     args_schema: Type[BaseModel] = OpenWeatherMapInput
     return_direct: bool = False
+    response_format: str = "content_and_artifact"
+
+    def prefetch(self, text: str) -> list[Future]:
+        """Start fetching the weather data of cities mentioned in a text, e.g. while the LLM decides on a tool call."""
+        locations = self.api_wrapper.gazetteer.extract_all(text)[:MAX_LOCATIONS]
+        return [self.api_wrapper.prefetch_weather(location["lat"], location["lon"]) for location in locations]
 
     def _run(self, city: str, country: Optional[str] = None, state: Optional[str] = None,
-             run_manager: Optional[CallbackManagerForToolRun] = None) -> str:
+             days: Optional[List[int]] = None, fields: Optional[List[str]] = None,
+             run_manager: Optional[CallbackManagerForToolRun] = None) -> tuple[str, dict | None]:
         """Use the OpenWeatherMap tool."""
-        return self.api_wrapper.get_weather(city, country, state)
+        content, artifact = self.api_wrapper.get_weather_report(city, country, state, days, fields)
+        if artifact is not None and run_manager is not None:
+            dispatch_custom_event(WEATHER_DATA_EVENT, artifact, config={"callbacks": run_manager.get_child()})
+        return content, artifact
+
+    async def _arun(self, city: str, country: Optional[str] = None, state: Optional[str] = None,
+                    days: Optional[List[int]] = None, fields: Optional[List[str]] = None,
+                    run_manager: Optional[AsyncCallbackManagerForToolRun] = None) -> tuple[str, dict | None]:
+        """Use the OpenWeatherMap tool asynchronously."""
+        if not isinstance(self.api_wrapper, AsyncOpenWeatherMapAPIWrapper):
+            # fall back to running the blocking wrapper in a thread
+            return await super()._arun(city, country, state, days, fields, run_manager=run_manager)
+        content, artifact = await self.api_wrapper.aget_weather_report(city, country, state, days, fields)
+        if artifact is not None and run_manager is not None:
+            await adispatch_custom_event(WEATHER_DATA_EVENT, artifact, config={"callbacks": run_manager.get_child()})
+        return content, artifact
+
+
+class OpenWeatherMapComparison(BaseTool):
+    """Tool that compares the weather of several locations with a single call of the OpenWeatherMap API wrapper.
+
+    The locations are fetched concurrently, which saves the LLM round trips of one OpenWeatherMapQuery call per
+    location. The location and weather data of each location is sent as WEATHER_DATA_EVENT to the callbacks.
+    """
+
+    api_wrapper: OpenWeatherMapAPIWrapper = Field(default_factory=AsyncOpenWeatherMapAPIWrapper)
+
+    name: str = "OpenWeatherMapComparison"
+    description: str = f"""A wrapper around OpenWeatherMap API for several locations.
+    Useful for comparing current and future weather information of 2 to {MAX_LOCATIONS} locations in one call.
+    Input must be a list of locations, each with at least a city string (e.g. 'Berlin').
+    To avoid ambiguity, a two letter country code and, only for the US, a state code can be passed per location.
+    To keep the answer short, the forecast days and weather values the question is about can be selected."""
+
+    args_schema: Type[BaseModel] = OpenWeatherMapComparisonInput
+    return_direct: bool = False
+    response_format: str = "content_and_artifact"
+
+    @staticmethod
+    def _locations(locations: list) -> list[dict]:
+        """Convert the parsed location inputs to dicts."""
+        return [location.dict() if isinstance(location, BaseModel) else location for location in locations]
+
+    def _run(self, locations: List[LocationInput], days: Optional[List[int]] = None,
+             fields: Optional[List[str]] = None,
+             run_manager: Optional[CallbackManagerForToolRun] = None) -> tuple[str, list[dict]]:
+        """Use the OpenWeatherMap comparison tool."""
+        content, artifacts = self.api_wrapper.get_comparison_report(self._locations(locations), days, fields)
+        if run_manager is not None:
+            for artifact in artifacts:
+                dispatch_custom_event(WEATHER_DATA_EVENT, artifact, config={"callbacks": run_manager.get_child()})
+        return content, artifacts
+
+    async def _arun(self, locations: List[LocationInput], days: Optional[List[int]] = None,
+                    fields: Optional[List[str]] = None,
+                    run_manager: Optional[AsyncCallbackManagerForToolRun] = None) -> tuple[str, list[dict]]:
+        """Use the OpenWeatherMap comparison tool asynchronously."""
+        if not isinstance(self.api_wrapper, AsyncOpenWeatherMapAPIWrapper):
+            # fall back to running the blocking wrapper in a thread
+            return await super()._arun(locations, days, fields, run_manager=run_manager)
+        content, artifacts = await self.api_wrapper.aget_comparison_report(self._locations(locations), days, fields)
+        if run_manager is not None:
+            for artifact in artifacts:
+                await adispatch_custom_event(WEATHER_DATA_EVENT, artifact,
+                                             config={"callbacks": run_manager.get_child()})
+        return content, artifacts
+
+
+class OpenWeatherMapHourly(BaseTool):
+    """Tool that answers questions about the next hours from the hourly and minutely forecasts of OpenWeatherMap API.
+
+    The forecasts are aggregated locally, so the LLM only receives the computed values instead of up to 48 hours and
+    60 minutes of raw data. The location and weather data is sent as WEATHER_DATA_EVENT to the callbacks.
+    """
+
+    api_wrapper: OpenWeatherMapAPIWrapper = Field(default_factory=AsyncOpenWeatherMapAPIWrapper)
+
+    name: str = "OpenWeatherMapHourly"
+    description: str = """A wrapper around OpenWeatherMap API for the next hours.
+    Useful for questions about the next 1 to 48 hours, e.g. when it starts raining, how much rain falls this evening
+    or how strong the wind gets this afternoon. It also reports the precipitation of the next hour by the minute.
+    Input must be at least a city string (e.g. 'London'), a two letter country code and, only for the US, a state code
+    can be passed. The number of hours and the probability of precipitation to look out for can be selected."""
+
+    args_schema: Type[BaseModel] = OpenWeatherMapHourlyInput
+    return_direct: bool = False
+    response_format: str = "content_and_artifact"
+
+    def _run(self, city: str, country: Optional[str] = None, state: Optional[str] = None, hours: int = 12,
+             pop_threshold: int = 50,
+             run_manager: Optional[CallbackManagerForToolRun] = None) -> tuple[str, dict | None]:
+        """Use the OpenWeatherMap hourly tool."""
+        content, artifact = self.api_wrapper.get_hourly_report(city, country, state, hours, pop_threshold)
+        if artifact is not None and run_manager is not None:
+            dispatch_custom_event(WEATHER_DATA_EVENT, artifact, config={"callbacks": run_manager.get_child()})
+        return content, artifact
+
+    async def _arun(self, city: str, country: Optional[str] = None, state: Optional[str] = None, hours: int = 12,
+                    pop_threshold: int = 50,
+                    run_manager: Optional[AsyncCallbackManagerForToolRun] = None) -> tuple[str, dict | None]:
+        """Use the OpenWeatherMap hourly tool asynchronously."""
+        if not isinstance(self.api_wrapper, AsyncOpenWeatherMapAPIWrapper):
+            # fall back to running the blocking wrapper in a thread
+            return await super()._arun(city, country, state, hours, pop_threshold, run_manager=run_manager)
+        content, artifact = await self.api_wrapper.aget_hourly_report(city, country, state, hours, pop_threshold)
+        if artifact is not None and run_manager is not None:
+            await adispatch_custom_event(WEATHER_DATA_EVENT, artifact, config={"callbacks": run_manager.get_child()})
+        return content, artifact
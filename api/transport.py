@@ -0,0 +1,276 @@
+import os
+import time
+import httpx
+import random
+import asyncio
+import requests
+import threading
+from urllib.parse import urlparse
+from email.utils import parsedate_to_datetime
+from requests.adapters import HTTPAdapter
+from .cassettes import Cassette, CassetteAdapter, CassetteTransport
+from .locks import ForkSafeLock
+from .metrics import metrics
+from .quota import QuotaBudget
+
+
+class CircuitOpenError(requests.RequestException):
+    """Raised when a request is rejected because the circuit breaker is open."""
+
+
+class QuotaExhaustedError(requests.RequestException):
+    """Raised when a request is not sent because the request budget is used up."""
+
+
+class CircuitBreaker:
+    """Circuit breaker that fails fast after repeated upstream failures.
+
+    After `failure_threshold` consecutive failures the circuit opens and all requests are rejected for
+    `reset_timeout` seconds. Afterwards a single trial request is let through to probe the upstream.
+    """
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self._trial = False
+        self._lock = ForkSafeLock()
+
+    @property
+    def is_open(self) -> bool:
+        """Check if the circuit is currently open."""
+        return self.opened_at is not None and time.monotonic() - self.opened_at < self.reset_timeout
+
+    def allow(self) -> bool:
+        """Check if a request may be sent."""
+        with self._lock:
+            if self.opened_at is None:
+                return True
+            if self.is_open or self._trial:
+                return False
+            # let a single trial request through after the reset timeout
+            self._trial = True
+            return True
+
+    def record_success(self) -> None:
+        """Close the circuit after a successful request."""
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self._trial = False
+
+    def record_failure(self) -> None:
+        """Count a failed request and open the circuit if the threshold is reached."""
+        with self._lock:
+            self.failures += 1
+            if self._trial or self.failures >= self.failure_threshold:
+                self.opened_at = time.monotonic()
+            self._trial = False
+
+
+def record_request(url: str, status: int | str, duration: float) -> None:
+    """Record the duration and status of a request attempt."""
+    endpoint = urlparse(url).path.rstrip("/").rsplit("/", 1)[-1]
+    metrics.observe("chatbot_http_request_duration_seconds", duration, endpoint=endpoint)
+    metrics.inc("chatbot_http_requests_total", endpoint=endpoint, status=status)
+
+
+def charge(quota: QuotaBudget | None, url: str, response) -> bool:
+    """Charge a request attempt to the request budget and return whether it may be sent.
+
+    Raises QuotaExhaustedError if the budget is used up before the first attempt, which has no response yet.
+    """
+    if quota is None or quota.acquire():
+        return True
+    metrics.inc("chatbot_http_requests_skipped_total", reason="quota")
+    if response is None:
+        raise QuotaExhaustedError(f"Request budget exhausted, the request to {url} was not sent")
+    return False
+
+
+def retry_after(response) -> float | None:
+    """Parse the Retry-After header of a response in seconds."""
+    value = response.headers.get("Retry-After")
+    if value is None:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+class HTTPTransport:
+    """Pooled keep-alive HTTP transport with timeouts, retries and a circuit breaker.
+
+    Connection errors, timeouts and 5xx responses are retried with jittered exponential backoff. 429 responses are
+    retried after the delay given by the Retry-After header if it does not exceed `max_retry_after` seconds.
+    If a cassette is given, responses are recorded to it or, with `replay`, served from it without network access.
+    """
+    def __init__(self, timeout: tuple[float, float] = (3.05, 10), max_retries: int = 2, backoff: float = 0.5,
+                 max_backoff: float = 8, max_retry_after: float = 10, pool_size: int = 10,
+                 breaker: CircuitBreaker | None = None, cassette: Cassette | None = None, replay: bool = False):
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.max_retry_after = max_retry_after
+        self.pool_size = pool_size
+        self.breaker = breaker if breaker is not None else CircuitBreaker()
+        self.cassette = cassette
+        self.replay = replay
+
+        # create a session with a keep-alive connection pool
+        self.session = requests.Session()
+        if cassette is not None:
+            adapter = CassetteAdapter(cassette, replay, pool_connections=pool_size, pool_maxsize=pool_size)
+        else:
+            adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+    def delay(self, attempt: int) -> float:
+        """Get the jittered exponential backoff delay for a retry attempt."""
+        return random.uniform(0, min(self.max_backoff, self.backoff * 2 ** attempt))
+
+    def get(self, url: str, params: dict = None, quota: QuotaBudget | None = None) -> requests.Response:
+        """Send a GET request and return the final response.
+
+        Each attempt is charged to the request budget `quota`. Once it is used up, the response of the last attempt is
+        returned or QuotaExhaustedError is raised if there is none.
+        """
+        response = None
+        for attempt in range(self.max_retries + 1):
+            is_last = attempt == self.max_retries
+            if not charge(quota, url, response):
+                return response
+
+            # fail fast while the upstream is down
+            if not self.breaker.allow():
+                record_request(url, "circuit_open", 0)
+                raise CircuitOpenError(f"Circuit open, requests to {url} are paused")
+
+            # send request and retry on connection errors and timeouts
+            start = time.perf_counter()
+            try:
+                response = self.session.get(url, params=params, timeout=self.timeout)
+            except (requests.ConnectionError, requests.Timeout):
+                record_request(url, "error", time.perf_counter() - start)
+                self.breaker.record_failure()
+                if is_last:
+                    raise
+                time.sleep(self.delay(attempt))
+                continue
+
+            record_request(url, response.status_code, time.perf_counter() - start)
+
+            # retry on server errors
+            if response.status_code >= 500:
+                self.breaker.record_failure()
+                if is_last:
+                    return response
+                time.sleep(self.delay(attempt))
+                continue
+
+            self.breaker.record_success()
+
+            # retry on rate limits if the server asks for a short enough delay
+            if response.status_code == 429 and not is_last:
+                wait = retry_after(response)
+                if wait is not None and wait <= self.max_retry_after:
+                    time.sleep(wait)
+                    continue
+            return response
+
+
+class AsyncHTTPTransport(HTTPTransport):
+    """Non-blocking counterpart of HTTPTransport based on httpx.
+
+    httpx clients cannot be shared between event loops, so the keep-alive client lives on an event loop thread of the
+    transport and the requests of all other event loops are handed over to it. This keeps a single connection pool
+    per process instead of one per event loop, e.g. for each `asyncio.run`.
+    """
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.limits = httpx.Limits(max_connections=self.pool_size, max_keepalive_connections=self.pool_size)
+        self._client = None
+        self._loop = None
+        self._loop_pid = None
+        self._lock = ForkSafeLock()
+
+    @property
+    def loop(self) -> asyncio.AbstractEventLoop:
+        """Get the event loop of the current process that runs the requests."""
+        with self._lock:
+            if self._loop is None or self._loop_pid != os.getpid():
+                self._loop = asyncio.new_event_loop()
+                self._loop_pid = os.getpid()
+                self._client = None
+                threading.Thread(target=self._loop.run_forever, name="async-http", daemon=True).start()
+            return self._loop
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        """Get the client, which must only be used on the event loop of the transport."""
+        if self._client is None:
+            connect, read = self.timeout
+            timeout = httpx.Timeout(read, connect=connect)
+            transport = None
+            if self.cassette is not None:
+                transport = CassetteTransport(self.cassette, self.replay, httpx.AsyncHTTPTransport(limits=self.limits))
+            self._client = httpx.AsyncClient(timeout=timeout, limits=self.limits, transport=transport)
+        return self._client
+
+    async def get(self, url: str, params: dict = None, quota: QuotaBudget | None = None) -> httpx.Response:
+        """Send a GET request on the event loop of the transport and return the final response, see HTTPTransport."""
+        # the request runs in a copy of the current context, so that the measurements belong to the current request
+        future = asyncio.run_coroutine_threadsafe(self._get(url, params, quota), self.loop)
+        return await asyncio.wrap_future(future)
+
+    async def _get(self, url: str, params: dict = None, quota: QuotaBudget | None = None) -> httpx.Response:
+        """Send a GET request with retries on the event loop of the transport."""
+        response = None
+        for attempt in range(self.max_retries + 1):
+            is_last = attempt == self.max_retries
+            if not charge(quota, url, response):
+                return response
+
+            # fail fast while the upstream is down
+            if not self.breaker.allow():
+                record_request(url, "circuit_open", 0)
+                raise CircuitOpenError(f"Circuit open, requests to {url} are paused")
+
+            # send request and retry on connection errors and timeouts
+            start = time.perf_counter()
+            try:
+                response = await self.client.get(url, params=params)
+            except httpx.TransportError:
+                record_request(url, "error", time.perf_counter() - start)
+                self.breaker.record_failure()
+                if is_last:
+                    raise
+                await asyncio.sleep(self.delay(attempt))
+                continue
+
+            record_request(url, response.status_code, time.perf_counter() - start)
+
+            # retry on server errors
+            if response.status_code >= 500:
+                self.breaker.record_failure()
+                if is_last:
+                    return response
+                await asyncio.sleep(self.delay(attempt))
+                continue
+
+            self.breaker.record_success()
+
+            # retry on rate limits if the server asks for a short enough delay
+            if response.status_code == 429 and not is_last:
+                wait = retry_after(response)
+                if wait is not None and wait <= self.max_retry_after:
+                    await asyncio.sleep(wait)
+                    continue
+            return response
@@ -1,23 +1,148 @@
 import os
+import httpx
+import asyncio
 import requests
+import threading
+import contextvars
+from concurrent.futures import Future, ThreadPoolExecutor
+try:
+    import tiktoken
+except ImportError:
+    tiktoken = None
 from dotenv import load_dotenv
-from datetime import datetime, timezone
-from prompts import CURRENT_TEMPLATE, FUTURE_TEMPLATE
+from prompts import (CURRENT_TEMPLATE, FUTURE_TEMPLATE, COMPACT_TEMPLATE, COMPARISON_TEMPLATE, HOURLY_TEMPLATE,
+                     HOURLY_PHRASES)
+from .cache import WeatherCache, create_cache_backend
+from .coalescing import SingleFlight
+from .geocoding import Gazetteer, location_key
+from .locks import ForkSafeLock
+from .metrics import metrics
+from .quota import QuotaBudget, create_quota_budget
+from .snapshot import WeatherSnapshot
+from .timeline import WeatherTimeline
+from .transport import HTTPTransport, AsyncHTTPTransport, QuotaExhaustedError
 
 load_dotenv()
 
+# OpenWeatherMap API endpoints, the base URL can be changed with OPENWEATHERMAP_BASE_URL e.g. for benchmarks
+OPENWEATHERMAP_BASE_URL = "https://api.openweathermap.org"
+GEOCODING_PATH = "/geo/1.0/direct"
+ONECALL_PATH = "/data/3.0/onecall"
+
+# Error of requests that are refused since the request budget is exhausted
+QUOTA_EXHAUSTED = "429 Request Budget Exhausted"
+
+# Maximum number of locations of a comparison and of their concurrent weather requests per process
+MAX_LOCATIONS = 5
+COMPARISON_WORKERS = 4
+
+# Fields of the compact weather information table with their column names
+COMPACT_FIELDS = {
+    "weather": "weather",
+    "temp": "temp",
+    "humidity": "humidity",
+    "uvi": "uvi",
+    "clouds": "clouds",
+    "wind_speed": "wind",
+    "pop": "pop",
+    "rain": "rain",
+    "snow": "snow",
+    "summary": "summary",
+}
+
+_encoding = None
+
+
+def count_tokens(text: str) -> int:
+    """Count the tokens of a text for the OpenAI models or estimate them if tiktoken is unavailable."""
+    global _encoding
+    if _encoding is None:
+        try:
+            _encoding = tiktoken.get_encoding("o200k_base")
+        except Exception:
+            # tiktoken is missing or cannot download the encoding
+            _encoding = False
+    if _encoding:
+        return len(_encoding.encode(text))
+    return len(text) // 4 + 1
+
 
 class OpenWeatherMapAPIWrapper:
     """Wrapper class for OpenWeatherMap API."""
-    def __init__(self):
+    def __init__(self, cache: WeatherCache | None = None, gazetteer: Gazetteer | None = None,
+                 transport: HTTPTransport | None = None, base_url: str | None = None, quota: QuotaBudget | None = None):
         self.key = os.getenv("OPENWEATHERMAP_API_KEY", "")
+        self.base_url = (base_url or os.getenv("OPENWEATHERMAP_BASE_URL", OPENWEATHERMAP_BASE_URL)).rstrip("/")
+        self.geocoding_url = self.base_url + GEOCODING_PATH
+        self.onecall_url = self.base_url + ONECALL_PATH
+        self.transport = transport if transport is not None else HTTPTransport()
         self.current_template = CURRENT_TEMPLATE
         self.future_template = FUTURE_TEMPLATE
-        self.location = None
-        self.weather = None
+        self.compact_template = COMPACT_TEMPLATE
+        self.comparison_template = COMPARISON_TEMPLATE
+        self.hourly_template = HOURLY_TEMPLATE
+        self.compact = os.getenv("COMPACT_OUTPUT", "true").lower() == "true"
+        self.token_budget = int(os.getenv("OUTPUT_TOKEN_BUDGET", 400))
+        self.cache = cache if cache is not None else WeatherCache()
+        self.geocode_cache = create_cache_backend("geocoding", maxsize=10_000)
+        self.gazetteer = gazetteer if gazetteer is not None else Gazetteer()
+        self.quota = quota if quota is not None else create_quota_budget()
+        self.flights = SingleFlight(os.getenv("REQUEST_LOCK_PATH", ""))
+        self._prefetches = {}
+        self._executor = None
+        self._executor_pid = None
+        self._comparison_executor = None
+        self._comparison_executor_pid = None
+        self._lock = ForkSafeLock()
+
+    @property
+    def executor(self) -> ThreadPoolExecutor:
+        """Get the thread pool for prefetches of the current process."""
+        if self._executor is None or self._executor_pid != os.getpid():
+            self._executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix="weather-prefetch")
+            self._executor_pid = os.getpid()
+        return self._executor
+
+    @property
+    def comparison_executor(self) -> ThreadPoolExecutor:
+        """Get the thread pool for the locations of comparisons of the current process.
+
+        It is separate from the prefetch pool, since its tasks may wait for prefetches.
+        """
+        if self._comparison_executor is None or self._comparison_executor_pid != os.getpid():
+            self._comparison_executor = ThreadPoolExecutor(max_workers=COMPARISON_WORKERS,
+                                                           thread_name_prefix="weather-comparison")
+            self._comparison_executor_pid = os.getpid()
+        return self._comparison_executor
 
     def get_location(self, city_name: str, country: str = None, state: str = None) -> dict | str:
-        """Get location information from OpenWeatherMap API."""
+        """Get location information from the geocoding cache, the offline city index or OpenWeatherMap API."""
+
+        # check the geocoding cache
+        key = location_key(city_name, country, state)
+        loc = self.geocode_cache.get(key)
+        if loc is not None:
+            metrics.inc("chatbot_cache_requests_total", cache="geocoding", result="hit")
+            return loc
+
+        # check the offline city index
+        loc = self.gazetteer.lookup(city_name, country, state)
+        if loc is not None:
+            metrics.inc("chatbot_cache_requests_total", cache="geocoding", result="gazetteer")
+            return loc
+        metrics.inc("chatbot_cache_requests_total", cache="geocoding", result="miss")
+
+        # request location information once for concurrent lookups of all workers
+        return self.flights.run(f"location:{key}", lambda: self.request_location(key, city_name, country, state),
+                                lambda: self.geocode_cache.get(key))
+
+    def request_location(self, key: str, city_name: str, country: str = None, state: str = None) -> dict | str:
+        """Request location information from OpenWeatherMap API and store it in the geocoding cache."""
+        response = self.request(self.geocoding_url, self.location_params(city_name, country, state))
+        return self.store_location(key, response)
+
+    def location_params(self, city_name: str, country: str = None, state: str = None) -> dict:
+        """Prepare request parameters for the geocoding API."""
 
         # prepare location string
         location = city_name
@@ -26,105 +151,281 @@ class OpenWeatherMapAPIWrapper:
         if country:
             location += f",{country}"
 
-        # prepare request parameters
-        params = {
+        return {
             "q": location,
             "limit": 1,
             "appid": self.key
         }
 
-        # request location information
-        response = requests.get("https://api.openweathermap.org/geo/1.0/direct", params=params)
-
-        # handle response
-        response = self.handle_response(response)
+    def store_location(self, key: str, response: list | str) -> dict | str:
+        """Handle the geocoding response and store the location in the geocoding cache."""
         if isinstance(response, str):
             return f"Could not get location because of following error: {response}"
+        if not response:
+            return "Could not get location because of following error: 404 Not Found"
         loc = response[0]
         _ = loc.pop("local_names", None)
+        self.geocode_cache.set(key, loc)
         return loc
 
-    def get_weather(self, city_name: str, country: str = None, state: str = None) -> str:
+    def get_weather(self, city_name: str, country: str = None, state: str = None, days: list[int] = None,
+                    fields: list[str] = None) -> str:
         """Get weather information from OpenWeatherMap API."""
+        return self.get_weather_report(city_name, country, state, days, fields)[0]
+
+    def get_weather_report(self, city_name: str, country: str = None, state: str = None, days: list[int] = None,
+                           fields: list[str] = None) -> tuple[str, dict | None]:
+        """Get weather information and the location and weather data it is based on."""
 
         # get location information
-        self.location = self.get_location(city_name, country, state)
-        if isinstance(self.location, str):
-            return f"Could not get location because of following error: {self.location}"
+        with metrics.timer("chatbot_stage_duration_seconds", stage="geocoding"):
+            location = self.get_location(city_name, country, state)
+        if isinstance(location, str):
+            return f"Could not get location because of following error: {location}", None
+
+        # get weather information
+        with metrics.timer("chatbot_stage_duration_seconds", stage="weather"):
+            weather = self.get_weather_data(location["lat"], location["lon"])
+        if isinstance(weather, str):
+            return f"Could not get weather because of following error: {weather}", None
+
+        # format templates and return output with its data
+        return self.get_output(location, weather, days, fields), {"location": location, "weather": weather.to_dict()}
+
+    def get_hourly_report(self, city_name: str, country: str = None, state: str = None, hours: int = 12,
+                          pop_threshold: int = 50) -> tuple[str, dict | None]:
+        """Get the hourly and minutely forecasts aggregated to a few values and the data they are based on.
+
+        The hourly and minutely forecasts are requested on demand and aggregated locally, so only the computed values
+        are passed on. The data excludes them, since it is only used to display the current weather and daily forecast.
+        """
+
+        # get location information
+        with metrics.timer("chatbot_stage_duration_seconds", stage="geocoding"):
+            location = self.get_location(city_name, country, state)
+        if isinstance(location, str):
+            return f"Could not get location because of following error: {location}", None
+
+        # get weather information including the hourly and minutely forecasts
+        with metrics.timer("chatbot_stage_duration_seconds", stage="weather"):
+            weather = self.get_weather_data(location["lat"], location["lon"],
+                                            WeatherCache.parts + WeatherCache.timeline_parts)
+        if isinstance(weather, str):
+            return f"Could not get weather because of following error: {weather}", None
+
+        # aggregate the forecasts and return output with its data
+        output = self.get_hourly_output(location, weather, hours, pop_threshold)
+        return output, {"location": location, "weather": self.cache.select(weather, WeatherCache.parts).to_dict()}
+
+    def get_comparison_report(self, locations: list[dict], days: list[int] = None,
+                              fields: list[str] = None) -> tuple[str, list[dict]]:
+        """Get a comparison of the weather at several locations and the location and weather data it is based on.
+
+        Locations are dicts with a city and optionally a country and state. Each distinct location is geocoded once,
+        the weather data of distinct coordinates is requested once and all requests run concurrently on a bounded
+        thread pool. Locations that fail are reported below the comparison.
+        """
+
+        def submit(func, *args) -> Future:
+            # run in a copy of the current context so that the measurements belong to the current request
+            return self.comparison_executor.submit(contextvars.copy_context().run, func, *args)
+
+        # geocode each distinct location once
+        queries = self.distinct_locations(locations)
+        with metrics.timer("chatbot_stage_duration_seconds", stage="geocoding"):
+            futures = {key: submit(self.get_location, *query) for key, query in queries.items()}
+            found = {key: future.result() for key, future in futures.items()}
+
+        # request the weather data of each distinct location once
+        coordinates = {self.cache.key(loc["lat"], loc["lon"]): loc for loc in found.values() if isinstance(loc, dict)}
+        with metrics.timer("chatbot_stage_duration_seconds", stage="weather"):
+            futures = {key: submit(self.get_weather_data, loc["lat"], loc["lon"]) for key, loc in coordinates.items()}
+            weather = {key: future.result() for key, future in futures.items()}
+        return self.comparison_report(queries, found, weather, days, fields)
+
+    @staticmethod
+    def distinct_locations(locations: list[dict]) -> dict[str, tuple]:
+        """Get the (city, country, state) queries of the first MAX_LOCATIONS distinct locations by their cache key."""
+        queries = {}
+        for location in locations:
+            query = (location["city"], location.get("country"), location.get("state"))
+            queries.setdefault(location_key(*query), query)
+        return dict(list(queries.items())[:MAX_LOCATIONS])
+
+    def comparison_report(self, queries: dict[str, tuple], found: dict[str, dict | str],
+                          weather: dict[str, WeatherSnapshot | str], days: list[int] = None,
+                          fields: list[str] = None) -> tuple[str, list[dict]]:
+        """Combine the geocoding results and weather data of a comparison into its output and data."""
+        reports, errors, artifacts, compared = [], [], [], set()
+        for key, (city, _, _) in queries.items():
+            location = found[key]
+            if isinstance(location, str):
+                errors.append(f"Could not get location of {city} because of following error: {location}")
+                continue
+            coordinates = self.cache.key(location["lat"], location["lon"])
+            data = weather[coordinates]
+            if isinstance(data, str):
+                errors.append(f"Could not get weather of {city} because of following error: {data}")
+                continue
+            # locations that resolve to the same coordinates are compared once
+            if coordinates in compared:
+                continue
+            compared.add(coordinates)
+            reports.append((location, data))
+            artifacts.append({"location": location, "weather": data.to_dict()})
+        output = self.get_comparison_output(reports, days, fields) if reports else ""
+        return "\n".join([output] + errors).strip(), artifacts
+
+    def get_weather_data(self, lat: float, lon: float,
+                         parts: tuple[str, ...] = WeatherCache.parts) -> WeatherSnapshot | str:
+        """Get the given parts of the weather data from the cache or the OpenWeatherMap API."""
+
+        # serve cached data, stale data is refreshed in the background
+        weather, missing = self.cached_weather(lat, lon, parts)
+        if weather is not None:
+            return weather
+
+        # wait for a running prefetch of the same location, which only fetches the current and daily weather
+        future = self._prefetches.get(self.cache.key(lat, lon))
+        if future is not None and set(parts) <= set(WeatherCache.parts):
+            return future.result()
+
+        # request missing data
+        return self.fetch_weather(lat, lon, missing)
+
+    def prefetch_weather(self, lat: float, lon: float) -> Future | None:
+        """Start fetching uncached weather data on a thread pool.
+
+        Until the prefetch is done, requests for the weather data of the same coordinates wait for its result instead
+        of sending their own request. Returns None if the data is cached.
+        """
+        weather, missing = self.cached_weather(lat, lon)
+        if weather is not None:
+            return None
+        key = self.cache.key(lat, lon)
+        with self._lock:
+            if key not in self._prefetches:
+                # run in a copy of the current context so that the measurements belong to the current request
+                context = contextvars.copy_context()
+                self._prefetches[key] = self.executor.submit(
+                    context.run, self._prefetch_weather, key, lat, lon, missing
+                )
+            return self._prefetches[key]
+
+    def _prefetch_weather(self, key: str, lat: float, lon: float, parts: list[str]) -> WeatherSnapshot | str:
+        """Fetch weather data and unregister the prefetch."""
+        try:
+            return self.fetch_weather(lat, lon, parts)
+        finally:
+            with self._lock:
+                self._prefetches.pop(key, None)
+
+    def cached_weather(self, lat: float, lon: float,
+                       parts: tuple[str, ...] = WeatherCache.parts) -> tuple[WeatherSnapshot | None, list[str]]:
+        """Get the given parts of the weather data from the cache and start a background refresh of expired parts."""
+        weather, expired = self.cache.get(lat, lon, parts)
+        if weather is not None and expired and self.cache.start_refresh(lat, lon):
+            threading.Thread(target=self._refresh_weather, args=(lat, lon, expired), daemon=True).start()
+        return weather, expired
+
+    def fetch_weather(self, lat: float, lon: float, parts: list[str]) -> WeatherSnapshot | str:
+        """Fetch the given parts of the weather data once for concurrent requests of all workers."""
+        return self.flights.run(self.flight_key(lat, lon, parts), lambda: self.request_weather(lat, lon, parts),
+                                lambda: self.fresh_weather(lat, lon, parts))
+
+    def request_weather(self, lat: float, lon: float, parts: list[str]) -> WeatherSnapshot | str:
+        """Request the given parts of the weather data from OpenWeatherMap API and update the cache."""
 
         # prepare request parameters
-        params = {
-            "lat": self.location["lat"],
-            "lon": self.location["lon"],
-            "exclude": "minutely,hourly,alerts",
-            "units": "metric",
-            "appid": self.key
-        }
+        params = self.weather_params(lat, lon, parts)
 
         # request weather information
-        self.weather = requests.get("https://api.openweathermap.org/data/3.0/onecall", params=params)
+        response = self.request(self.onecall_url, params)
+        return self.store_weather(lat, lon, parts, response)
 
-        # handle response
-        self.weather = self.handle_response(self.weather)
-        if isinstance(self.weather, str):
-            return f"Could not get weather because of following error: {self.weather}"
+    def flight_key(self, lat: float, lon: float, parts: list[str]) -> str:
+        """Create the key of concurrent requests for the same parts of the weather data."""
+        return f"weather:{self.cache.key(lat, lon)}:{','.join(sorted(parts))}"
 
-        # format templates and return output
-        return self.get_output()
+    def fresh_weather(self, lat: float, lon: float, parts: list[str]) -> WeatherSnapshot | None:
+        """Get cached weather data if the given parts have not expired, e.g. since another worker just fetched them."""
+        weather, expired = self.cache.get(lat, lon, tuple(parts))
+        if weather is None or expired:
+            return None
+        return weather
 
-    def get_output(self) -> str:
-        """Create output string for weather information"""
+    def store_weather(self, lat: float, lon: float, parts: list[str], response: dict | str) -> WeatherSnapshot | str:
+        """Handle the One Call response and merge it into the cache.
 
-        # prepare location string
-        loc = self.location["name"]
-        if self.location["country"] == "US":
-            loc += f", {self.location['state']}"
-        loc += f", {self.location['country']}"
+        Once the request budget or the quota of the API key is used up, cached data is served regardless of its age.
+        """
+        if isinstance(response, str):
+            if response.startswith("429"):
+                weather = self.cache.get_outdated(lat, lon, tuple(parts))
+                if weather is not None:
+                    return weather
+            return response
+        return self.cache.set(lat, lon, WeatherSnapshot.from_onecall(response), parts)
+
+    def weather_params(self, lat: float, lon: float, parts: list[str]) -> dict:
+        """Prepare request parameters for the One Call API that only include the given parts."""
+        exclude = [part for part in ("minutely", "hourly") if part not in parts] + ["alerts"]
+        exclude += [part for part in WeatherCache.parts if part not in parts]
+        return {
+            "lat": lat,
+            "lon": lon,
+            "exclude": ",".join(exclude),
+            "units": "metric",
+            "appid": self.key
+        }
 
-        # get current and forecast data
-        current = self.weather["current"]
-        forecast = self.weather["daily"]
+    def _refresh_weather(self, lat: float, lon: float, parts: list[str]) -> None:
+        """Refresh expired weather data in the background."""
+        try:
+            self.fetch_weather(lat, lon, parts)
+        finally:
+            self.cache.end_refresh(lat, lon)
 
-        # extract rain data
-        rain = current.get("rain", 0)
-        rain = rain if isinstance(rain, int) else rain.get("1h", 0)
+    def get_output(self, location: dict, weather: WeatherSnapshot, days: list[int] = None,
+                   fields: list[str] = None) -> str:
+        """Create output string for weather information
 
-        # extract snow data
-        snow = current.get("snow", 0)
-        snow = snow if isinstance(snow, int) else snow.get("1h", 0)
+        Only the forecasts of the given days are included, where 0 is today. In compact mode, the output is a table
+        of the given fields that is shortened to the token budget.
+        """
+        if self.compact:
+            return self.get_compact_output(location, weather, days, fields)
+
+        # prepare location string
+        loc = self.get_location_name(location)
 
         # format current weather information template
+        current = weather.current
         weather_current = self.current_template.format(
             location=loc,
-            time=datetime.fromtimestamp(current["dt"] + self.weather["timezone_offset"], timezone.utc).strftime('%A %Y-%m-%d %H:%M'),
+            time=weather.local_time(current["dt"]),
             temp=current["temp"],
             humidity=current["humidity"],
             uvi=current["uvi"],
             clouds=current["clouds"],
             wind_speed=current["wind_speed"],
-            rain=rain,
-            snow=snow,
-            weather=current["weather"][0]["description"]
+            rain=current["rain"],
+            snow=current["snow"],
+            weather=current["description"]
         )
 
         # format forecast weather information templates
-        weather_forecasts = [self.future_template.format(
-            location=loc,
-            date=datetime.fromtimestamp(data["dt"] + self.weather["timezone_offset"], timezone.utc).strftime('%A %Y-%m-%d'),
-            summary=data["summary"],
-            temp_morn=data["temp"]["morn"],
-            temp_day=data["temp"]["day"],
-            temp_eve=data["temp"]["eve"],
-            temp_night=data["temp"]["night"],
-            humidity=data["humidity"],
-            uvi=data["uvi"],
-            clouds=data["clouds"],
-            wind_speed=data["wind_speed"],
-            pop=data["pop"],
-            rain=data.get("rain", 0),
-            snow=data.get("snow", 0),
-            weather=data["weather"][0]["description"]
-        ) for data in forecast[1:]]
+        weather_forecasts = []
+        for i in range(weather.days):
+            if not (i in days if days else i > 0):
+                continue
+            data = weather.day(i)
+            weather_forecasts.append(self.future_template.format(
+                location=loc,
+                date=weather.local_time(data["dt"], "%A %Y-%m-%d"),
+                weather=data["description"],
+                **data
+            ))
 
         # join current and forecast weather information
         weather_forecast = "\n####\n".join(weather_forecasts)
@@ -132,10 +433,194 @@ class OpenWeatherMapAPIWrapper:
         # return context string
         return f"{weather_current}\n####\n{weather_forecast}"
 
-    def get_icon_ids(self) -> list[str]:
+    def get_compact_output(self, location: dict, weather: WeatherSnapshot, days: list[int] = None,
+                           fields: list[str] = None) -> str:
+        """Create a compact table of the current weather and the forecasts that fits into the token budget.
+
+        If the table is too long, the summaries are dropped first, then the forecasts of the last days.
+        """
+        fields = [field for field in COMPACT_FIELDS if field in fields] if fields else list(COMPACT_FIELDS)
+        rows = self.get_compact_rows(weather, days)
+
+        # shorten the table until it fits into the token budget
+        local_time = self.get_local_time(weather)
+        while True:
+            table = "\n".join(
+                ["|".join(["day"] + [COMPACT_FIELDS[field] for field in fields])]
+                + ["|".join([day] + [str(values[field]) for field in fields]) for _, day, values in rows]
+            )
+            location_name = self.get_location_name(location)
+            output = self.compact_template.format(location=location_name, time=local_time, table=table)
+            if count_tokens(output) <= self.token_budget:
+                return output
+            if "summary" in fields and len(fields) > 1:
+                fields.remove("summary")
+            elif len(rows) > 2:
+                rows.pop()
+            else:
+                return output
+
+    def get_compact_rows(self, weather: WeatherSnapshot, days: list[int] = None) -> list[tuple[int, str, dict]]:
+        """Format the current weather and the forecasts of the given days as (day index, day, values) rows.
+
+        The current weather has the day index -1.
+        """
+        # format the current weather, which has no precipitation probability and summary
+        current = weather.current
+        values = {
+            "weather": current["description"],
+            "temp": f"{current['temp']:.0f}",
+            "humidity": current["humidity"],
+            "uvi": f"{current['uvi']:.0f}",
+            "clouds": current["clouds"],
+            "wind_speed": f"{current['wind_speed']:.0f}",
+            "pop": "-",
+            "rain": f"{current['rain']:.1f}",
+            "snow": f"{current['snow']:.1f}",
+            "summary": "-",
+        }
+        rows = [(-1, "now", values)]
+
+        # format the forecasts
+        for i in range(weather.days):
+            if days and i not in days:
+                continue
+            data = weather.day(i)
+            date = weather.local_time(data["dt"], "%a %m-%d")
+            values = {
+                "weather": data["description"],
+                "temp": "/".join(f"{data[x]:.0f}" for x in ("temp_morn", "temp_day", "temp_eve", "temp_night")),
+                "humidity": data["humidity"],
+                "uvi": f"{data['uvi']:.0f}",
+                "clouds": data["clouds"],
+                "wind_speed": f"{data['wind_speed']:.0f}",
+                "pop": f"{data['pop'] * 100:.0f}",
+                "rain": f"{data['rain']:.1f}",
+                "snow": f"{data['snow']:.1f}",
+                "summary": data["summary"] or "-",
+            }
+            rows.append((i, "today" if i == 0 else date, values))
+        return rows
+
+    def get_comparison_output(self, reports: list[tuple[dict, WeatherSnapshot]], days: list[int] = None,
+                              fields: list[str] = None) -> str:
+        """Create a compact table that compares the weather of several (location, weather data) pairs.
+
+        The rows of the locations are grouped by day, so that the values of each day are next to each other. If the
+        table is too long for the token budget, the summaries are dropped first, then the forecasts of the last days.
+        """
+        if not self.compact:
+            return "\n\n".join(self.get_output(location, weather, days, fields) for location, weather in reports)
+        fields = [field for field in COMPACT_FIELDS if field in fields] if fields else list(COMPACT_FIELDS)
+        names = [self.get_location_name(location) for location, _ in reports]
+        rows = sorted(
+            ((index, n, day, values) for n, (_, weather) in enumerate(reports)
+             for index, day, values in self.get_compact_rows(weather, days)),
+            key=lambda row: row[:2]
+        )
+        locations = "; ".join(f"{name} (local time {self.get_local_time(weather)})"
+                              for name, (_, weather) in zip(names, reports))
+
+        # shorten the table until it fits into the token budget
+        while True:
+            table = "\n".join(
+                ["|".join(["day", "location"] + [COMPACT_FIELDS[field] for field in fields])]
+                + ["|".join([day, names[n]] + [str(values[field]) for field in fields]) for _, n, day, values in rows]
+            )
+            output = self.comparison_template.format(locations=locations, table=table)
+            if count_tokens(output) <= self.token_budget:
+                return output
+            if "summary" in fields and len(fields) > 1:
+                fields.remove("summary")
+            elif len({row[0] for row in rows}) > 2:
+                last = rows[-1][0]
+                rows = [row for row in rows if row[0] != last]
+            else:
+                return output
+
+    def get_hourly_output(self, location: dict, weather: WeatherSnapshot, hours: int = 12,
+                          pop_threshold: int = 50) -> str:
+        """Create output string for the hourly forecast of the next hours and the minutely forecast of the next hour."""
+        loc = self.get_location_name(location)
+        timeline = WeatherTimeline(weather)
+        times = timeline.hours(hours)
+        if not times.size:
+            return f"No hourly forecast is available for {loc}."
+
+        # aggregate the hourly forecast over the window
+        temp_min, temp_min_time = timeline.minimum("temp", hours)
+        temp_max, temp_max_time = timeline.maximum("temp", hours)
+        pop_max, pop_max_time = timeline.maximum("pop", hours)
+        wind_max, wind_max_time = timeline.maximum("wind_speed", hours)
+        gust_max, gust_max_time = timeline.maximum("wind_gust", hours)
+        pop_first = timeline.first_hour("pop", pop_threshold, hours)
+        rain_first = timeline.first_hour("rain", 0, hours)
+
+        # describe the precipitation of the next hour
+        start, end, maximum = timeline.precipitation_minutes()
+        if not timeline.minute_time.size:
+            minutely = HOURLY_PHRASES["minutely_missing"]
+        elif start is None:
+            minutely = HOURLY_PHRASES["minutely_dry"]
+        elif start > 0:
+            minutely = HOURLY_PHRASES["minutely_start"].format(start=start, max=maximum)
+        elif end is None:
+            minutely = HOURLY_PHRASES["minutely_now"].format(max=maximum)
+        else:
+            minutely = HOURLY_PHRASES["minutely_stop"].format(end=end, max=maximum)
+
+        # format hourly weather information template
+        return self.hourly_template.format(
+            location=loc,
+            time=self.get_local_time(weather),
+            hours=times.size,
+            end=timeline.local_time(int(times[-1])),
+            temp_min=temp_min,
+            temp_min_time=timeline.local_time(temp_min_time),
+            temp_max=temp_max,
+            temp_max_time=timeline.local_time(temp_max_time),
+            pop_max=pop_max,
+            pop_max_time=timeline.local_time(pop_max_time),
+            pop_first=HOURLY_PHRASES["pop_first"].format(threshold=pop_threshold, time=timeline.local_time(pop_first))
+            if pop_first is not None else HOURLY_PHRASES["pop_never"].format(threshold=pop_threshold),
+            rain=timeline.total("rain", hours),
+            snow=timeline.total("snow", hours),
+            rain_first=HOURLY_PHRASES["rain_first"].format(time=timeline.local_time(rain_first))
+            if rain_first is not None else HOURLY_PHRASES["rain_never"],
+            wind_max=wind_max,
+            wind_max_time=timeline.local_time(wind_max_time),
+            gust_max=gust_max,
+            gust_max_time=timeline.local_time(gust_max_time),
+            minutely=minutely
+        )
+
+    @staticmethod
+    def get_local_time(weather: WeatherSnapshot) -> str:
+        """Format the current local time of the weather data."""
+        return weather.local_time(weather.current["dt"])
+
+    @staticmethod
+    def get_location_name(location: dict) -> str:
+        """Create the display name of a location."""
+        loc = location["name"]
+        if location["country"] == "US":
+            loc += f", {location['state']}"
+        return f"{loc}, {location['country']}"
+
+    @staticmethod
+    def get_icon_ids(weather: WeatherSnapshot) -> list[str]:
         """Get icon ids for weather forecast column."""
-        icon_ids = [data["weather"][0]["icon"] for data in self.weather["daily"]]
-        return icon_ids
+        return list(weather.daily["icon"])
+
+    def request(self, url: str, params: dict) -> dict | list | str:
+        """Send a request to OpenWeatherMap API within the request budget and handle the response."""
+        try:
+            response = self.transport.get(url, params=params, quota=self.quota)
+        except QuotaExhaustedError:
+            return QUOTA_EXHAUSTED
+        except requests.RequestException as e:
+            return f"Request failed: {e}"
+        return self.handle_response(response)
 
     @staticmethod
     def handle_response(response) -> dict | str:
@@ -155,9 +640,142 @@ class OpenWeatherMapAPIWrapper:
                 return f"{response.status_code} Unexpected Error"
 
 
-def check_open_weather_key() -> bool:
-    """Check if OpenWeatherMap API key is valid."""
-    open_weather = os.getenv("OPENWEATHERMAP_API_KEY", "")
-    if len(open_weather) < 16:
-        return False
-    return True
+class AsyncOpenWeatherMapAPIWrapper(OpenWeatherMapAPIWrapper):
+    """Wrapper class for OpenWeatherMap API with non-blocking counterparts of the request methods.
+
+    The caches are shared with the blocking methods, so both can be used on the same instance.
+    """
+    def __init__(self, cache: WeatherCache | None = None, gazetteer: Gazetteer | None = None,
+                 transport: HTTPTransport | None = None, async_transport: AsyncHTTPTransport | None = None,
+                 base_url: str | None = None, quota: QuotaBudget | None = None):
+        super().__init__(cache, gazetteer, transport, base_url, quota)
+        self.async_transport = async_transport if async_transport is not None else AsyncHTTPTransport()
+
+    async def aget_location(self, city_name: str, country: str = None, state: str = None) -> dict | str:
+        """Get location information asynchronously, see `get_location`."""
+
+        # check the geocoding cache and the offline city index
+        key = location_key(city_name, country, state)
+        loc = self.geocode_cache.get(key)
+        if loc is not None:
+            metrics.inc("chatbot_cache_requests_total", cache="geocoding", result="hit")
+            return loc
+        loc = self.gazetteer.lookup(city_name, country, state)
+        if loc is not None:
+            metrics.inc("chatbot_cache_requests_total", cache="geocoding", result="gazetteer")
+            return loc
+        metrics.inc("chatbot_cache_requests_total", cache="geocoding", result="miss")
+
+        # request location information once for concurrent lookups of all workers
+        return await self.flights.arun(f"location:{key}",
+                                       lambda: self.arequest_location(key, city_name, country, state),
+                                       lambda: self.geocode_cache.get(key))
+
+    async def arequest_location(self, key: str, city_name: str, country: str = None, state: str = None) -> dict | str:
+        """Request location information asynchronously, see `request_location`."""
+        response = await self.arequest(self.geocoding_url, self.location_params(city_name, country, state))
+        return self.store_location(key, response)
+
+    async def aget_weather(self, city_name: str, country: str = None, state: str = None, days: list[int] = None,
+                           fields: list[str] = None) -> str:
+        """Get weather information asynchronously, see `get_weather`."""
+        return (await self.aget_weather_report(city_name, country, state, days, fields))[0]
+
+    async def aget_weather_report(self, city_name: str, country: str = None, state: str = None,
+                                  days: list[int] = None, fields: list[str] = None) -> tuple[str, dict | None]:
+        """Get weather information and its data asynchronously, see `get_weather_report`."""
+
+        # get location information
+        with metrics.timer("chatbot_stage_duration_seconds", stage="geocoding"):
+            location = await self.aget_location(city_name, country, state)
+        if isinstance(location, str):
+            return f"Could not get location because of following error: {location}", None
+
+        # get weather information
+        with metrics.timer("chatbot_stage_duration_seconds", stage="weather"):
+            weather = await self.aget_weather_data(location["lat"], location["lon"])
+        if isinstance(weather, str):
+            return f"Could not get weather because of following error: {weather}", None
+
+        # format templates and return output with its data
+        return self.get_output(location, weather, days, fields), {"location": location, "weather": weather.to_dict()}
+
+    async def aget_hourly_report(self, city_name: str, country: str = None, state: str = None, hours: int = 12,
+                                 pop_threshold: int = 50) -> tuple[str, dict | None]:
+        """Get the aggregated hourly forecast and its data asynchronously, see `get_hourly_report`."""
+
+        # get location information
+        with metrics.timer("chatbot_stage_duration_seconds", stage="geocoding"):
+            location = await self.aget_location(city_name, country, state)
+        if isinstance(location, str):
+            return f"Could not get location because of following error: {location}", None
+
+        # get weather information including the hourly and minutely forecasts
+        with metrics.timer("chatbot_stage_duration_seconds", stage="weather"):
+            weather = await self.aget_weather_data(location["lat"], location["lon"],
+                                                   WeatherCache.parts + WeatherCache.timeline_parts)
+        if isinstance(weather, str):
+            return f"Could not get weather because of following error: {weather}", None
+
+        # aggregate the forecasts and return output with its data
+        output = self.get_hourly_output(location, weather, hours, pop_threshold)
+        return output, {"location": location, "weather": self.cache.select(weather, WeatherCache.parts).to_dict()}
+
+    async def aget_comparison_report(self, locations: list[dict], days: list[int] = None,
+                                     fields: list[str] = None) -> tuple[str, list[dict]]:
+        """Get a comparison of the weather at several locations asynchronously, see `get_comparison_report`."""
+        semaphore = asyncio.Semaphore(COMPARISON_WORKERS)
+
+        async def bounded(coroutine):
+            async with semaphore:
+                return await coroutine
+
+        # geocode each distinct location once
+        queries = self.distinct_locations(locations)
+        with metrics.timer("chatbot_stage_duration_seconds", stage="geocoding"):
+            results = await asyncio.gather(*(bounded(self.aget_location(*query)) for query in queries.values()))
+        found = dict(zip(queries, results))
+
+        # request the weather data of each distinct location once
+        coordinates = {self.cache.key(loc["lat"], loc["lon"]): loc for loc in found.values() if isinstance(loc, dict)}
+        with metrics.timer("chatbot_stage_duration_seconds", stage="weather"):
+            results = await asyncio.gather(
+                *(bounded(self.aget_weather_data(loc["lat"], loc["lon"])) for loc in coordinates.values())
+            )
+        weather = dict(zip(coordinates, results))
+        return self.comparison_report(queries, found, weather, days, fields)
+
+    async def aget_weather_data(self, lat: float, lon: float,
+                                parts: tuple[str, ...] = WeatherCache.parts) -> WeatherSnapshot | str:
+        """Get the given parts of the weather data asynchronously, see `get_weather_data`."""
+
+        # stale data is refreshed on a background thread since the event loop may not outlive this call
+        weather, missing = self.cached_weather(lat, lon, parts)
+        if weather is not None:
+            return weather
+
+        # wait for a running prefetch of the same location
+        future = self._prefetches.get(self.cache.key(lat, lon))
+        if future is not None and set(parts) <= set(WeatherCache.parts):
+            return await asyncio.wrap_future(future)
+        return await self.afetch_weather(lat, lon, missing)
+
+    async def afetch_weather(self, lat: float, lon: float, parts: list[str]) -> WeatherSnapshot | str:
+        """Fetch the given parts of the weather data asynchronously, see `fetch_weather`."""
+        return await self.flights.arun(self.flight_key(lat, lon, parts), lambda: self.arequest_weather(lat, lon, parts),
+                                       lambda: self.fresh_weather(lat, lon, parts))
+
+    async def arequest_weather(self, lat: float, lon: float, parts: list[str]) -> WeatherSnapshot | str:
+        """Request the given parts of the weather data asynchronously, see `request_weather`."""
+        response = await self.arequest(self.onecall_url, self.weather_params(lat, lon, parts))
+        return self.store_weather(lat, lon, parts, response)
+
+    async def arequest(self, url: str, params: dict) -> dict | list | str:
+        """Send a request to OpenWeatherMap API asynchronously within the request budget and handle the response."""
+        try:
+            response = await self.async_transport.get(url, params=params, quota=self.quota)
+        except QuotaExhaustedError:
+            return QUOTA_EXHAUSTED
+        except (httpx.HTTPError, requests.RequestException) as e:
+            return f"Request failed: {e}"
+        return self.handle_response(response)
@@ -1,17 +1,53 @@
 import os
+import json
+import hashlib
+import time
+import threading
 import dash
-from dash import html, dcc, callback, Output, Input, State, ctx
+import psutil
+import diskcache
+import multiprocess
+from dash import html, dcc, callback, clientside_callback, ClientsideFunction, Output, Input, State, ctx, Patch
+from dash import DiskcacheManager
+from flask import Response, request, redirect, stream_with_context, g
 import dash_bootstrap_components as dbc
 from time import sleep
+from uuid import uuid4
 from itertools import chain, zip_longest
-from datetime import datetime, timezone, timedelta
-from bot import setup_agent, query_llm, check_open_ai_key
+from functools import lru_cache, cached_property
+from contextlib import contextmanager
+from datetime import date, datetime, timezone, timedelta
 from prompts import PROMPT_EXAMPLES
-from api import check_open_weather_key
+# the modules of the chatbot are imported on first access through the lazy bot and api packages
+import api
+import bot
+from api import check_open_ai_key, check_open_weather_key, fork_guard, metrics
+from bot import create_conversation_store
 
 
-# setup chatbot
-agent, tools = setup_agent(model="gpt-4o-mini", temperature=0.5, verbose=False)
+# chatbot jobs run in separate processes, so caches and sessions are shared via SQLite databases by default
+cache_dir = os.getenv("CACHE_DIR", "cache")
+os.makedirs(cache_dir, exist_ok=True)
+os.environ.setdefault("CACHE_DB_PATH", os.path.join(cache_dir, "cache.db"))
+os.environ.setdefault("SESSION_DB_PATH", os.path.join(cache_dir, "sessions.db"))
+os.environ.setdefault("METRICS_DB_PATH", os.path.join(cache_dir, "metrics.db"))
+os.environ.setdefault("REQUEST_LOCK_PATH", os.path.join(cache_dir, "requests.lock"))
+os.environ.setdefault("ICON_CACHE_DIR", os.path.join(cache_dir, "icons"))
+
+# check if answers should be streamed token by token
+stream_responses = os.getenv("STREAM_RESPONSES", "true").lower() == "true"
+
+# check if simple questions about a single weather metric should be answered without the LLM
+fast_answers = os.getenv("FAST_ANSWERS", "true").lower() == "true"
+
+# check if API responses should be recorded for the replay in offline mode
+record_cassettes = os.getenv("RECORD_CASSETTES", "false").lower() == "true"
+
+# check if this is a background job, which is a process of the fork server that imports the app again
+background_job = multiprocess.parent_process() is not None
+
+# store the questions and answers of the chat of each session
+conversations = create_conversation_store()
 
 # check API keys
 open_ai_is_valid = check_open_ai_key()
@@ -19,6 +55,58 @@ open_weather_is_valid = check_open_weather_key()
 starting_mode = "offline" if not open_ai_is_valid or not open_weather_is_valid else "online"
 
 
+class Chatbot:
+    """Agents, sessions and answer cache of the chatbot.
+
+    Building them imports LangChain and the OpenAI client, which takes seconds, so it is done on first use or by a
+    warm-up thread while the layout is already served.
+    """
+    def __init__(self):
+        # setup chatbot
+        self.cassette = api.Cassette()
+        self.agent, self.tools = bot.setup_agent(model="gpt-4o-mini", temperature=0.5, verbose=False,
+                                                 streaming=stream_responses,
+                                                 cassette=self.cassette if record_cassettes else None)
+        self.sessions = bot.SessionStore(self.agent, k=4)
+
+        # cache answers to questions that do not need live weather data and precompute the answers to the examples
+        fuzzy_threshold = float(os.getenv("ANSWER_CACHE_FUZZY", "0")) or None
+        self.answer_cache = bot.AnswerCache(ttl=float(os.getenv("ANSWER_CACHE_TTL", 86400)),
+                                            fuzzy_threshold=fuzzy_threshold)
+        if starting_mode == "online" and not background_job:
+            bot.start_warm_up(self.answer_cache, PROMPT_EXAMPLES, self.sessions)
+
+    @cached_property
+    def replay_sessions(self) -> "bot.SessionStore":
+        """Get the sessions of the chatbot that replays recorded API responses in offline mode.
+
+        They are built on first use, since background jobs build the chatbot for each answer.
+        """
+        replay_agent, _ = bot.setup_agent(model="gpt-4o-mini", temperature=0.5, verbose=False,
+                                          cassette=self.cassette, replay=True)
+        return bot.SessionStore(replay_agent, k=4)
+
+
+_chatbot = None
+_chatbot_lock = threading.Lock()
+
+
+def get_chatbot() -> Chatbot:
+    """Get the chatbot and build it on first use."""
+    global _chatbot
+    # the lock is only taken until the chatbot exists
+    if _chatbot is None:
+        with _chatbot_lock:
+            if _chatbot is None:
+                _chatbot = Chatbot()
+    return _chatbot
+
+
+# build the chatbot in the background, set WARM_UP="false" to build it on the first question instead
+if os.getenv("WARM_UP", "true").lower() == "true" and not background_job:
+    threading.Thread(target=get_chatbot, daemon=True).start()
+
+
 def header(name: str, mode: str) -> dbc.Row:
     """Create the header of the website."""
 
@@ -45,7 +133,7 @@ def header(name: str, mode: str) -> dbc.Row:
     return dbc.Row([dbc.Col(title, md=8), dbc.Col([switch, select], md=4)])
 
 
-def textbox(text: str, box: str = "ai") -> dbc.Card | html.Div:
+def textbox(text: str, box: str = "ai", text_id: str = None) -> dbc.Card | html.Div:
     """Creates message boxes."""
 
     # Create the user message box
@@ -54,9 +142,8 @@ def textbox(text: str, box: str = "ai") -> dbc.Card | html.Div:
     # Create the AI message box
     elif box == "ai":
         bot_img = html.Img(src=app.get_asset_url("bot.png"), className="thumbnail")
-        card = dbc.Card(
-            dcc.Markdown(text, className="mgs-text"), body=True, inverse=False, className="ai-message message-box"
-        )
+        markdown = dcc.Markdown(text, className="mgs-text", **({"id": text_id} if text_id else {}))
+        card = dbc.Card(markdown, body=True, inverse=False, className="ai-message message-box")
         return html.Div([bot_img, card])
     # Raise an error if the box type is not recognized
     else:
@@ -67,8 +154,8 @@ def weather_card(title: str, temp: str = "--", cloud: str = "--", wind: str = "-
                  icon: str = "02d") -> dbc.Card:
     """Create a weather card for the forecast information column."""
 
-    # Get the weather icon
-    icon = html.Img(src=f"https://openweathermap.org/img/wn/{icon}@2x.png", className="weather-icons")
+    # Get the weather icon from the local icon route
+    icon = html.Img(src=app.get_relative_path(f"/icons/{icon}.png"), className="weather-icons")
 
     # Fill and return the weather card
     return dbc.Card(
@@ -129,6 +216,34 @@ def weather_card(title: str, temp: str = "--", cloud: str = "--", wind: str = "-
     )
 
 
+@lru_cache(maxsize=8)
+def forecast_dates(today: date) -> tuple[str, ...]:
+    """Create the titles of the weather cards for the next 7 days."""
+    dates = ["Today", "Tomorrow"]
+    dates.extend([(today + timedelta(days=i)).strftime("%A") for i in range(2, 7)])
+    return tuple(dates)
+
+
+@lru_cache(maxsize=256)
+def weather_cards(dates: tuple[str, ...], days: tuple[tuple, ...]) -> tuple[dbc.Card, ...]:
+    """Create the weather cards of the (temp, cloud, wind, rain, icon) values of each day or empty cards.
+
+    The cards are memoized, so that sessions that show the same forecast share them.
+    """
+    if not days:
+        return tuple(weather_card(day) for day in dates)
+    return tuple(weather_card(day, *values) for day, values in zip(dates, days))
+
+
+def message_position(number: int, box: str) -> int:
+    """Get the position of the message box of a question or answer by its number in the conversation display.
+
+    The boxes are set at fixed positions after the initial message instead of being appended, so that the order of the
+    conversation does not depend on the order in which the updates of questions and answers arrive.
+    """
+    return 2 * number - (1 if box == "user" else 0)
+
+
 def _update_display(questions: list, answers: list) -> list:
     """Update the display of the conversation."""
 
@@ -152,15 +267,94 @@ def _update_display(questions: list, answers: list) -> list:
 font = ("https://fonts.googleapis.com/css2?family=Poppins:ital,wght@0,100;0,200;0,300;0,400;0,500;0,600;0,700;0,800;"
         "0,900;1,100;1,200;1,300;1,400;1,500;1,600;1,700;1,800;1,900&display=swap")
 
+
+class GuardedDiskcache(diskcache.Cache):
+    """Cache of the background jobs whose SQLite calls run inside the fork guard.
+
+    The threads of the web server poll the jobs through this cache while processes like the warm-up are forked from it.
+    """
+    def get(self, *args, **kwargs):
+        with fork_guard:
+            return super().get(*args, **kwargs)
+
+    def set(self, *args, **kwargs):
+        with fork_guard:
+            return super().set(*args, **kwargs)
+
+    def touch(self, *args, **kwargs):
+        with fork_guard:
+            return super().touch(*args, **kwargs)
+
+    def delete(self, *args, **kwargs):
+        with fork_guard:
+            return super().delete(*args, **kwargs)
+
+    @contextmanager
+    def transact(self, retry: bool = False):
+        with fork_guard, super().transact(retry):
+            yield
+
+
+class ForkServerDiskcacheManager(DiskcacheManager):
+    """Manager of background callbacks that starts the jobs from a fork server instead of forking the web server.
+
+    A job forked from the web server copies the locks and the SQLite connections that its other threads hold at that
+    moment, which can hang the job. The fork server is a new single-threaded process that only imports the given
+    modules, so that the jobs do not import LangChain again. The jobs import the app again and build the chatbot.
+    """
+    def __init__(self, cache: diskcache.Cache, preload: list[str] = None):
+        super().__init__(cache)
+        self.context = multiprocess.get_context("forkserver")
+        self.context.set_forkserver_preload(preload or [])
+
+    def call_job_fn(self, key, job_fn, args, context):
+        process = self.context.Process(target=job_fn, args=(key, self._make_progress_key(key), args, context))
+        process.start()
+        return process.pid
+
+    def terminate_job(self, job):
+        # the job may exit between the checks of psutil
+        try:
+            super().terminate_job(job)
+        except psutil.NoSuchProcess:
+            pass
+
+    def job_running(self, job):
+        try:
+            return super().job_running(job)
+        except psutil.NoSuchProcess:
+            return False
+
+
+# Define the manager that runs background callbacks as separate processes
+background_manager = ForkServerDiskcacheManager(
+    GuardedDiskcache(os.path.join(cache_dir, "jobs")),
+    preload=["dash", "dash_bootstrap_components", "openai.resources", "bot.answers", "bot.chatbot", "bot.fast_answers",
+             "bot.sessions"]
+)
+
 # Define app, themes, icons, fonts, and title
-app = dash.Dash(__name__, external_stylesheets=[dbc.themes.LITERA, dbc.icons.FONT_AWESOME, font])
+app = dash.Dash(
+    __name__,
+    external_stylesheets=[dbc.themes.LITERA, dbc.icons.FONT_AWESOME, font],
+    background_callback_manager=background_manager,
+)
 app.title = "Weather Chatbot"
 server = app.server
 
 
-# Define the conversation display
+# Define the conversation display with a hidden message box for streamed answers
 conversation = html.Div(
-    html.Div(id="display-conversation"),
+    html.Div(
+        [
+            html.Div(id="display-conversation"),
+            html.Div(
+                textbox("", box="ai", text_id="streaming-text"),
+                id="streaming-answer",
+                style={"display": "none"}
+            ),
+        ]
+    ),
     style={
         "overflow-y": "auto",
         "display": "flex",
@@ -187,140 +381,136 @@ buttons = html.Div(
     className="d-grid gap-2 button-wrapper",
 )
 
+
+def serve_layout() -> html.Div:
+    """Create the main app layout with a new session id for each page load."""
+    return html.Div(
+        dbc.Container(
+            fluid=True,
+            children=[
+                html.Link(id='theme-css', rel='stylesheet', href='/assets/style.css'),
+                header("Weather Chatbot", starting_mode),
+                dbc.Alert(
+                    "The chatbot is running in Offline Mode!",
+                    color="warning",
+                    id="overlay-alert",
+                    is_open=True,
+                    duration=8000
+                ),
+                html.Hr(),
+                dbc.Row(
+                    [
+                        dbc.Col(
+                            [
+                                html.H2("Examples"),
+                                html.Div(
+                                    [
+                                        html.Hr(),
+                                        html.P("Click on any example to prefill the chatbox. Next, you can edit your \
+                                        prompt or submit your question directly!"),
+                                        html.Hr(),
+                                    ],
+                                    className="button-hint"
+                                ),
+                                buttons,
+                            ],
+                            width=3,
+                            className="button-column"
+                        ),
+                        dbc.Col(
+                            [
+                                dcc.Store(id="session-id", data=str(uuid4()), storage_type="memory"),
+                                dcc.Store(id="question-count", data=0, storage_type="memory"),
+                                dcc.Store(id="store-weather", data=None, storage_type="memory"),
+                                dcc.Store(id="store-cards", data=None, storage_type="memory"),
+                                dcc.Store(id="stream-status", data=None, storage_type="memory"),
+                                dcc.Store(id="stream-enabled", data=stream_responses and starting_mode == "online"),
+                                dcc.Store(id="stream-url", data=app.get_relative_path("/stream")),
+                                conversation,
+                                dbc.Spinner(
+                                    dcc.Store(id="answer-count", data=0, storage_type="memory"),
+                                    color="secondary",
+                                    id="msg-spinner",
+                                ),
+                                controls,
+                                html.Div(id="progress-message", className="progress-message"),
+                                dbc.Spinner(html.Div(id="loading-component"))
+                            ],
+                            className="chat-column"
+                        ),
+                        dbc.Col(
+                            [
+                                html.H2("7-Day Forecast"),
+                                dbc.Tooltip(
+                                    "This column will update automatically once you submit a question.",
+                                    target="weather-cards-wrapper-id",
+                                    placement="left",
+                                    delay={"show": 300, "hide": 100},
+                                ),
+                                html.Hr(),
+                                html.Div(
+                                    [
+                                        html.I(className="fas fa-location-dot small-icons"),
+                                        html.Span(id="location-name")
+                                    ],
+                                    className="location"
+                                ),
+                                html.Div(className="weather-cards-wrapper", id="weather-cards-wrapper-id"),
+                            ],
+                            width=3,
+                            className="forecast-column"
+                        ),
+                    ]
+                )
+            ]
+        ),
+        id="main-container"
+    )
+
+
 # Define the main app layout
-app.layout = html.Div(
-    dbc.Container(
-        fluid=True,
-        children=[
-            html.Link(id='theme-css', rel='stylesheet', href='/assets/style.css'),
-            header("Weather Chatbot", starting_mode),
-            dbc.Alert(
-                "The chatbot is running in Offline Mode!",
-                color="warning",
-                id="overlay-alert",
-                is_open=True,
-                duration=8000
-            ),
-            html.Hr(),
-            dbc.Row(
-                [
-                    dbc.Col(
-                        [
-                            html.H2("Examples"),
-                            html.Div(
-                                [
-                                    html.Hr(),
-                                    html.P("Click on any example to prefill the chatbox. Next, you can edit your \
-                                    prompt or submit your question directly!"),
-                                    html.Hr(),
-                                ],
-                                className="button-hint"
-                            ),
-                            buttons,
-                        ],
-                        width=3,
-                        className="button-column"
-                    ),
-                    dbc.Col(
-                        [
-                            dcc.Store(id="store-questions", data=[], storage_type="memory"),
-                            conversation,
-                            dbc.Spinner(
-                                dcc.Store(id="store-answers", data=[], storage_type="memory"),
-                                color="secondary",
-                                id="msg-spinner",
-                            ),
-                            controls,
-                            dbc.Spinner(html.Div(id="loading-component"))
-                        ],
-                        className="chat-column"
-                    ),
-                    dbc.Col(
-                        [
-                            html.H2("7-Day Forecast"),
-                            dbc.Tooltip(
-                                "This column will update automatically once you submit a question.",
-                                target="weather-cards-wrapper-id",
-                                placement="left",
-                                delay={"show": 300, "hide": 100},
-                            ),
-                            html.Hr(),
-                            html.Div(
-                                [
-                                    html.I(className="fas fa-location-dot small-icons"),
-                                    html.Span(id="location-name")
-                                ],
-                                className="location"
-                            ),
-                            html.Div(className="weather-cards-wrapper", id="weather-cards-wrapper-id"),
-                        ],
-                        width=3,
-                        className="forecast-column"
-                    ),
-                ]
-            )
-        ]
-    ),
-    id="main-container"
-)
+app.layout = serve_layout
 
 
 @callback(
     [
         Output("weather-cards-wrapper-id", "children"),
-        Output("location-name", "children")
+        Output("location-name", "children"),
+        Output("store-cards", "data")
     ],
-    [Input("store-answers", "data")],
-    [State("submit", "n_clicks")]
+    [Input("store-weather", "data")],
+    [State("store-cards", "data")],
 )
-def update_weather_cards(answer_history, n_clicks):
-    """Update the weather forecast cards."""
+def update_weather_cards(weather_data, cards_key):
+    """Update the weather forecast cards unless they already show the same forecast."""
 
     # Define dates for next 7 days
-    now = datetime.now(timezone(timedelta(hours=2)))
-    dates = ["Today", "Tomorrow"]
-    dates.extend([(now + timedelta(days=i)).strftime("%A") for i in range(2, 7)])
-
-    # Get the location and weather data from api wrapper
-    wrapper = tools[0].api_wrapper
-    location_data = wrapper.location
-    weather_data = wrapper.weather
+    dates = forecast_dates(datetime.now(timezone(timedelta(hours=2))).date())
 
-    # Check if location data is available
-    if (location_data is not None) and (answer_history != []):
+    # Get the location name and the values of the cards, or empty cards if no data is available
+    if weather_data is None:
+        location, days = "No location set.", ()
+    else:
+        location_data = weather_data["location"]
         location = location_data["name"]
         if location_data.get("state") is not None:
             location += f", {location_data['state']}"
         location += f", {location_data['country']}"
-    else:
-        location = "No location set."
-
-    # Return empty cards if no data is available
-    if (n_clicks is None) or (weather_data is None):
-        cards = [weather_card(day) for day in dates]
-        return cards, location
-
-    # Get the weather data
-    daily = weather_data["daily"]
-
-    # Get the icons
-    icons = wrapper.get_icon_ids()
-
-    # Fill the weather cards
-    cards = [
-        weather_card(
-            day,
-            round(data["temp"]["day"]),
-            round(data["clouds"]),
-            round(data["wind_speed"]),
-            round(data.get("rain", 0.0), 1),
-            icon
+        daily = api.WeatherSnapshot.from_dict(weather_data["weather"]).daily
+        days = tuple(
+            (round(temp), round(clouds), round(wind_speed), round(rain, 1), icon)
+            for temp, clouds, wind_speed, rain, icon in zip(
+                daily["temp_day"], daily["clouds"], daily["wind_speed"], daily["rain"], daily["icon"]
+            )
         )
-        for day, data, icon in zip(dates, daily, icons)
-    ]
 
-    # Return the weather cards and location
-    return cards, location
+    # Keep the cards if they already show the same values
+    key = hashlib.sha256(json.dumps([location, dates, days]).encode()).hexdigest()[:16]
+    if key == cards_key:
+        return dash.no_update, dash.no_update, dash.no_update
+
+    # Return the weather cards, location and key of the cards
+    return list(weather_cards(dates, days)), location, key
 
 
 @callback(
@@ -346,28 +536,50 @@ def on_button_click(*inputs):
 
 @callback(
     Output("display-conversation", "children"),
-    [Input("store-questions", "data")],
-    [State("store-answers", "data")],
+    [Input("question-count", "data")],
+    [State("session-id", "data")],
 )
-def update_display_questions(questions, answers):
-    """Update the display of the conversation when a new question is submitted."""
-    return _update_display(questions, answers)
+def update_display_questions(question_count, session_id):
+    """Show a newly submitted question in the conversation display or rebuild it on reset."""
+
+    # Rebuild the display if the conversation is reset
+    questions, answers = conversations.get(session_id)
+    if not question_count:
+        return _update_display(questions, answers)
+
+    # Set only the new message box, see message_position
+    patch = Patch()
+    patch[message_position(question_count, "user")] = textbox(questions[question_count - 1], box="user")
+    return patch
 
 
 @callback(
     Output("display-conversation", "children", allow_duplicate=True),
-    [Input("store-answers", "data")],
-    [State("store-questions", "data")],
+    [Input("answer-count", "data")],
+    [State("session-id", "data")],
     prevent_initial_call=True
 )
-def update_display_answers(answers, questions):
-    """Update the display of the conversation when a new answer is received."""
-    return _update_display(questions, answers)
+def update_display_answers(answer_count, session_id):
+    """Show a newly received answer and its question in the conversation display."""
+
+    # Ignore empty answer histories
+    if not answer_count:
+        return dash.no_update
+
+    # Update the summary of the conversation memory in the background once the answer is displayed
+    get_chatbot().sessions.summarize(session_id)
+
+    # Set the question as well, since its update may arrive after the answer, e.g. for fast or cached answers
+    questions, answers = conversations.get(session_id)
+    patch = Patch()
+    patch[message_position(answer_count, "user")] = textbox(questions[answer_count - 1], box="user")
+    patch[message_position(answer_count, "ai")] = textbox(answers[answer_count - 1], box="ai")
+    return patch
 
 
 @callback(
     [
-        Output("store-questions", "data"),
+        Output("question-count", "data"),
         Output("user-input", "value")
     ],
     [
@@ -376,79 +588,258 @@ def update_display_answers(answers, questions):
     ],
     [
         State("user-input", "value"),
-        State("store-questions", "data")
+        State("session-id", "data")
     ],
 )
-def update_conversation(n_clicks, n_submit, user_input, question_history):
-    """Update the conversation history with new questions."""
+def update_conversation(n_clicks, n_submit, user_input, session_id):
+    """Store new questions on the server and update the question count of the session."""
 
-    # Return empty question history if no questions are submitted
+    # Reset the conversation if no questions are submitted
     if n_clicks == 0:
-        return [], ""
+        conversations.clear(session_id)
+        return 0, ""
 
-    # Return the old question history if empty input is submitted
+    # Keep the old question history if empty input is submitted
     if user_input is None or user_input == "":
-        return question_history, ""
+        return dash.no_update, ""
 
     # Append the new question to the question history
-    question_history.append(user_input)
-    return question_history, ""
+    return conversations.add_question(session_id, user_input), ""
 
 
-@callback(
-    Output("store-answers", "data"),
-    [
-        Input("submit", "n_clicks"),
-        Input("user-input", "n_submit")
-    ],
-    [
-        State("user-input", "value"),
-        State("store-answers", "data"),
-        State("offline-switch", "value"),
-    ],
-)
-def run_chatbot(n_clicks, n_submit, user_input, answer_history, offline_mode):
-    """Runs the chatbot in online or offline mode and returns the answer history."""
+def answer_question(set_progress, user_input, question_count, offline_mode, session_id):
+    """Runs the chatbot in online or offline mode and returns the answer count and the latest weather data."""
 
-    # Return old answer history if no questions are submitted
+    # Keep the old answer history if no questions are submitted
     if user_input is None or user_input == "":
-        return answer_history
+        return dash.no_update, dash.no_update
 
-    # Return default message if chatbot is running in offline mode
+    # Store the answer to the submitted question, earlier questions whose jobs were cancelled get a placeholder
+    def answer(text: str) -> int:
+        return conversations.set_answer(session_id, question_count, text)
+
+    # Get the agent of the current session and collect the weather data of this request
+    chatbot = get_chatbot()
+    agent = chatbot.sessions.get(session_id)
+    collector = bot.WeatherDataCollector()
+    progress = bot.ProgressHandler(set_progress)
+
+    # Replay recorded API responses if chatbot is running in offline mode
     if len(offline_mode) == 1:
-        sleep(1)
-        answer_history.append("The weather is nice today!")
-        return answer_history
+        # Return default message if nothing was recorded
+        if not chatbot.cassette.has_recordings():
+            sleep(1)
+            return answer("The weather is nice today!"), dash.no_update
+        try:
+            response = bot.query_llm(chatbot.replay_sessions.get(session_id), user_input,
+                                     callbacks=[collector, progress])
+        except Exception:
+            response = "There is no recorded answer to this question. Please try another question in 'Offline Mode'."
+        weather_data = collector.weather_data[-1] if collector.weather_data else dash.no_update
+        return answer(response), weather_data
     # Return warning message if OpenAI API key is missing
     elif not open_ai_is_valid:
-        answer_history.append(
+        return answer(
             "It seems that your OpenAI API key is missing. Please provide valid API keys to chat with the bot or \
             enable 'Offline Mode'."
-        )
-        return answer_history
+        ), dash.no_update
     # Return warning message if OpenWeatherMap API key is missing
     elif not open_weather_is_valid:
         warning = ("It seems that your OpenWeatherMap API key is missing or invalid. "
                    "Please provide valid API keys to get real-time weather data.")
         # Try to query the chatbot without real-time weather data
         try:
-            response = query_llm(agent, user_input)
+            response = bot.query_llm(agent, user_input, callbacks=[progress])
         except Exception as e:
             response = str(e)
         # Append the response and warning message to the answer history
         res = f"{response}\n\n**Note:** {warning}"
-        answer_history.append(res)
-        return answer_history
+        return answer(res), dash.no_update
     # Run the chatbot in online mode
     else:
-        # Try to query the chatbot
+        # Try to answer simple questions directly or query the chatbot
         try:
-            response = query_llm(agent, user_input)
+            fast = bot.fast_answer(agent, user_input) if fast_answers else None
+            if fast is not None:
+                response = fast[0]
+                collector.weather_data.append(fast[1])
+            else:
+                response = bot.cached_query_llm(chatbot.answer_cache, agent, user_input,
+                                                callbacks=[collector, progress])
         # Return error message if an exception occurs
         except Exception as e:
             response = f"**Oops! Something went wrong:** \n\n{e}"
-        answer_history.append(response)
-        return answer_history
+        # Return the data of the latest weather request
+        weather_data = collector.weather_data[-1] if collector.weather_data else dash.no_update
+        return answer(response), weather_data
+
+
+# Define the outputs, inputs and states of the callback that runs the chatbot
+chatbot_callback = dict(
+    output=[
+        Output("answer-count", "data"),
+        Output("store-weather", "data"),
+    ],
+    inputs=[
+        Input("submit", "n_clicks"),
+        Input("user-input", "n_submit")
+    ],
+    state=[
+        State("user-input", "value"),
+        State("question-count", "data"),
+        State("offline-switch", "value"),
+        State("session-id", "data"),
+    ],
+    running=[(Output("progress-message", "style"), {"display": "block"}, {"display": "none"})],
+    prevent_initial_call=True,
+)
+
+# Streamed answers are left to the streaming route, so the callback only answers in offline mode or without API keys
+if stream_responses:
+    @callback(**chatbot_callback)
+    def run_chatbot(n_clicks, n_submit, user_input, question_count, offline_mode, session_id):
+        """Runs the chatbot in offline mode or without API keys in the web server."""
+        if len(offline_mode) != 1 and open_ai_is_valid and open_weather_is_valid:
+            return dash.no_update, dash.no_update
+        with metrics.trace(mode="callback"):
+            return answer_question(lambda progress: None, user_input, question_count, offline_mode, session_id)
+else:
+    @callback(
+        **chatbot_callback,
+        background=True,
+        progress=Output("progress-message", "children"),
+        progress_default="",
+        cancel=[Input("submit", "n_clicks"), Input("user-input", "n_submit")],
+    )
+    def run_chatbot(set_progress, n_clicks, n_submit, user_input, question_count, offline_mode, session_id):
+        """Runs the chatbot as background job."""
+        # the job is pickled for the fork server, so the trace is not added by a decorator
+        with metrics.trace(mode="background"):
+            result = answer_question(set_progress, user_input, question_count, offline_mode, session_id)
+        # the job is killed once its result is fetched, so its metrics are written before
+        metrics.flush()
+        return result
+
+
+@server.route("/stream", methods=["POST"])
+def stream_answer():
+    """Stream the answer of the chatbot token by token as server-sent events."""
+
+    # Get the question and the agent of the current session
+    body = request.get_json(force=True)
+    session_id = body["session_id"]
+    chatbot = get_chatbot()
+    agent = chatbot.sessions.get(session_id)
+    collector = bot.WeatherDataCollector()
+
+    def events():
+        with metrics.trace(mode="stream"):
+            yield from answer_events()
+
+    def answer_events():
+        # Answer simple questions directly or stream the answer of the chatbot
+        answer = None
+        try:
+            fast = bot.fast_answer(agent, body["question"]) if fast_answers else None
+            if fast is not None:
+                stream = [("token", fast[0]), ("done", {"output": fast[0]})]
+                collector.weather_data.append(fast[1])
+            else:
+                stream = bot.cached_stream_llm(chatbot.answer_cache, agent, body["question"], callbacks=[collector])
+            for kind, data in stream:
+                # Send the tokens as they arrive
+                if kind == "token":
+                    yield f"event: token\ndata: {json.dumps(data)}\n\n"
+                elif kind == "done":
+                    answer = data["output"]
+                else:
+                    answer = f"**Oops! Something went wrong:** \n\n{data}"
+        # Always end the stream with an answer, so that the conversation never waits for it
+        except Exception as e:
+            answer = f"**Oops! Something went wrong:** \n\n{e}"
+        if answer is None:
+            answer = "**Oops! Something went wrong:** \n\nThe answer ended unexpectedly."
+
+        # Store the answer on the server and send the new answer count and the data of the latest weather request
+        answer_count = conversations.set_answer(session_id, body["index"], answer)
+        weather_data = collector.weather_data[-1] if collector.weather_data else None
+        yield f"event: done\ndata: {json.dumps({'answer_count': answer_count, 'weather': weather_data})}\n\n"
+
+    headers = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    return Response(stream_with_context(events()), mimetype="text/event-stream", headers=headers)
+
+
+_icon_store = None
+
+
+def get_icon_store():
+    """Get the store of the weather icons and create it on first use."""
+    global _icon_store
+    if _icon_store is None:
+        _icon_store = api.IconStore()
+    return _icon_store
+
+
+@server.route("/icons/<icon>.png")
+def weather_icon(icon: str) -> Response:
+    """Serve a weather icon from the local icon store with long-lived cache headers."""
+    if icon not in api.ICON_IDS:
+        return Response("Unknown icon", status=404, mimetype="text/plain")
+
+    # fall back to the icon of OpenWeatherMap if it cannot be fetched
+    entry = get_icon_store().get(icon)
+    if entry is None:
+        return redirect(get_icon_store().source_url(icon))
+
+    # the icon of an id never changes, so browsers may cache it without revalidation
+    image, etag = entry
+    response = Response(image, mimetype="image/png")
+    response.set_etag(etag)
+    response.cache_control.public = True
+    response.cache_control.max_age = 31536000
+    response.cache_control.immutable = True
+    return response.make_conditional(request)
+
+
+@server.route("/metrics")
+def metrics_endpoint():
+    """Expose the metrics of the chatbot in the Prometheus text format."""
+    return Response(metrics.render(), mimetype="text/plain; version=0.0.4")
+
+
+@server.before_request
+def start_timer():
+    """Remember the start time of a request."""
+    g.start = time.perf_counter()
+
+
+@server.after_request
+def record_callback_duration(response: Response) -> Response:
+    """Record the duration of Dash callback requests by their first output."""
+    if request.path == "/_dash-update-component" and "start" in g:
+        output = (request.get_json(silent=True) or {}).get("output", "")
+        name = output.strip(".").split(".")[0]
+        metrics.observe("chatbot_callback_duration_seconds", time.perf_counter() - g.start, callback=name)
+    return response
+
+
+clientside_callback(
+    ClientsideFunction(namespace="chatbot", function_name="streamAnswer"),
+    Output("stream-status", "data"),
+    [
+        Input("submit", "n_clicks"),
+        Input("user-input", "n_submit")
+    ],
+    [
+        State("user-input", "value"),
+        State("question-count", "data"),
+        State("offline-switch", "value"),
+        State("session-id", "data"),
+        State("stream-enabled", "data"),
+        State("stream-url", "data"),
+    ],
+    prevent_initial_call=True
+)
 
 
 @callback(
@@ -0,0 +1,84 @@
+// Stream answers of the chatbot token by token into the hidden AI message box
+window.dash_clientside = Object.assign({}, window.dash_clientside, {
+    chatbot: {
+        streamAnswer: function (nClicks, nSubmit, question, questionCount, offlineMode, sessionId, enabled, url) {
+            const noUpdate = window.dash_clientside.no_update;
+
+            // Let the server callback answer in offline mode or if streaming is disabled
+            if (!enabled || !question || offlineMode.length === 1) {
+                return noUpdate;
+            }
+
+            const setProps = window.dash_clientside.set_props;
+            const decoder = new TextDecoder();
+            let text = "";
+            let buffer = "";
+            let finished = false;
+
+            // Show the streamed answer in the message box
+            function showText(value) {
+                setProps("streaming-text", {children: value});
+                setProps("streaming-answer", {style: value ? {} : {display: "none"}});
+            }
+
+            // Handle a single server-sent event
+            function handleEvent(raw) {
+                let kind = "message";
+                let data = "";
+                raw.split("\n").forEach(function (line) {
+                    if (line.startsWith("event: ")) {
+                        kind = line.slice(7);
+                    } else if (line.startsWith("data: ")) {
+                        data += line.slice(6);
+                    }
+                });
+                if (kind === "token") {
+                    text += JSON.parse(data);
+                    showText(text);
+                } else if (kind === "done") {
+                    const result = JSON.parse(data);
+                    finished = true;
+                    showText("");
+                    setProps("answer-count", {data: result.answer_count});
+                    if (result.weather) {
+                        setProps("store-weather", {data: result.weather});
+                    }
+                }
+            }
+
+            // Read the event stream and split it into events
+            function read(reader) {
+                return reader.read().then(function (chunk) {
+                    if (chunk.done) {
+                        if (!finished) {
+                            throw new Error("The answer ended unexpectedly.");
+                        }
+                        return;
+                    }
+                    buffer += decoder.decode(chunk.value, {stream: true});
+                    let index;
+                    while ((index = buffer.indexOf("\n\n")) >= 0) {
+                        handleEvent(buffer.slice(0, index));
+                        buffer = buffer.slice(index + 2);
+                    }
+                    return read(reader);
+                });
+            }
+
+            fetch(url, {
+                method: "POST",
+                headers: {"Content-Type": "application/json"},
+                body: JSON.stringify({question: question, session_id: sessionId, index: questionCount}),
+            }).then(function (response) {
+                if (!response.ok) {
+                    throw new Error("The server responded with " + response.status + " " + response.statusText + ".");
+                }
+                return read(response.body.getReader());
+            }).catch(function (error) {
+                showText("**Oops! Something went wrong:** \n\n" + error);
+            });
+
+            return Date.now();
+        }
+    }
+});
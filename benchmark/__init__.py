@@ -0,0 +1,2 @@
+from .servers import *
+from .load import *
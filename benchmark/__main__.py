@@ -0,0 +1,79 @@
+"""Run local stand-ins for the OpenAI and OpenWeatherMap APIs or drive a running app with concurrent sessions.
+
+Usage:
+    python -m benchmark servers [--llm-latency 0.5] [--owm-latency 0.1] [--error-rate 0.0] ...
+    python -m benchmark load [--url http://127.0.0.1:8050] [--sessions 10] [--turns 3] [--mode stream] [--json]
+"""
+import json
+import time
+import argparse
+from .servers import FakeOpenAIServer, FakeOpenWeatherMapServer
+from .load import LoadGenerator
+
+
+def run_servers(args: argparse.Namespace) -> None:
+    """Serve the fake APIs until interrupted."""
+    errors = {"jitter": args.jitter, "error_rate": args.error_rate, "error_status": args.error_status}
+    openai = FakeOpenAIServer(args.host, args.openai_port, args.llm_latency, answer_words=args.answer_words,
+                              token_latency=args.token_latency, **errors).start()
+    owm = FakeOpenWeatherMapServer(args.host, args.owm_port, args.owm_latency, **errors).start()
+    print("Start the app with the following environment variables:")
+    print(f'OPENAI_BASE_URL="{openai.url}/v1" OPENWEATHERMAP_BASE_URL="{owm.url}"')
+    print(f'OPENAI_API_KEY="{"x" * 16}" OPENWEATHERMAP_API_KEY="{"x" * 16}"')
+    print('OPENWEATHERMAP_CALLS_PER_MINUTE="0" OPENWEATHERMAP_CALLS_PER_DAY="0"', flush=True)
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        print(f"OpenAI: {openai.requests} requests, {openai.errors} errors")
+        print(f"OpenWeatherMap: {owm.requests} requests, {owm.errors} errors")
+
+
+def run_load(args: argparse.Namespace) -> None:
+    """Drive the app and print the report."""
+    report = LoadGenerator(args.url, args.sessions, args.turns, mode=args.mode).run()
+    if args.json:
+        print(json.dumps(report))
+        return
+    print(f"{report['turns']} turns of {report['sessions']} sessions in {report['duration']:.2f} s "
+          f"({report['errors']} errors), {report['throughput']:.2f} turns/s")
+    print(f"Latency:     p50 {report['p50']:.3f} s, p95 {report['p95']:.3f} s, p99 {report['p99']:.3f} s")
+    if "first_token_p50" in report:
+        print(f"First token: p50 {report['first_token_p50']:.3f} s, p95 {report['first_token_p95']:.3f} s, "
+              f"p99 {report['first_token_p99']:.3f} s")
+    if "first_error" in report:
+        print(f"First error: {report['first_error']}")
+
+
+def main():
+    parser = argparse.ArgumentParser(prog="python -m benchmark", description="Benchmark the chatbot offline.")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    servers = commands.add_parser("servers", help="Run local stand-ins for the OpenAI and OpenWeatherMap APIs.")
+    servers.add_argument("--host", default="127.0.0.1", help="Host of the servers.")
+    servers.add_argument("--openai-port", type=int, default=8001, help="Port of the OpenAI server.")
+    servers.add_argument("--owm-port", type=int, default=8002, help="Port of the OpenWeatherMap server.")
+    servers.add_argument("--llm-latency", type=float, default=0.5, help="Seconds until the LLM responds.")
+    servers.add_argument("--token-latency", type=float, default=0.01, help="Seconds per streamed word.")
+    servers.add_argument("--answer-words", type=int, default=40, help="Words per answer of the LLM.")
+    servers.add_argument("--owm-latency", type=float, default=0.1, help="Seconds until OpenWeatherMap responds.")
+    servers.add_argument("--jitter", type=float, default=0.0, help="Random extra latency in seconds.")
+    servers.add_argument("--error-rate", type=float, default=0.0, help="Probability of an injected error.")
+    servers.add_argument("--error-status", type=int, default=500, help="Status code of injected errors.")
+    servers.set_defaults(run=run_servers)
+
+    load = commands.add_parser("load", help="Drive a running app with concurrent sessions.")
+    load.add_argument("--url", default="http://127.0.0.1:8050", help="URL of the running app.")
+    load.add_argument("--sessions", type=int, default=10, help="Number of concurrent sessions.")
+    load.add_argument("--turns", type=int, default=3, help="Questions per session.")
+    load.add_argument("--mode", choices=["stream", "callback"], default="stream",
+                      help="Get answers from the /stream route or the background callback.")
+    load.add_argument("--json", action="store_true", help="Print the report as JSON.")
+    load.set_defaults(run=run_load)
+
+    args = parser.parse_args()
+    args.run(args)
+
+
+if __name__ == "__main__":
+    main()
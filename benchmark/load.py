@@ -0,0 +1,171 @@
+import json
+import time
+import requests
+import threading
+from uuid import uuid4
+from concurrent.futures import ThreadPoolExecutor
+from prompts import PROMPT_EXAMPLES
+
+
+def percentile(values: list[float], q: float) -> float:
+    """Get the q-th percentile of values with the nearest-rank method."""
+    if not values:
+        return float("nan")
+    ranked = sorted(values)
+    return ranked[max(0, min(len(ranked) - 1, round(q / 100 * len(ranked) + 0.5) - 1))]
+
+
+class LoadGenerator:
+    """Load generator that drives the Dash callbacks of a running chatbot app with concurrent sessions.
+
+    Each session submits `turns` questions one after another like a browser does: the question callback, then the
+    answer as streamed by the /stream route in "stream" mode or as background callback in "callback" mode, and finally
+    the callback that displays the answer. The latency of a turn is the time from submitting the question until the
+    answer is displayed.
+    """
+    def __init__(self, url: str = "http://127.0.0.1:8050", sessions: int = 10, turns: int = 3,
+                 questions: list[str] = None, mode: str = "stream", timeout: float = 120, poll_interval: float = 0.1):
+        self.url = url.rstrip("/")
+        self.sessions = sessions
+        self.turns = turns
+        self.questions = questions or PROMPT_EXAMPLES
+        self.mode = mode
+        self.timeout = timeout
+        self.poll_interval = poll_interval
+        self.callbacks = []
+        self._lock = threading.Lock()
+        self._results = []
+
+    def load_callbacks(self) -> None:
+        """Get the specs of the callbacks of the app."""
+        response = requests.get(f"{self.url}/_dash-dependencies", timeout=self.timeout)
+        response.raise_for_status()
+        self.callbacks = response.json()
+
+    def find_callback(self, output: str, trigger: str) -> dict:
+        """Get the spec of the callback that outputs a component property first and is triggered by another."""
+        for spec in self.callbacks:
+            first = spec["output"].strip(".").split("...")[0].split("@")[0]
+            inputs = [f"{i['id']}.{i['property']}" for i in spec["inputs"]]
+            if first == output and trigger in inputs:
+                return spec
+        raise KeyError(f"No callback outputs {output} on changes of {trigger}")
+
+    def dispatch(self, http: requests.Session, output: str, trigger: str, values: dict) -> dict | None:
+        """Call the callback of an output on a change of the trigger with the given component property values.
+
+        Background callbacks are polled until their job has finished.
+        """
+        spec = self.find_callback(output, trigger)
+        outputs = []
+        for item in spec["output"].strip(".").split("..."):
+            component, prop = item.split(".", 1)
+            outputs.append({"id": component, "property": prop})
+        payload = {
+            "output": spec["output"],
+            "outputs": outputs if len(outputs) > 1 else outputs[0],
+            "inputs": [{**i, "value": values.get(f"{i['id']}.{i['property']}")} for i in spec["inputs"]],
+            "state": [{**s, "value": values.get(f"{s['id']}.{s['property']}")} for s in spec["state"]],
+            "changedPropIds": [trigger],
+        }
+        params = None
+        deadline = time.monotonic() + self.timeout
+        while True:
+            response = http.post(f"{self.url}/_dash-update-component", json=payload, params=params,
+                                 timeout=self.timeout)
+            response.raise_for_status()
+            if response.status_code == 204:
+                return None
+            data = response.json()
+            if "response" in data or "cacheKey" not in data and params is None:
+                return data.get("response", data)
+            if params is None:
+                params = {"cacheKey": data["cacheKey"], "job": data["job"]}
+            if time.monotonic() > deadline:
+                raise TimeoutError(f"Background callback of {output} did not finish in time")
+            time.sleep(self.poll_interval)
+
+    def stream(self, http: requests.Session, question: str, session_id: str, index: int) -> tuple[int, float]:
+        """Stream the answer to a question and get the answer count and the time until the first token."""
+        start = time.perf_counter()
+        first_token = None
+        body = {"question": question, "session_id": session_id, "index": index}
+        with http.post(f"{self.url}/stream", json=body, stream=True, timeout=self.timeout) as response:
+            response.raise_for_status()
+            kind = None
+            for line in response.iter_lines(decode_unicode=True):
+                if line.startswith("event: "):
+                    kind = line[7:]
+                elif line.startswith("data: "):
+                    if kind == "token" and first_token is None:
+                        first_token = time.perf_counter() - start
+                    if kind == "done":
+                        return json.loads(line[6:])["answer_count"], first_token
+        raise RuntimeError("Stream ended without an answer")
+
+    def turn(self, http: requests.Session, session_id: str, n: int, question: str) -> dict:
+        """Submit the n-th question of a session and wait until the answer is displayed."""
+        # the answer callbacks get the question count before the submit as index of the new question
+        values = {"submit.n_clicks": n, "user-input.value": question, "session-id.data": session_id,
+                  "offline-switch.value": [], "user-input.n_submit": None, "question-count.data": n - 1}
+        start = time.perf_counter()
+
+        # submit the question and display it
+        response = self.dispatch(http, "question-count.data", "submit.n_clicks", values)
+        question_count = response["question-count"]["data"]
+        self.dispatch(http, "display-conversation.children", "question-count.data",
+                      {**values, "question-count.data": question_count})
+
+        # get the answer and display it
+        first_token = None
+        if self.mode == "stream":
+            answer_count, first_token = self.stream(http, question, session_id, n - 1)
+        else:
+            response = self.dispatch(http, "answer-count.data", "submit.n_clicks", values)
+            answer_count = response["answer-count"]["data"]
+        values["answer-count.data"] = answer_count
+        self.dispatch(http, "display-conversation.children", "answer-count.data", values)
+        return {"latency": time.perf_counter() - start, "first_token": first_token}
+
+    def session(self, number: int) -> None:
+        """Run the turns of a single session."""
+        http = requests.Session()
+        session_id = str(uuid4())
+        for n in range(1, self.turns + 1):
+            question = self.questions[(number * self.turns + n) % len(self.questions)]
+            try:
+                result = self.turn(http, session_id, n, question)
+            except Exception as e:
+                result = {"error": f"{type(e).__name__}: {e}"}
+            with self._lock:
+                self._results.append(result)
+
+    def run(self) -> dict:
+        """Run all sessions concurrently and report the latency percentiles and throughput."""
+        self.load_callbacks()
+        self._results = []
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=self.sessions) as executor:
+            list(executor.map(self.session, range(self.sessions)))
+        duration = time.perf_counter() - start
+
+        latencies = [r["latency"] for r in self._results if "latency" in r]
+        first_tokens = [r["first_token"] for r in self._results if r.get("first_token") is not None]
+        errors = [r["error"] for r in self._results if "error" in r]
+        report = {
+            "mode": self.mode,
+            "sessions": self.sessions,
+            "turns": len(self._results),
+            "errors": len(errors),
+            "duration": round(duration, 3),
+            "throughput": round(len(latencies) / duration, 3),
+        }
+        for q in (50, 95, 99):
+            report[f"p{q}"] = round(percentile(latencies, q), 3)
+        if first_tokens:
+            for q in (50, 95, 99):
+                report[f"first_token_p{q}"] = round(percentile(first_tokens, q), 3)
+        if errors:
+            report["first_error"] = errors[0]
+        return report
+
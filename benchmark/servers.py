@@ -0,0 +1,297 @@
+import re
+import json
+import time
+import random
+import hashlib
+import threading
+from typing import Iterator
+from urllib.parse import urlparse, parse_qs
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# City in a question as the fake LLM detects it, e.g. "in New York City"
+CITY_PATTERN = re.compile(r"\b(?:in|for|at)\s+([A-Z][\w-]*(?:\s+(?:am|de|[A-Z][\w-]*))*)")
+
+# Weather conditions of the fake weather data with their OpenWeatherMap icons
+CONDITIONS = [
+    ("clear sky", "01"),
+    ("few clouds", "02"),
+    ("scattered clouds", "03"),
+    ("overcast clouds", "04"),
+    ("light rain", "10"),
+    ("thunderstorm", "11"),
+    ("snow", "13"),
+]
+
+
+class FakeServer:
+    """Local stand-in for an HTTP API that serves requests on a background thread.
+
+    Each response is delayed by `latency` plus up to `jitter` seconds and fails with `error_status` with the
+    probability `error_rate`. Subclasses implement `handle`.
+    """
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, latency: float = 0.0, jitter: float = 0.0,
+                 error_rate: float = 0.0, error_status: int = 500, seed: int | None = None):
+        self.host = host
+        self.port = port
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.random = random.Random(seed)
+        self.requests = 0
+        self.errors = 0
+        self._server = None
+        self._lock = threading.Lock()
+
+    @property
+    def url(self) -> str:
+        """Get the base URL of the server."""
+        return f"http://{self.host}:{self.port}"
+
+    def start(self) -> "FakeServer":
+        """Start serving requests on a background thread."""
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_GET(self):
+                fake.respond(self)
+
+            def do_POST(self):
+                fake.respond(self)
+
+            def log_message(self, *args):
+                pass
+
+        self._server = ThreadingHTTPServer((self.host, self.port), Handler)
+        self._server.daemon_threads = True
+        self.port = self._server.server_port
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self) -> None:
+        """Stop serving requests."""
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+    def __enter__(self) -> "FakeServer":
+        return self.start()
+
+    def __exit__(self, *exc) -> None:
+        self.stop()
+
+    def respond(self, request: BaseHTTPRequestHandler) -> None:
+        """Answer a request after the configured latency with the result of `handle` or an injected error."""
+        url = urlparse(request.path)
+        query = {key: values[-1] for key, values in parse_qs(url.query).items()}
+        length = int(request.headers.get("Content-Length", 0))
+        body = json.loads(request.rfile.read(length)) if length else None
+
+        # delay the response and inject errors
+        with self._lock:
+            self.requests += 1
+            delay = self.latency + self.random.uniform(0, self.jitter)
+            failed = self.random.random() < self.error_rate
+            self.errors += failed
+        time.sleep(delay)
+        if failed:
+            status, content = self.error_status, {"error": {"message": "Injected error", "code": self.error_status}}
+        else:
+            status, content = self.handle(request.command, url.path, query, body)
+
+        # send json content at once and streams as server-sent events
+        if isinstance(content, (dict, list)):
+            data = json.dumps(content).encode()
+            request.send_response(status)
+            request.send_header("Content-Type", "application/json")
+            request.send_header("Content-Length", str(len(data)))
+            request.end_headers()
+            request.wfile.write(data)
+            return
+        request.send_response(status)
+        request.send_header("Content-Type", "text/event-stream")
+        request.send_header("Connection", "close")
+        request.end_headers()
+        request.close_connection = True
+        for event in content:
+            request.wfile.write(f"data: {event}\n\n".encode())
+            request.wfile.flush()
+
+    def handle(self, method: str, path: str, query: dict, body: dict | None) -> tuple[int, dict | list | Iterator]:
+        """Get the status and the json content or the stream of server-sent events of a response."""
+        raise NotImplementedError
+
+
+class FakeOpenAIServer(FakeServer):
+    """Local stand-in for the chat completions endpoint of the OpenAI API.
+
+    Questions that mention a city are answered with a call of the first tool, all other messages with an answer of
+    `answer_words` words that is streamed with `token_latency` seconds per word. The agent uses this server if
+    OPENAI_BASE_URL is set to `url` + "/v1".
+    """
+    def __init__(self, *args, answer_words: int = 40, token_latency: float = 0.01, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.answer_words = answer_words
+        self.token_latency = token_latency
+
+    def handle(self, method: str, path: str, query: dict, body: dict | None) -> tuple[int, dict | Iterator]:
+        """Answer chat completion requests."""
+        if method != "POST" or not path.endswith("/chat/completions"):
+            return 404, {"error": {"message": f"Unknown endpoint {path}"}}
+
+        # call the tool if the question mentions a city, otherwise answer with text
+        messages = body["messages"]
+        last = messages[-1]
+        match = CITY_PATTERN.search(last.get("content") or "") if last["role"] == "user" else None
+        if match and body.get("tools"):
+            name = body["tools"][0]["function"]["name"]
+            arguments = json.dumps({"city": match.group(1)})
+            call = {"id": f"call_{self.random.getrandbits(48):x}", "type": "function",
+                    "function": {"name": name, "arguments": arguments}}
+            message, words = {"role": "assistant", "content": None, "tool_calls": [call]}, [arguments]
+        else:
+            words = self.answer(last.get("content") or "")
+            message = {"role": "assistant", "content": "".join(words)}
+        usage = {
+            "prompt_tokens": sum(len(str(m.get("content") or "")) for m in messages) // 4 + 1,
+            "completion_tokens": len(words),
+        }
+        usage["total_tokens"] = usage["prompt_tokens"] + usage["completion_tokens"]
+
+        # send the full completion or stream it
+        completion = {
+            "id": f"chatcmpl-{self.random.getrandbits(64):x}",
+            "created": int(time.time()),
+            "model": body.get("model", "gpt-4o-mini"),
+        }
+        finish_reason = "tool_calls" if "tool_calls" in message else "stop"
+        if not body.get("stream"):
+            choice = {"index": 0, "message": message, "finish_reason": finish_reason, "logprobs": None}
+            return 200, {**completion, "object": "chat.completion", "choices": [choice], "usage": usage}
+        include_usage = (body.get("stream_options") or {}).get("include_usage", False)
+        return 200, self.stream({**completion, "object": "chat.completion.chunk"}, message, words, finish_reason,
+                                usage if include_usage else None)
+
+    def answer(self, text: str) -> list[str]:
+        """Create the words of an answer that repeats the words of a message."""
+        source = re.findall(r"[A-Za-z]+", text) or ["weather"]
+        return [f"{source[i % len(source)]} " for i in range(self.answer_words - 1)] + ["."]
+
+    def stream(self, chunk: dict, message: dict, words: list[str], finish_reason: str,
+               usage: dict | None) -> Iterator[str]:
+        """Stream a message as chat completion chunks."""
+        def event(delta: dict, reason: str | None = None) -> str:
+            choice = {"index": 0, "delta": delta, "finish_reason": reason, "logprobs": None}
+            return json.dumps({**chunk, "choices": [choice]})
+
+        yield event({"role": "assistant", "content": ""})
+        if "tool_calls" in message:
+            call = message["tool_calls"][0]
+            yield event({"tool_calls": [{"index": 0, **call}]})
+        else:
+            for word in words:
+                time.sleep(self.token_latency)
+                yield event({"content": word})
+        yield event({}, finish_reason)
+        if usage is not None:
+            yield json.dumps({**chunk, "choices": [], "usage": usage})
+        yield "[DONE]"
+
+
+class FakeOpenWeatherMapServer(FakeServer):
+    """Local stand-in for the geocoding and One Call endpoints of the OpenWeatherMap API.
+
+    Locations and weather data are made up but stable for the same city and coordinates. The weather wrapper uses
+    this server if OPENWEATHERMAP_BASE_URL is set to `url`.
+    """
+    def handle(self, method: str, path: str, query: dict, body: dict | None) -> tuple[int, dict | list]:
+        """Answer geocoding and One Call requests."""
+        if "appid" not in query:
+            return 401, {"cod": 401, "message": "Invalid API key."}
+        if path == "/geo/1.0/direct":
+            return 200, self.locations(query.get("q", ""))
+        if path == "/data/3.0/onecall":
+            exclude = query.get("exclude", "").split(",")
+            return 200, self.weather(float(query["lat"]), float(query["lon"]), exclude)
+        return 404, {"cod": 404, "message": "Internal error"}
+
+    @staticmethod
+    def locations(q: str) -> list[dict]:
+        """Make up the location of a city."""
+        city, *codes = [part.strip() for part in q.split(",")]
+        if not city:
+            return []
+        digest = hashlib.sha256(city.casefold().encode()).digest()
+        location = {
+            "name": city,
+            "local_names": {"en": city},
+            "lat": round(digest[0] / 255 * 140 - 70, 4),
+            "lon": round(digest[1] / 255 * 360 - 180, 4),
+            "country": codes[-1].upper() if codes else "XX",
+        }
+        if len(codes) == 2:
+            location["state"] = codes[0]
+        return [location]
+
+    @staticmethod
+    def weather(lat: float, lon: float, exclude: list[str]) -> dict:
+        """Make up the weather data of a location with the parts that are not excluded."""
+        rng = random.Random(f"{lat:.2f},{lon:.2f}")
+        now = int(time.time())
+        offset = round(lon / 15) * 3600
+
+        def condition() -> list[dict]:
+            description, icon = rng.choice(CONDITIONS)
+            return [{"id": 800, "main": description.title(), "description": description, "icon": f"{icon}d"}]
+
+        data = {"lat": lat, "lon": lon, "timezone": "Etc/Unknown", "timezone_offset": offset}
+        if "current" not in exclude:
+            data["current"] = {
+                "dt": now,
+                "temp": round(rng.uniform(-10, 35), 2),
+                "humidity": rng.randint(20, 100),
+                "uvi": round(rng.uniform(0, 10), 2),
+                "clouds": rng.randint(0, 100),
+                "wind_speed": round(rng.uniform(0, 15), 2),
+                "weather": condition(),
+            }
+        if "daily" not in exclude:
+            data["daily"] = []
+            for day in range(8):
+                temp = rng.uniform(-10, 35)
+                data["daily"].append({
+                    "dt": now + day * 86400,
+                    "summary": "Expect a day of mixed weather",
+                    "temp": {"morn": round(temp - 4, 2), "day": round(temp, 2), "eve": round(temp - 2, 2),
+                             "night": round(temp - 6, 2), "min": round(temp - 7, 2), "max": round(temp + 1, 2)},
+                    "humidity": rng.randint(20, 100),
+                    "uvi": round(rng.uniform(0, 10), 2),
+                    "clouds": rng.randint(0, 100),
+                    "wind_speed": round(rng.uniform(0, 15), 2),
+                    "pop": round(rng.random(), 2),
+                    "rain": round(rng.uniform(0, 5), 2),
+                    "weather": condition(),
+                })
+        if "hourly" not in exclude:
+            # like the API, the hours start at the current hour and only rainy hours have a rain volume
+            data["hourly"] = []
+            for hour in range(48):
+                wind_speed = rng.uniform(0, 15)
+                data["hourly"].append({
+                    "dt": now - now % 3600 + hour * 3600,
+                    "temp": round(rng.uniform(-10, 35), 2),
+                    "pop": round(rng.random(), 2),
+                    "wind_speed": round(wind_speed, 2),
+                    "wind_gust": round(wind_speed * rng.uniform(1, 2), 2),
+                    "weather": condition(),
+                })
+                if rng.random() < 0.3:
+                    data["hourly"][-1]["rain"] = {"1h": round(rng.uniform(0, 3), 2)}
+        if "minutely" not in exclude:
+            data["minutely"] = [{"dt": now - now % 60 + minute * 60, "precipitation": round(rng.uniform(0, 2), 2)}
+                                for minute in range(60)]
+        return data
+
@@ -1 +1,28 @@
-from .chatbot import *
+import importlib
+from .conversations import *
+
+# Public names of the modules that depend on LangChain, which takes seconds to import. A module is only imported on
+# first access of one of its names.
+_lazy_modules = {
+    "answers": ("ToolUseDetector", "FuzzyIndex", "AnswerCache", "cached_query_llm", "cached_stream_llm",
+                "start_warm_up"),
+    "chatbot": ("setup_agent", "WeatherDataCollector", "ProgressHandler", "MetricsHandler", "TokenQueueHandler",
+                "get_weather_tool", "prefetch_weather", "query_llm", "aquery_llm", "stream_llm"),
+    "fast_answers": ("classify_question", "render_fast_answer", "fast_answer"),
+    "memory": ("MAX_HISTORY_MESSAGES", "count_message_tokens", "truncate_messages", "TokenBudgetMemory"),
+    "sessions": ("BoundedChatMessageHistory", "SQLiteChatMessageHistory", "SessionStore"),
+}
+_lazy_names = {name: module_name for module_name, names in _lazy_modules.items() for name in names}
+
+
+def __getattr__(name: str):
+    # unknown names are rejected without importing anything, e.g. for hasattr checks
+    if name not in _lazy_names:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    module = importlib.import_module(f".{_lazy_names[name]}", __name__)
+    globals()[name] = value = getattr(module, name)
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(_lazy_names))
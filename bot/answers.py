@@ -0,0 +1,216 @@
+import math
+import time
+import multiprocessing
+from uuid import uuid4
+from collections import Counter, OrderedDict
+from typing import Any, Callable, Iterator
+from langchain_core.callbacks import BaseCallbackHandler
+from api import ForkSafeLock, MemoryCache, SQLiteCache, create_cache_backend, normalize_name, metrics
+from .chatbot import query_llm, stream_llm
+
+
+class ToolUseDetector(BaseCallbackHandler):
+    """Callback handler that records if any tool was used during a single request."""
+    def __init__(self):
+        self.used = False
+
+    def on_tool_start(self, serialized: dict, input_str: str, **kwargs) -> None:
+        """Mark the request as using a tool."""
+        self.used = True
+
+
+class FuzzyIndex:
+    """TF-IDF index of character n-grams that finds the most similar of a bounded number of texts."""
+    def __init__(self, n: int = 3, maxsize: int = 1024):
+        self.n = n
+        self.maxsize = maxsize
+        self._docs = OrderedDict()
+        self._postings = {}
+        self._norms = {}
+        self._lock = ForkSafeLock()
+
+    def grams(self, text: str) -> Counter:
+        """Count the character n-grams of a text padded with spaces."""
+        text = f" {text} "
+        return Counter(text[i:i + self.n] for i in range(max(1, len(text) - self.n + 1)))
+
+    def _idf(self, gram: str) -> float:
+        """Get the smoothed inverse document frequency of an n-gram."""
+        return math.log((1 + len(self._docs)) / (1 + len(self._postings.get(gram, ())))) + 1
+
+    def add(self, text: str) -> None:
+        """Add a text and drop the oldest texts above the limit."""
+        with self._lock:
+            if text in self._docs:
+                self._docs.move_to_end(text)
+                return
+            grams = self.grams(text)
+            self._docs[text] = grams
+            for gram in grams:
+                self._postings.setdefault(gram, set()).add(text)
+            while len(self._docs) > self.maxsize:
+                old, old_grams = self._docs.popitem(last=False)
+                for gram in old_grams:
+                    self._postings[gram].discard(old)
+                    if not self._postings[gram]:
+                        del self._postings[gram]
+            # document norms depend on the idf of all n-grams
+            self._norms.clear()
+
+    def search(self, text: str) -> tuple[str | None, float]:
+        """Find the most similar text and its cosine similarity."""
+        with self._lock:
+            if not self._docs:
+                return None, 0.0
+            if not self._norms:
+                for doc, grams in self._docs.items():
+                    self._norms[doc] = math.sqrt(sum((tf * self._idf(g)) ** 2 for g, tf in grams.items()))
+
+            # accumulate the dot products with all texts that share an n-gram with the query
+            query = {gram: tf * self._idf(gram) for gram, tf in self.grams(text).items()}
+            scores = {}
+            for gram, weight in query.items():
+                for doc in self._postings.get(gram, ()):
+                    scores[doc] = scores.get(doc, 0.0) + weight * self._docs[doc][gram] * self._idf(gram)
+            if not scores:
+                return None, 0.0
+
+            query_norm = math.sqrt(sum(w ** 2 for w in query.values()))
+            doc, score = max(scores.items(), key=lambda x: x[1])
+            return doc, score / (query_norm * self._norms[doc])
+
+
+class AnswerCache:
+    """Cache of LLM answers to questions that do not depend on live weather data.
+
+    Questions are normalized before lookup and answers expire after `ttl` seconds. If `fuzzy_threshold` is set, a
+    question also hits the cache if its TF-IDF similarity to a cached question is at least the threshold. Only the
+    questions cached by the current process are searched for similar questions.
+    """
+    def __init__(self, backend: MemoryCache | SQLiteCache | None = None, ttl: float = 86400,
+                 fuzzy_threshold: float | None = None, maxsize: int = 1024):
+        self.backend = backend if backend is not None else create_cache_backend("answers", maxsize=maxsize)
+        self.ttl = ttl
+        self.fuzzy_threshold = fuzzy_threshold
+        self.index = FuzzyIndex(maxsize=maxsize) if fuzzy_threshold else None
+
+    @staticmethod
+    def key(question: str) -> str:
+        """Create the cache key of a question."""
+        return normalize_name(question)
+
+    def _get(self, key: str) -> str | None:
+        """Get an unexpired answer by its key."""
+        entry = self.backend.get(key)
+        if entry is None or time.time() - entry["created"] > self.ttl:
+            return None
+        return entry["answer"]
+
+    def get(self, question: str) -> str | None:
+        """Get the cached answer to a question or a similar question."""
+        key = self.key(question)
+        answer = self._get(key)
+        if answer is None and self.index is not None:
+            # fall back to the most similar cached question
+            match, score = self.index.search(key)
+            if match is not None and score >= self.fuzzy_threshold:
+                answer = self._get(match)
+        metrics.inc("chatbot_cache_requests_total", cache="answers", result="miss" if answer is None else "hit")
+        return answer
+
+    def set(self, question: str, answer: str) -> None:
+        """Store the answer to a question."""
+        key = self.key(question)
+        self.backend.set(key, {"answer": answer, "created": time.time()})
+        if self.index is not None:
+            self.index.add(key)
+
+    def warm_up(self, questions: list[str], create_agent: Callable[[], Any]) -> None:
+        """Answer and cache the given questions, each with a fresh agent, unless they are cached already."""
+        for question in questions:
+            answer = self.get(question)
+            if answer is not None:
+                # make cached answers of earlier runs findable by similarity
+                if self.index is not None:
+                    self.index.add(self.key(question))
+                continue
+            tools = ToolUseDetector()
+            answer = query_llm(create_agent(), question, callbacks=[tools])
+            if not tools.used:
+                self.set(question, answer)
+
+
+def cached_query_llm(cache: AnswerCache, agent, question: str, callbacks: list = None) -> str:
+    """Answer a question from the cache or query the LLM and cache the answer.
+
+    Answers are only cached if no tool was used and the conversation had no history, so that they neither depend on
+    live weather data nor on previous messages.
+    """
+
+    # cached answers are only valid without history, they are added to the conversation memory for follow-up questions
+    is_new = not agent.memory.chat_memory.messages
+    answer = cache.get(question) if is_new else None
+    if answer is not None:
+        agent.memory.save_context({"input": question}, {"output": answer})
+        return answer
+
+    tools = ToolUseDetector()
+    answer = query_llm(agent, question, callbacks=[tools] + (callbacks or []))
+    if is_new and not tools.used:
+        cache.set(question, answer)
+    return answer
+
+
+def cached_stream_llm(cache: AnswerCache, agent, question: str, callbacks: list = None) -> Iterator[tuple[str, Any]]:
+    """Streaming counterpart of cached_query_llm that yields the same events as stream_llm.
+
+    Cached answers are sent as a single token.
+    """
+    is_new = not agent.memory.chat_memory.messages
+    answer = cache.get(question) if is_new else None
+    if answer is not None:
+        agent.memory.save_context({"input": question}, {"output": answer})
+        yield "token", answer
+        yield "done", {"input": question, "output": answer}
+        return
+
+    tools = ToolUseDetector()
+    for kind, data in stream_llm(agent, question, callbacks=[tools] + (callbacks or [])):
+        if kind == "done" and is_new and not tools.used:
+            cache.set(question, data["output"])
+        yield kind, data
+
+
+def start_warm_up(cache: AnswerCache, questions: list[str], sessions) -> multiprocessing.Process:
+    """Warm up the answer cache in a forked process using temporary sessions of a session store.
+
+    Background jobs of the web server are forked as well, so the warm-up must not use SQLite from a thread of the web
+    server. The answers reach other processes through the cache backend, so it should be a SQLite cache.
+    """
+
+    def run():
+        session_ids = []
+
+        def create_agent():
+            session_ids.append(str(uuid4()))
+            return sessions.get(session_ids[-1])
+
+        try:
+            cache.warm_up(questions, create_agent)
+        except Exception:
+            # answers are cached on demand instead if the warm-up fails
+            pass
+        finally:
+            for session_id in session_ids:
+                sessions.remove(session_id)
+            # the process exits without running the exit handlers that flush the metrics
+            metrics.flush()
+
+    # make the answers of the warm-up findable by similarity in this process
+    if cache.index is not None:
+        for question in questions:
+            cache.index.add(cache.key(question))
+
+    process = multiprocessing.get_context("fork").Process(target=run, daemon=True)
+    process.start()
+    return process
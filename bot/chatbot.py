@@ -1,23 +1,64 @@
 from langchain_openai import ChatOpenAI
 from langchain.agents import AgentExecutor, create_tool_calling_agent
 from langchain_core.prompts import ChatPromptTemplate
+from langchain_core.callbacks import BaseCallbackHandler
 from langchain.memory import ConversationBufferWindowMemory
 from dotenv import load_dotenv
-from api import OpenWeatherMapQuery
+from api import (OpenWeatherMapQuery, OpenWeatherMapComparison, OpenWeatherMapHourly, AsyncOpenWeatherMapAPIWrapper,
+                 WEATHER_DATA_EVENT, metrics, Cassette, CassetteTransport, HTTPTransport, AsyncHTTPTransport,
+                 WeatherCache, MemoryCache, QuotaBudget)
 from prompts import SYSTEM_PROMPT
+from .memory import TokenBudgetMemory, MAX_HISTORY_MESSAGES
+from .sessions import BoundedChatMessageHistory
+from typing import Any, Callable, Iterator
+from uuid import UUID
+import contextvars
+import httpx
+import threading
+import queue
+import time
 import os
 
 load_dotenv()
 
 
-def setup_agent(model: str = "gpt-4o-mini", temperature: float = 0.7, verbose: bool = False) -> tuple:
-    """Set up the chatbot agent and tools."""
+def setup_agent(model: str = "gpt-4o-mini", temperature: float = 0.7, verbose: bool = False,
+                streaming: bool = False, base_url: str | None = None, cassette: Cassette | None = None,
+                replay: bool = False) -> tuple:
+    """Set up the chatbot agent and tools.
+
+    The OpenAI API is used at `base_url` or OPENAI_BASE_URL if set, e.g. to run benchmarks against a local stand-in.
+    If a cassette is given, the API responses are recorded to it or, with `replay`, served from it without network
+    access. Replaying agents keep their weather data in memory, so that it does not mix with live data, and do not use
+    the request budget.
+    """
+
+    # Record or replay the requests of the LLM and the weather tool
+    clients, wrapper = {}, {}
+    if cassette is not None:
+        clients = {
+            "http_client": httpx.Client(transport=CassetteTransport(cassette, replay, httpx.HTTPTransport())),
+            "http_async_client": httpx.AsyncClient(
+                transport=CassetteTransport(cassette, replay, httpx.AsyncHTTPTransport())
+            ),
+        }
+        wrapper = {
+            "transport": HTTPTransport(cassette=cassette, replay=replay),
+            "async_transport": AsyncHTTPTransport(cassette=cassette, replay=replay),
+        }
+        if replay:
+            clients["api_key"] = os.getenv("OPENAI_API_KEY") or "replay"
+            wrapper["cache"] = WeatherCache(backend=MemoryCache())
+            wrapper["quota"] = QuotaBudget(per_minute=0, per_day=0)
 
     # Create an instance of the ChatOpenAI model
-    llm = ChatOpenAI(model=model, temperature=temperature, max_retries=2, max_tokens=500, n=1, streaming=False)
+    llm = ChatOpenAI(model=model, temperature=temperature, max_retries=2, max_tokens=500, n=1, streaming=streaming,
+                     stream_usage=True, base_url=base_url or os.getenv("OPENAI_BASE_URL") or None, **clients)
 
     # Load the tools
-    tools = [OpenWeatherMapQuery()]
+    api_wrapper = AsyncOpenWeatherMapAPIWrapper(**wrapper)
+    tools = [OpenWeatherMapQuery(api_wrapper=api_wrapper), OpenWeatherMapComparison(api_wrapper=api_wrapper),
+             OpenWeatherMapHourly(api_wrapper=api_wrapper)]
 
     # Create a prompt template for the chatbot
     prompt = ChatPromptTemplate.from_messages(
@@ -29,8 +70,17 @@ def setup_agent(model: str = "gpt-4o-mini", temperature: float = 0.7, verbose: b
         ]
     )
 
-    # Create a memory object to store the chat history
-    memory = ConversationBufferWindowMemory(k=4, memory_key="chat_history", return_messages=True)
+    # Create a memory object to store the chat history within a token budget and summarize older messages, the summary
+    # requests use their own client so that forked background jobs do not inherit its locks
+    memory_budget = int(os.getenv("MEMORY_TOKEN_BUDGET", 1000))
+    if memory_budget > 0:
+        summary_llm = None if replay else ChatOpenAI(model=model, temperature=0, max_retries=2, max_tokens=200,
+                                                     base_url=base_url or os.getenv("OPENAI_BASE_URL") or None)
+        history = BoundedChatMessageHistory(max_messages=MAX_HISTORY_MESSAGES)
+        memory = TokenBudgetMemory(llm=summary_llm, max_tokens=memory_budget, chat_memory=history)
+    # Otherwise keep the last 4 exchanges
+    else:
+        memory = ConversationBufferWindowMemory(k=4, memory_key="chat_history", return_messages=True)
 
     # Construct the Tools agent
     agent = create_tool_calling_agent(llm, tools, prompt)
@@ -49,17 +99,161 @@ def setup_agent(model: str = "gpt-4o-mini", temperature: float = 0.7, verbose: b
     return agent_executor, tools
 
 
-def query_llm(agent, question: str, return_history: bool = False) -> dict | str:
+class WeatherDataCollector(BaseCallbackHandler):
+    """Callback handler that collects the location and weather data of the tool calls of a single request."""
+    def __init__(self):
+        self.weather_data = []
+
+    def on_custom_event(self, name: str, data, **kwargs) -> None:
+        """Store the data sent by the weather tool."""
+        if name == WEATHER_DATA_EVENT:
+            self.weather_data.append(data)
+
+
+class ProgressHandler(BaseCallbackHandler):
+    """Callback handler that reports the current step of a request as a short status message."""
+    def __init__(self, report: Callable[[str], None]):
+        self.report = report
+
+    def on_chat_model_start(self, serialized: dict, messages: list, **kwargs) -> None:
+        """Report that the LLM is generating."""
+        self.report("Thinking...")
+
+    def on_tool_start(self, serialized: dict, input_str: str, **kwargs) -> None:
+        """Report which tool is used."""
+        self.report(f"Asking {serialized.get('name', 'a tool')}...")
+
+
+class MetricsHandler(BaseCallbackHandler):
+    """Callback handler that records the duration of the agent run, LLM completions and tool calls and the tokens used."""
+    def __init__(self):
+        self.starts = {}
+
+    def _start(self, run_id: UUID) -> None:
+        """Remember the start time of a run."""
+        self.starts[run_id] = time.perf_counter()
+
+    def _end(self, run_id: UUID, stage: str) -> None:
+        """Record the duration of a run."""
+        start = self.starts.pop(run_id, None)
+        if start is not None:
+            metrics.observe("chatbot_stage_duration_seconds", time.perf_counter() - start, stage=stage)
+
+    def on_chain_start(self, serialized: dict, inputs: dict, *, run_id: UUID, parent_run_id: UUID = None,
+                       **kwargs) -> None:
+        """Start timing the agent run."""
+        if parent_run_id is None:
+            self._start(run_id)
+
+    def on_chain_end(self, outputs: dict, *, run_id: UUID, **kwargs) -> None:
+        """Record the duration of the agent run."""
+        self._end(run_id, "agent")
+
+    def on_chat_model_start(self, serialized: dict, messages: list, *, run_id: UUID, **kwargs) -> None:
+        """Start timing a completion."""
+        self._start(run_id)
+
+    def on_llm_end(self, response, *, run_id: UUID, **kwargs) -> None:
+        """Record the duration and token usage of a completion."""
+        self._end(run_id, "llm")
+
+        # streamed messages carry the usage metadata, otherwise it is part of the LLM output
+        usage = (response.llm_output or {}).get("token_usage") or {}
+        prompt_tokens, completion_tokens = usage.get("prompt_tokens", 0), usage.get("completion_tokens", 0)
+        for generation in (g for generations in response.generations for g in generations):
+            usage_metadata = getattr(getattr(generation, "message", None), "usage_metadata", None)
+            if usage_metadata and not usage:
+                prompt_tokens += usage_metadata["input_tokens"]
+                completion_tokens += usage_metadata["output_tokens"]
+        if prompt_tokens or completion_tokens:
+            metrics.inc("chatbot_llm_tokens_total", prompt_tokens, type="prompt")
+            metrics.inc("chatbot_llm_tokens_total", completion_tokens, type="completion")
+
+    def on_tool_start(self, serialized: dict, input_str: str, *, run_id: UUID, **kwargs) -> None:
+        """Start timing a tool call."""
+        self._start(run_id)
+
+    def on_tool_end(self, output: Any, *, run_id: UUID, **kwargs) -> None:
+        """Record the duration of a tool call."""
+        self._end(run_id, "tool")
+
+    def on_chain_error(self, error: BaseException, *, run_id: UUID, **kwargs) -> None:
+        """Forget failed runs."""
+        self.starts.pop(run_id, None)
+
+    on_llm_error = on_chain_error
+    on_tool_error = on_chain_error
+
+
+class TokenQueueHandler(BaseCallbackHandler):
+    """Callback handler that puts the tokens generated during a single request into a queue."""
+    def __init__(self, events: queue.Queue):
+        self.events = events
+
+    def on_llm_new_token(self, token: str, **kwargs) -> None:
+        """Queue non-empty tokens, tool call chunks come with empty content."""
+        if token:
+            self.events.put(("token", token))
+
+
+def get_weather_tool(agent) -> OpenWeatherMapQuery | None:
+    """Get the weather tool of an agent executor."""
+    for tool in agent.tools:
+        if isinstance(tool, OpenWeatherMapQuery):
+            return tool
+    return None
+
+
+def prefetch_weather(agent, question: str) -> None:
+    """Start fetching the weather data of the cities in a question, so that it is ready when the agent calls a tool."""
+    tool = get_weather_tool(agent)
+    if tool is not None:
+        tool.prefetch(question)
+
+
+def query_llm(agent, question: str, return_history: bool = False, callbacks: list = None,
+              prefetch: bool = True) -> dict | str:
     """Queries the LLM with the given question and returns the response."""
-    ai_response = agent.invoke({"input": question})
+    if prefetch:
+        prefetch_weather(agent, question)
+    callbacks = [MetricsHandler()] + (callbacks or [])
+    ai_response = agent.invoke({"input": question}, config={"callbacks": callbacks})
     if return_history:
         return ai_response
     return ai_response["output"]
 
 
-def check_open_ai_key() -> bool:
-    """Check if the OpenAI API key is set."""
-    open_ai = os.getenv("OPENAI_API_KEY", "")
-    if len(open_ai) < 16:
-        return False
-    return True
+async def aquery_llm(agent, question: str, return_history: bool = False, callbacks: list = None,
+                     prefetch: bool = True) -> dict | str:
+    """Queries the LLM asynchronously with the given question and returns the response."""
+    if prefetch:
+        prefetch_weather(agent, question)
+    callbacks = [MetricsHandler()] + (callbacks or [])
+    ai_response = await agent.ainvoke({"input": question}, config={"callbacks": callbacks})
+    if return_history:
+        return ai_response
+    return ai_response["output"]
+
+
+def stream_llm(agent, question: str, callbacks: list = None) -> Iterator[tuple[str, Any]]:
+    """Queries the LLM in a background thread and yields ("token", token) events as the tokens arrive.
+
+    The last event is either ("done", response) with the full response or ("error", exception).
+    Requires an agent set up with streaming enabled.
+    """
+    events = queue.Queue()
+
+    def run():
+        try:
+            handlers = [TokenQueueHandler(events)] + (callbacks or [])
+            events.put(("done", query_llm(agent, question, return_history=True, callbacks=handlers)))
+        except Exception as e:
+            events.put(("error", e))
+
+    # run in a copy of the current context so that the measurements belong to the current request
+    threading.Thread(target=contextvars.copy_context().run, args=(run,), daemon=True).start()
+    while True:
+        event = events.get()
+        yield event
+        if event[0] != "token":
+            break
@@ -0,0 +1,165 @@
+import os
+import time
+import sqlite3
+from typing import Iterator
+from contextlib import closing, contextmanager
+from collections import OrderedDict
+from dotenv import load_dotenv
+from api import ForkSafeLock, fork_guard
+
+__all__ = ["ConversationStore", "SQLiteConversationStore", "create_conversation_store"]
+
+load_dotenv()
+
+
+class ConversationStore:
+    """In-process store of the questions and answers displayed in the chat of each session.
+
+    Sessions are evicted after `ttl` seconds of inactivity or, least recently used first, once there are more than
+    `max_sessions` sessions.
+    """
+    placeholder = "*This answer was cancelled.*"
+
+    def __init__(self, max_sessions: int = 1000, ttl: float = 3600):
+        self.max_sessions = max_sessions
+        self.ttl = ttl
+        self._conversations = OrderedDict()
+        self._lock = ForkSafeLock()
+
+    def get(self, session_id: str) -> tuple[list[str], list[str]]:
+        """Get the questions and answers of a session."""
+        with self._lock:
+            questions, answers, _ = self._conversations.get(session_id, ([], [], 0))
+            return list(questions), list(answers)
+
+    def add_question(self, session_id: str, question: str) -> int:
+        """Append a question and return the number of questions of the session."""
+        with self._lock:
+            questions, answers = self._touch(session_id)
+            questions.append(question)
+            return len(questions)
+
+    def set_answer(self, session_id: str, index: int, answer: str) -> int:
+        """Store the answer to the question with the given index and return the number of the answer.
+
+        Questions before the index without an answer, e.g. since their job was cancelled, get a placeholder answer. The
+        number identifies the answer even if later questions were answered first.
+        """
+        with self._lock:
+            questions, answers = self._touch(session_id)
+            answers.extend([self.placeholder] * (index + 1 - len(answers)))
+            answers[index] = answer
+            return index + 1
+
+    def clear(self, session_id: str) -> None:
+        """Remove the conversation of a session."""
+        with self._lock:
+            self._conversations.pop(session_id, None)
+
+    def _touch(self, session_id: str) -> tuple[list[str], list[str]]:
+        """Get the conversation of a session for an update and evict idle and least recently used sessions."""
+        now = time.time()
+        questions, answers, _ = self._conversations.pop(session_id, ([], [], 0))
+        self._conversations[session_id] = (questions, answers, now)
+        while self._conversations:
+            _, (_, _, last_used) = next(iter(self._conversations.items()))
+            if now - last_used <= self.ttl and len(self._conversations) <= self.max_sessions:
+                break
+            self._conversations.popitem(last=False)
+        return questions, answers
+
+
+class SQLiteConversationStore(ConversationStore):
+    """Store of the questions and answers of each session in a SQLite database shared by all worker processes."""
+    def __init__(self, path: str, max_sessions: int = 1000, ttl: float = 3600):
+        super().__init__(max_sessions, ttl)
+        self.path = path
+        self._pruned = 0
+        with self._connect() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS conversations "
+                "(session_id TEXT, role TEXT, idx INTEGER, text TEXT, updated REAL, "
+                "PRIMARY KEY (session_id, role, idx))"
+            )
+
+    @contextmanager
+    def _connect(self) -> Iterator[sqlite3.Connection]:
+        """Open a connection to the database that commits and closes on exit."""
+        with fork_guard, closing(sqlite3.connect(self.path, timeout=5)) as conn, conn:
+            yield conn
+
+    def get(self, session_id: str) -> tuple[list[str], list[str]]:
+        """Get the questions and answers of a session."""
+        with self._connect() as conn:
+            rows = conn.execute(
+                "SELECT role, text FROM conversations WHERE session_id = ? ORDER BY idx", (session_id,)
+            ).fetchall()
+        questions = [text for role, text in rows if role == "user"]
+        answers = [text for role, text in rows if role == "ai"]
+        return questions, answers
+
+    def add_question(self, session_id: str, question: str) -> int:
+        """Append a question and return the number of questions of the session."""
+        with self._connect() as conn:
+            # lock the database for writing before counting, so that concurrent questions get different indexes
+            conn.execute("BEGIN IMMEDIATE")
+            count = self._count(conn, session_id, "user")
+            self._insert(conn, session_id, "user", [(count, question)])
+        self._prune()
+        return count + 1
+
+    def set_answer(self, session_id: str, index: int, answer: str) -> int:
+        """Store the answer to the question with the given index and return the number of the answer."""
+        with self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            count = self._count(conn, session_id, "ai")
+            rows = [(i, self.placeholder) for i in range(count, index)] + [(index, answer)]
+            self._insert(conn, session_id, "ai", rows)
+        return index + 1
+
+    def clear(self, session_id: str) -> None:
+        """Remove the conversation of a session."""
+        with self._connect() as conn:
+            conn.execute("DELETE FROM conversations WHERE session_id = ?", (session_id,))
+
+    @staticmethod
+    def _count(conn: sqlite3.Connection, session_id: str, role: str) -> int:
+        """Count the messages of a session with the given role."""
+        return conn.execute(
+            "SELECT COUNT(*) FROM conversations WHERE session_id = ? AND role = ?", (session_id, role)
+        ).fetchone()[0]
+
+    @staticmethod
+    def _insert(conn: sqlite3.Connection, session_id: str, role: str, rows: list[tuple[int, str]]) -> None:
+        """Insert or replace messages of a session."""
+        now = time.time()
+        conn.executemany(
+            "INSERT OR REPLACE INTO conversations (session_id, role, idx, text, updated) VALUES (?, ?, ?, ?, ?)",
+            [(session_id, role, idx, text, now) for idx, text in rows]
+        )
+
+    def _prune(self) -> None:
+        """Remove idle sessions and the oldest sessions above the limit from time to time."""
+        now = time.time()
+        if now - self._pruned < 60:
+            return
+        self._pruned = now
+        with self._connect() as conn:
+            conn.execute(
+                "DELETE FROM conversations WHERE session_id IN "
+                "(SELECT session_id FROM conversations GROUP BY session_id HAVING MAX(updated) < ?)",
+                (now - self.ttl,)
+            )
+            conn.execute(
+                "DELETE FROM conversations WHERE session_id IN (SELECT session_id FROM conversations "
+                "GROUP BY session_id ORDER BY MAX(updated) DESC LIMIT -1 OFFSET ?)",
+                (self.max_sessions,)
+            )
+
+
+def create_conversation_store(max_sessions: int = 1000, ttl: float = 3600) -> ConversationStore:
+    """Create a SQLite conversation store if SESSION_DB_PATH is set, otherwise an in-process store."""
+    path = os.getenv("SESSION_DB_PATH", "")
+    if path:
+        return SQLiteConversationStore(path, max_sessions=max_sessions, ttl=ttl)
+    return ConversationStore(max_sessions=max_sessions, ttl=ttl)
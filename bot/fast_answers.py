@@ -0,0 +1,121 @@
+import re
+import time
+from datetime import datetime, timezone
+from api import WeatherSnapshot, metrics
+from prompts import CURRENT_ANSWER_TEMPLATES, FUTURE_ANSWER_TEMPLATES
+from .chatbot import get_weather_tool
+
+# Words that ask for a single weather metric
+METRIC_PATTERNS = {
+    "temp": re.compile(r"\b(temperatures?|degrees|hot|cold|warm|chilly|freezing)\b"),
+    "wind_speed": re.compile(r"\b(wind|winds|windy|wind speed|breezy|gusts?)\b"),
+    "humidity": re.compile(r"\b(humid|humidity)\b"),
+    "clouds": re.compile(r"\b(cloudy|clouds|cloud coverage|cloud cover|overcast|sunny|clear sky)\b"),
+    "uvi": re.compile(r"\b(uv|uv index|uvi)\b"),
+    "rain": re.compile(r"\b(rain|rains|raining|rainy|rainfall|precipitation|showers?)\b"),
+    "snow": re.compile(r"\b(snow|snows|snowing|snowy|snowfall)\b"),
+}
+
+# Words that ask for more than a single value, comparisons, advice, past weather, months or units other than °C and
+# m/s and are left to the LLM
+COMPLEX_PATTERN = re.compile(
+    r"\b(why|how come|explain|should|recommend|wear|umbrella|compare|than|warmer|colder|difference|week|weekend|"
+    r"days|tonight|morning|evening|afternoon|hours?|hourly|next|summary|summarize|develop|trend|"
+    r"was|were|yesterday|last|ago|january|february|march|april|may|june|july|august|september|october|november|"
+    r"december|fahrenheit|kelvin|mph|km/h|kph|knots|miles|inch|inches|imperial)\b|°f\b"
+)
+
+# Words that ask for the future, which are left to the LLM unless a day is asked for
+FUTURE_PATTERN = re.compile(r"\b(will|won't|going to|gonna|later|soon)\b")
+
+# Words that ask for a specific day
+WEEKDAYS = ["monday", "tuesday", "wednesday", "thursday", "friday", "saturday", "sunday"]
+DAY_PATTERN = re.compile(r"\b(today|tomorrow|" + "|".join(WEEKDAYS) + r")\b")
+
+
+def classify_question(question: str) -> tuple[str, str] | None:
+    """Classify a question about a single weather metric as (metric, day) or return None.
+
+    The day is "now" for the current weather, otherwise "today", "tomorrow" or a weekday.
+    """
+    text = question.casefold()
+    if COMPLEX_PATTERN.search(text):
+        return None
+
+    # exactly one metric must be asked for
+    asked = [metric for metric, pattern in METRIC_PATTERNS.items() if pattern.search(text)]
+    if len(asked) != 1:
+        return None
+
+    # at most one day must be asked for, and questions about the future must name it
+    days = set(DAY_PATTERN.findall(text))
+    if len(days) > 1 or not days and FUTURE_PATTERN.search(text):
+        return None
+    return asked[0], days.pop() if days else "now"
+
+
+def render_fast_answer(metric: str, day: str, location: str, weather: WeatherSnapshot) -> str | None:
+    """Render the answer to a single metric question from the weather data or return None if the day is unavailable."""
+
+    # answer questions about the current weather
+    current = weather.current
+    if day == "now":
+        value = current.get(metric, 0)
+        description = current["description"]
+        return CURRENT_ANSWER_TEMPLATES[metric].format(location=location, value=value, description=description)
+
+    # find the forecast of the day, the first forecast is today at the location
+    local_now = datetime.fromtimestamp(current["dt"] + weather.timezone_offset, timezone.utc)
+    if day == "today":
+        index, label = 0, "Today"
+    elif day == "tomorrow":
+        index, label = 1, "Tomorrow"
+    else:
+        index = (WEEKDAYS.index(day) - local_now.weekday()) % 7
+        label = f"On {day.capitalize()}"
+    if index >= weather.days:
+        return None
+    data = weather.day(index)
+
+    # answer questions about the forecast
+    value = data["temp_day"] if metric == "temp" else data.get(metric, 0)
+    return FUTURE_ANSWER_TEMPLATES[metric].format(
+        day=label,
+        location=location,
+        value=value,
+        night=data["temp_night"],
+        pop=data["pop"],
+        description=data["description"]
+    )
+
+
+def fast_answer(agent, question: str) -> tuple[str, dict] | None:
+    """Answer a question about a single metric of the weather in a city without the LLM.
+
+    Returns the answer and the location and weather data it is based on, or None if the question is not simple enough.
+    The answer is added to the conversation memory of the agent.
+    """
+    start = time.perf_counter()
+    tool = get_weather_tool(agent)
+    classification = classify_question(question)
+    if tool is None or classification is None:
+        return None
+    metric, day = classification
+
+    # get the location and weather data
+    wrapper = tool.api_wrapper
+    locations = wrapper.gazetteer.extract_all(question)
+    if len(locations) != 1:
+        return None
+    location = locations[0]
+    weather = wrapper.get_weather_data(location["lat"], location["lon"])
+    if isinstance(weather, str):
+        return None
+
+    # render the answer and add it to the conversation memory
+    answer = render_fast_answer(metric, day, wrapper.get_location_name(location), weather)
+    if answer is None:
+        return None
+    agent.memory.save_context({"input": question}, {"output": answer})
+    metrics.observe("chatbot_stage_duration_seconds", time.perf_counter() - start, stage="fast_answer")
+    return answer, {"location": location, "weather": weather.to_dict()}
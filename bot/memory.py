@@ -0,0 +1,102 @@
+from typing import Any, Dict, List, Optional
+from langchain.memory.chat_memory import BaseChatMemory
+from langchain_core.language_models import BaseLanguageModel
+from langchain_core.messages import BaseMessage, HumanMessage, SystemMessage, get_buffer_string
+from api import count_tokens, metrics
+from prompts import SUMMARY_PROMPT, SUMMARY_TEMPLATE
+
+# Maximum number of messages kept per session, e.g. while the summary cannot be updated
+MAX_HISTORY_MESSAGES = 40
+
+
+def count_message_tokens(message: BaseMessage) -> int:
+    """Count the tokens of a message including the overhead of its role."""
+    return count_tokens(str(message.content)) + 4
+
+
+def truncate_messages(messages: list[BaseMessage], max_tokens: int) -> list[BaseMessage]:
+    """Shorten the contents of messages by the same ratio until they fit into the token budget or drop them."""
+    shortened, ratio = messages, 1.0
+    while sum(count_message_tokens(message) for message in shortened) > max_tokens:
+        ratio *= 0.9
+        if ratio < 0.01:
+            return []
+        shortened = [
+            message.copy(update={"content": str(message.content)[:int(len(str(message.content)) * ratio)] + " ..."})
+            for message in messages
+        ]
+    return shortened
+
+
+class TokenBudgetMemory(BaseChatMemory):
+    """Conversation memory that passes the most recent messages within a token budget and a summary of older ones.
+
+    Messages that no longer fit into the budget are left out of the prompt right away and folded into the running
+    summary by `update_summary`, which is meant to run after the answer has been returned. The chat history must
+    have a `summary` attribute and a `trim` method, like the histories of the session store.
+    """
+
+    llm: Optional[BaseLanguageModel] = None
+    max_tokens: int = 1000
+    memory_key: str = "chat_history"
+    return_messages: bool = True
+
+    @property
+    def memory_variables(self) -> List[str]:
+        """Get the keys of the memory variables."""
+        return [self.memory_key]
+
+    def load_memory_variables(self, inputs: Dict[str, Any]) -> Dict[str, Any]:
+        """Get the summary and the recent messages that fit into the token budget."""
+        summary, _, messages = self.split()
+        if summary:
+            messages = [SystemMessage(content=SUMMARY_TEMPLATE.format(summary=summary))] + messages
+        if not self.return_messages:
+            return {self.memory_key: get_buffer_string(messages)}
+        return {self.memory_key: messages}
+
+    def split(self) -> tuple[str, list[BaseMessage], list[BaseMessage]]:
+        """Split the history into the summary, the messages to summarize and the messages within the budget.
+
+        The budget includes the summary and only whole exchanges are kept, so the recent messages start with a
+        question of the user. The last exchange is always kept and shortened if it does not fit on its own.
+        """
+        messages = self.chat_memory.messages
+        summary = self.chat_memory.summary
+        budget = self.max_tokens
+        if summary:
+            budget -= count_message_tokens(SystemMessage(content=SUMMARY_TEMPLATE.format(summary=summary)))
+
+        # keep the most recent messages that fit into the budget
+        start, tokens = len(messages), 0
+        while start > 0 and tokens + count_message_tokens(messages[start - 1]) <= budget:
+            start -= 1
+            tokens += count_message_tokens(messages[start])
+        while start < len(messages) and not isinstance(messages[start], HumanMessage):
+            start += 1
+        if start < len(messages) or not messages:
+            return summary, messages[:start], messages[start:]
+
+        # shorten the last exchange to the rest of the budget
+        start = max((i for i, message in enumerate(messages) if isinstance(message, HumanMessage)), default=0)
+        return summary, messages[:start], truncate_messages(messages[start:], budget)
+
+    def update_summary(self) -> bool:
+        """Fold the messages that no longer fit into the budget into the summary and remove them from the history.
+
+        Without an LLM, the messages are removed without a summary. Returns False if there was nothing to summarize
+        or the LLM request failed, in which case it is retried on the next update.
+        """
+        summary, evicted, _ = self.split()
+        if not evicted:
+            return False
+        if self.llm is not None:
+            prompt = SUMMARY_PROMPT.format(summary=summary or "-", new_lines=get_buffer_string(evicted))
+            try:
+                with metrics.timer("chatbot_stage_duration_seconds", stage="summary"):
+                    summary = str(self.llm.invoke(prompt).content).strip()
+            except Exception:
+                return False
+        self.chat_memory.trim(len(evicted))
+        self.chat_memory.summary = summary
+        return True
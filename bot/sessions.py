@@ -0,0 +1,252 @@
+import os
+import json
+import time
+import sqlite3
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Iterator, List, Sequence
+from contextlib import closing, contextmanager
+from dotenv import load_dotenv
+from api import ForkSafeLock, fork_guard
+from langchain.agents import AgentExecutor
+from langchain.memory import ConversationBufferWindowMemory
+from langchain.memory.chat_memory import BaseChatMemory
+from langchain_core.chat_history import BaseChatMessageHistory, InMemoryChatMessageHistory
+from langchain_core.messages import BaseMessage, message_to_dict, messages_from_dict
+from .memory import TokenBudgetMemory, MAX_HISTORY_MESSAGES
+
+load_dotenv()
+
+
+class BoundedChatMessageHistory(InMemoryChatMessageHistory):
+    """In-memory chat message history that only keeps the most recent messages and a summary of older ones."""
+
+    max_messages: int = 8
+    summary: str = ""
+
+    def add_message(self, message: BaseMessage) -> None:
+        """Add a message and drop the oldest ones."""
+        self.messages.append(message)
+        del self.messages[:-self.max_messages]
+
+    def trim(self, count: int) -> None:
+        """Remove the oldest messages."""
+        del self.messages[:count]
+
+    def clear(self) -> None:
+        """Remove all messages and the summary."""
+        self.messages = []
+        self.summary = ""
+
+
+class SQLiteChatMessageHistory(BaseChatMessageHistory):
+    """Chat message history and summary stored in a SQLite database that is shared by all worker processes."""
+    def __init__(self, session_id: str, path: str, max_messages: int = 8):
+        self.session_id = session_id
+        self.path = path
+        self.max_messages = max_messages
+        with self._connect() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS messages "
+                "(id INTEGER PRIMARY KEY AUTOINCREMENT, session_id TEXT, message TEXT, updated REAL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS messages_session ON messages (session_id, id)")
+            conn.execute("CREATE TABLE IF NOT EXISTS summaries (session_id TEXT PRIMARY KEY, summary TEXT)")
+
+    @contextmanager
+    def _connect(self) -> Iterator[sqlite3.Connection]:
+        """Open a connection to the database that commits and closes on exit."""
+        with fork_guard, closing(sqlite3.connect(self.path, timeout=5)) as conn, conn:
+            yield conn
+
+    @property
+    def messages(self) -> List[BaseMessage]:
+        """Load the messages of the session."""
+        with self._connect() as conn:
+            rows = conn.execute(
+                "SELECT message FROM messages WHERE session_id = ? ORDER BY id", (self.session_id,)
+            ).fetchall()
+        return messages_from_dict([json.loads(row[0]) for row in rows])
+
+    def add_messages(self, messages: Sequence[BaseMessage]) -> None:
+        """Add messages and drop the oldest ones of the session."""
+        now = time.time()
+        with self._connect() as conn:
+            conn.executemany(
+                "INSERT INTO messages (session_id, message, updated) VALUES (?, ?, ?)",
+                [(self.session_id, json.dumps(message_to_dict(message)), now) for message in messages]
+            )
+            conn.execute(
+                "DELETE FROM messages WHERE session_id = ? AND id NOT IN "
+                "(SELECT id FROM messages WHERE session_id = ? ORDER BY id DESC LIMIT ?)",
+                (self.session_id, self.session_id, self.max_messages)
+            )
+
+    def add_message(self, message: BaseMessage) -> None:
+        """Add a message to the session."""
+        self.add_messages([message])
+
+    def trim(self, count: int) -> None:
+        """Remove the oldest messages of the session."""
+        with self._connect() as conn:
+            conn.execute(
+                "DELETE FROM messages WHERE id IN (SELECT id FROM messages WHERE session_id = ? ORDER BY id LIMIT ?)",
+                (self.session_id, count)
+            )
+
+    @property
+    def summary(self) -> str:
+        """Load the summary of the older messages of the session."""
+        with self._connect() as conn:
+            row = conn.execute("SELECT summary FROM summaries WHERE session_id = ?", (self.session_id,)).fetchone()
+        return row[0] if row else ""
+
+    @summary.setter
+    def summary(self, summary: str) -> None:
+        """Store the summary of the older messages of the session."""
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO summaries (session_id, summary) VALUES (?, ?)", (self.session_id, summary)
+            )
+
+    def clear(self) -> None:
+        """Remove all messages and the summary of the session."""
+        with self._connect() as conn:
+            conn.execute("DELETE FROM messages WHERE session_id = ?", (self.session_id,))
+            conn.execute("DELETE FROM summaries WHERE session_id = ?", (self.session_id,))
+
+    @staticmethod
+    def prune(path: str, before: float, max_sessions: int) -> None:
+        """Remove sessions that were last updated before the given time and the oldest sessions above the limit."""
+        with fork_guard, closing(sqlite3.connect(path, timeout=5)) as conn, conn:
+            conn.execute(
+                "DELETE FROM messages WHERE session_id IN "
+                "(SELECT session_id FROM messages GROUP BY session_id HAVING MAX(updated) < ?)",
+                (before,)
+            )
+            conn.execute(
+                "DELETE FROM messages WHERE session_id IN (SELECT session_id FROM messages GROUP BY session_id "
+                "ORDER BY MAX(updated) DESC LIMIT -1 OFFSET ?)",
+                (max_sessions,)
+            )
+            conn.execute("DELETE FROM summaries WHERE session_id NOT IN (SELECT session_id FROM messages)")
+
+
+class SessionStore:
+    """Store of per-session agent executors with bounded size and LRU eviction.
+
+    Each session gets its own conversation memory of the same type as the memory of the template executor, while the
+    agent, LLM, tools and prompt are shared. Sessions are evicted after `ttl` seconds of inactivity or, least recently
+    used first, once there are more than `max_sessions` sessions or their messages exceed `max_chars` characters in
+    total. If `path` or the environment variable SESSION_DB_PATH is set, the messages are stored in a SQLite database so
+    that any worker can serve any turn.
+    """
+    def __init__(self, agent_executor: AgentExecutor, k: int = 4, max_sessions: int = 1000,
+                 max_chars: int = 5_000_000, ttl: float = 3600, path: str = None):
+        self.agent_executor = agent_executor
+        self.k = k
+        self.max_sessions = max_sessions
+        self.max_chars = max_chars
+        self.ttl = ttl
+        self.path = path or os.getenv("SESSION_DB_PATH", "")
+        self._sessions = OrderedDict()
+        self._summarizing = set()
+        self._summary_executor = None
+        self._summary_executor_pid = None
+        self._pruned = 0
+        self._lock = ForkSafeLock()
+
+    def get(self, session_id: str) -> AgentExecutor:
+        """Get the agent executor of a session and create it if necessary."""
+        with self._lock:
+            now = time.time()
+            if session_id in self._sessions:
+                executor, _ = self._sessions.pop(session_id)
+            else:
+                fields = {**dict(self.agent_executor), "memory": self._create_memory(session_id)}
+                executor = AgentExecutor(**fields)
+            self._sessions[session_id] = (executor, now)
+            self._evict(now)
+            return executor
+
+    def remove(self, session_id: str) -> None:
+        """Remove a session and its messages."""
+        with self._lock:
+            executor, _ = self._sessions.pop(session_id, (None, None))
+        if executor is not None:
+            executor.memory.clear()
+
+    @property
+    def summary_executor(self) -> ThreadPoolExecutor:
+        """Get the single thread of the current process that updates the summaries one after another."""
+        if self._summary_executor is None or self._summary_executor_pid != os.getpid():
+            self._summary_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="memory-summary")
+            self._summary_executor_pid = os.getpid()
+            # summaries that a forked process copied from its parent are not updated by its thread
+            self._summarizing = set()
+        return self._summary_executor
+
+    def summarize(self, session_id: str) -> None:
+        """Update the summary of the conversation memory of a session on the summary thread.
+
+        Call it after the answer has been returned, so that the LLM request for the summary does not delay the answer.
+        Sessions whose summary is already pending are skipped, so that rapid answers do not pile up updates.
+        """
+        executor = self.summary_executor
+        with self._lock:
+            if session_id in self._summarizing:
+                return
+            self._summarizing.add(session_id)
+        executor.submit(self._summarize, session_id)
+
+    def _summarize(self, session_id: str) -> None:
+        """Update the summary of a session that is marked as being summarized and unmark it."""
+        try:
+            memory = self.get(session_id).memory
+            if isinstance(memory, TokenBudgetMemory):
+                memory.update_summary()
+        finally:
+            with self._lock:
+                self._summarizing.discard(session_id)
+
+    def _create_memory(self, session_id: str) -> BaseChatMemory:
+        """Create the conversation memory of a session."""
+        template = self.agent_executor.memory
+        max_messages = MAX_HISTORY_MESSAGES if isinstance(template, TokenBudgetMemory) else 2 * self.k
+        if self.path:
+            history = SQLiteChatMessageHistory(session_id, self.path, max_messages=max_messages)
+        else:
+            history = BoundedChatMessageHistory(max_messages=max_messages)
+        if isinstance(template, TokenBudgetMemory):
+            return TokenBudgetMemory(llm=template.llm, max_tokens=template.max_tokens, chat_memory=history)
+        return ConversationBufferWindowMemory(
+            k=self.k, memory_key="chat_history", return_messages=True, chat_memory=history
+        )
+
+    def _size(self, executor: AgentExecutor) -> int:
+        """Approximate the memory footprint of a session by the characters of its messages."""
+        history = executor.memory.chat_memory
+        if isinstance(history, SQLiteChatMessageHistory):
+            return 0
+        return sum(len(str(message.content)) for message in history.messages)
+
+    def _evict(self, now: float) -> None:
+        """Evict idle sessions and the least recently used sessions above the size limits."""
+
+        # evict idle sessions, the oldest sessions come first
+        while self._sessions:
+            _, (_, last_used) = next(iter(self._sessions.items()))
+            if now - last_used <= self.ttl:
+                break
+            self._sessions.popitem(last=False)
+
+        # evict least recently used sessions above the limits
+        total_chars = sum(self._size(executor) for executor, _ in self._sessions.values())
+        while len(self._sessions) > 1 and (len(self._sessions) > self.max_sessions or total_chars > self.max_chars):
+            _, (executor, _) = self._sessions.popitem(last=False)
+            total_chars -= self._size(executor)
+
+        # prune shared sessions from the database from time to time
+        if self.path and now - self._pruned > 60:
+            SQLiteChatMessageHistory.prune(self.path, now - self.ttl, self.max_sessions)
+            self._pruned = now
@@ -27,8 +27,78 @@ Weather is {weather} with a temperature of {temp_morn:.0f}°C in the morning, {t
 Humidity is {humidity}%, the UV index is {uvi:.0f}, cloud coverage is {clouds}%, wind speed is {wind_speed:.0f} m/s.
 The Probability of precipitation is {pop:.0%}. There is total volume of {rain:.1f} mm of rain and {snow:.1f} mm of snow."""
 
+# Template for the compact weather information table
+COMPACT_TEMPLATE = """Location: {location}
+Current time at this location is {time}.
+Units: temp °C (forecast: morning/day/evening/night), humidity %, clouds %, wind m/s, pop %, rain and snow mm (now: mm/h)
+{table}"""
+
+# Template for the compact table that compares the weather of several locations
+COMPARISON_TEMPLATE = """Locations: {locations}
+Units: temp °C (forecast: morning/day/evening/night), humidity %, clouds %, wind m/s, pop %, rain and snow mm (now: mm/h)
+{table}"""
+
+# Template for the hourly forecast aggregated over the next hours
+HOURLY_TEMPLATE = """Location: {location}
+Current time at this location is {time}. Forecast for the next {hours} hours until {end}:
+Temperature ranges from {temp_min:.0f}°C at {temp_min_time} to {temp_max:.0f}°C at {temp_max_time}.
+The highest probability of precipitation is {pop_max:.0f}% at {pop_max_time}. {pop_first}
+There is a total volume of {rain:.1f} mm of rain and {snow:.1f} mm of snow. {rain_first}
+Wind speed reaches {wind_max:.0f} m/s at {wind_max_time} with gusts of up to {gust_max:.0f} m/s at {gust_max_time}.
+{minutely}"""
+
+# Sentences of the hourly forecast that depend on whether the event occurs
+HOURLY_PHRASES = {
+    "pop_first": "The probability of precipitation first exceeds {threshold}% at {time}.",
+    "pop_never": "The probability of precipitation does not exceed {threshold}%.",
+    "rain_first": "Rain first falls at {time}.",
+    "rain_never": "No rain is expected.",
+    "minutely_now": "It is precipitating now with up to {max:.1f} mm/h for the next hour.",
+    "minutely_stop": "It is precipitating now with up to {max:.1f} mm/h and stops in {end} minutes.",
+    "minutely_start": "Precipitation of up to {max:.1f} mm/h starts in {start} minutes.",
+    "minutely_dry": "No precipitation is expected within the next hour.",
+    "minutely_missing": "No minutely forecast is available for this location.",
+}
+
+# Templates for fast answers to questions about a single metric of the current weather
+CURRENT_ANSWER_TEMPLATES = {
+    "temp": "Right now in {location}, it's {value:.0f}°C with {description}.",
+    "wind_speed": "Right now in {location}, the wind speed is {value:.0f} m/s.",
+    "humidity": "Right now in {location}, the humidity is {value:.0f}%.",
+    "clouds": "Right now in {location}, the cloud coverage is {value:.0f}% with {description}.",
+    "uvi": "Right now in {location}, the UV index is {value:.0f}.",
+    "rain": "Right now in {location}, there is {value:.1f} mm/h of rain with {description}.",
+    "snow": "Right now in {location}, there is {value:.1f} mm/h of snow with {description}.",
+}
+
+# Templates for fast answers to questions about a single metric of the forecast for one day
+FUTURE_ANSWER_TEMPLATES = {
+    "temp": "{day} in {location}, it will be {value:.0f}°C during the day and {night:.0f}°C at night with {description}.",
+    "wind_speed": "{day} in {location}, the wind speed will be {value:.0f} m/s.",
+    "humidity": "{day} in {location}, the humidity will be {value:.0f}%.",
+    "clouds": "{day} in {location}, the cloud coverage will be {value:.0f}% with {description}.",
+    "uvi": "{day} in {location}, the UV index will reach {value:.0f}.",
+    "rain": "{day} in {location}, the probability of precipitation is {pop:.0%} with a total of {value:.1f} mm of rain.",
+    "snow": "{day} in {location}, the probability of precipitation is {pop:.0%} with a total of {value:.1f} mm of snow.",
+}
+
+# Prompt to fold the messages that no longer fit into the conversation memory into its running summary
+SUMMARY_PROMPT = """Progressively summarize the conversation between a user and Sky, a weather assistant chatbot, by adding the new lines of the conversation to the current summary.
+Keep the locations, dates, weather values and preferences the user asked about. Answer with the new summary only, in at most 100 words.
+
+Current summary:
+{summary}
+
+New lines of the conversation:
+{new_lines}
+
+New summary:"""
+
+# Template of the message that passes the summary of the earlier conversation to the chatbot
+SUMMARY_TEMPLATE = "Summary of the earlier conversation: {summary}"
+
 # System prompt for the Weather Chatbot
-SYSTEM_PROMPT = """You are Sky, a friendly and knowledgeable weather assistant chatbot. Your primary role is to provide accurate and concise weather-related information and advice. You have access to up-to-date information from the OpenWeatherMap tool, which provides current weather and 7-day forecasts for any requested location.
+SYSTEM_PROMPT = """You are Sky, a friendly and knowledgeable weather assistant chatbot. Your primary role is to provide accurate and concise weather-related information and advice. You have access to up-to-date information from the OpenWeatherMap tool, which provides current weather, hourly forecasts for the next 48 hours and 7-day forecasts for any requested location.
 
 When interacting with users, follow these guidelines:
 1. Always be kind, polite, and maintain a relaxed, casual, and cheerful tone.
@@ -0,0 +1,110 @@
+"""Build the offline city index used by the geocoding layer from GeoNames data.
+
+Usage:
+    python scripts/build_gazetteer.py [--cities cities5000.zip] [--admin1 admin1CodesASCII.txt] [--limit 50000]
+
+Both inputs can be local files or URLs and default to the GeoNames export server.
+"""
+import os
+import io
+import sys
+import zipfile
+import argparse
+from urllib.request import urlopen
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from api.geocoding import GAZETTEER_PATH, normalize_name, write_gazetteer  # noqa: E402
+
+GEONAMES_URL = "https://download.geonames.org/export/dump/"
+
+# Common names of cities that differ from their GeoNames name, keyed by the GeoNames name and country
+ALTERNATE_NAMES = {
+    ("New York City", "US"): ["New York", "NYC"],
+    ("Frankfurt am Main", "DE"): ["Frankfurt"],
+    ("Köln", "DE"): ["Cologne"],
+    ("Munich", "DE"): ["München"],
+    ("The Hague", "NL"): ["Den Haag"],
+    ("Saint Petersburg", "RU"): ["St. Petersburg"],
+    ("Kyiv", "UA"): ["Kiev"],
+    ("Québec", "CA"): ["Quebec City"],
+    ("Rio de Janeiro", "BR"): ["Rio"],
+    ("Makkah", "SA"): ["Mecca"],
+    ("Beijing", "CN"): ["Peking"],
+    ("Ho Chi Minh City", "VN"): ["Saigon"],
+    ("Yangon", "MM"): ["Rangoon"],
+    ("Mumbai", "IN"): ["Bombay"],
+    ("Kolkata", "IN"): ["Calcutta"],
+    ("Chennai", "IN"): ["Madras"],
+    ("Bengaluru", "IN"): ["Bangalore"],
+}
+
+
+def read_source(source: str) -> str:
+    """Read a local or remote text file that may be zipped."""
+    if source.startswith(("http://", "https://")):
+        with urlopen(source) as response:
+            data = response.read()
+    else:
+        with open(source, "rb") as f:
+            data = f.read()
+    if source.endswith(".zip"):
+        with zipfile.ZipFile(io.BytesIO(data)) as archive:
+            data = archive.read(archive.namelist()[0])
+    return data.decode("utf-8")
+
+
+def load_states(source: str) -> dict:
+    """Load the admin1 (state) names keyed by 'country.code'."""
+    states = {}
+    for line in read_source(source).splitlines():
+        fields = line.split("\t")
+        if len(fields) >= 2:
+            states[fields[0]] = fields[1]
+    return states
+
+
+def load_cities(source: str, states: dict, limit: int) -> list[tuple]:
+    """Load the most populous cities from a GeoNames cities dump."""
+    rows = []
+    for line in read_source(source).splitlines():
+        fields = line.split("\t")
+        if len(fields) < 15:
+            continue
+        rows.append(fields)
+
+    # keep the most populous cities
+    rows.sort(key=lambda fields: int(fields[14] or 0), reverse=True)
+    rows = rows[:limit]
+
+    cities = []
+    for fields in rows:
+        name, ascii_name, country, state_code = fields[1], fields[2], fields[8], fields[10]
+        lat, lon, population = float(fields[4]), float(fields[5]), int(fields[14] or 0)
+        state_name = states.get(f"{country}.{state_code}", "")
+        cities.append((name, country, state_code, state_name, lat, lon, population))
+        # index the ascii name as well if it normalizes differently
+        if ascii_name and normalize_name(ascii_name) != normalize_name(name):
+            cities.append((ascii_name, country, state_code, state_name, lat, lon, population))
+        # index common alternate names, which GeoNames lists among dozens of translations
+        for alternate_name in ALTERNATE_NAMES.get((name, country), []):
+            cities.append((alternate_name, country, state_code, state_name, lat, lon, population))
+    return cities
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build the offline city index from GeoNames data.")
+    parser.add_argument("--cities", default=GEONAMES_URL + "cities5000.zip", help="GeoNames cities file or URL.")
+    parser.add_argument("--admin1", default=GEONAMES_URL + "admin1CodesASCII.txt", help="GeoNames admin1 codes.")
+    parser.add_argument("--limit", type=int, default=50_000, help="Number of most populous cities to include.")
+    parser.add_argument("--output", default=GAZETTEER_PATH, help="Output path of the city index.")
+    args = parser.parse_args()
+
+    states = load_states(args.admin1)
+    cities = load_cities(args.cities, states, args.limit)
+    count = write_gazetteer(args.output, cities)
+    print(f"Wrote {count} records to {args.output} ({os.path.getsize(args.output) / 1e6:.1f} MB).")
+
+
+if __name__ == "__main__":
+    main()
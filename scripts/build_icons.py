@@ -0,0 +1,35 @@
+"""Download the weather icons of OpenWeatherMap into the bundle of the app, so that `/icons` never has to fetch them.
+
+Usage:
+    python scripts/build_icons.py [--output api/data/icons]
+"""
+import os
+import sys
+import argparse
+from urllib.request import urlopen
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from api.icons import ICON_BUNDLE_DIR, ICON_IDS, ICON_URL  # noqa: E402
+
+
+def download(icon: str) -> bytes:
+    """Download an icon from OpenWeatherMap."""
+    with urlopen(ICON_URL.format(icon=icon)) as response:
+        return response.read()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Download the weather icons that are bundled with the app.")
+    parser.add_argument("--output", default=ICON_BUNDLE_DIR, help="Output folder of the icons.")
+    args = parser.parse_args()
+
+    os.makedirs(args.output, exist_ok=True)
+    for icon in sorted(ICON_IDS):
+        with open(os.path.join(args.output, f"{icon}.png"), "wb") as f:
+            f.write(download(icon))
+    print(f"Wrote {len(ICON_IDS)} icons to {args.output}.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,149 @@
+"""Report the accuracy and latency of the fast answers to simple weather questions.
+
+Usage:
+    python scripts/fast_answer_report.py [--live]
+
+The classifier and the city extractor are evaluated on labelled sets of questions. With --live, the latency of fast
+answers is compared with the answers of the agent, which requires valid API keys and sends real requests.
+"""
+import os
+import sys
+import time
+import argparse
+import statistics
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from api import Gazetteer  # noqa: E402
+from bot import classify_question  # noqa: E402
+
+# Questions labelled with the expected (metric, day, city) or None if they must be answered by the LLM
+LABELLED_QUESTIONS = [
+    ("What is the current temperature in London?", ("temp", "now", "London")),
+    ("What is the wind speed in Tokyo?", ("wind_speed", "now", "Tokyo")),
+    ("Does it currently rain in New York City?", ("rain", "now", "New York City")),
+    ("Is it cloudy or sunny in Los Angeles?", ("clouds", "now", "Los Angeles")),
+    ("How humid is it in Singapore right now?", ("humidity", "now", "Singapore")),
+    ("What's the UV index in Miami?", ("uvi", "now", "Miami")),
+    ("Will it rain tomorrow in Paris?", ("rain", "tomorrow", "Paris")),
+    ("How cold will it be on Friday in Oslo?", ("temp", "friday", "Oslo")),
+    ("Is it going to snow today in Denver?", ("snow", "today", "Denver")),
+    ("How windy is it in Chicago?", ("wind_speed", "now", "Chicago")),
+    ("What is the temperature in Portland, ME?", ("temp", "now", "Portland")),
+    ("Temperature in Rio de Janeiro tomorrow?", ("temp", "tomorrow", "Rio de Janeiro")),
+    ("What is the weather like in Frankfurt am Main?", None),
+    ("What is the weather forecast for tomorrow in Paris?", None),
+    ("How is the weather going to develop over the next few days in Berlin?", None),
+    ("Should I take an umbrella in London today?", None),
+    ("Is it warmer in Madrid than in Rome?", None),
+    ("What is the temperature in the morning in Vienna?", None),
+    ("Will it rain this weekend in Dublin?", None),
+    ("Explain the concept of a thunderstorm.", None),
+    ("Why is the sky blue?", None),
+    ("What is your name?", None),
+    ("And what about the wind tomorrow?", None),
+    ("Is it hot and humid in Bangkok?", None),
+    ("What is the wind speed in Hamburg and Bremen?", None),
+    ("Will it rain in London?", None),
+    ("Is it going to snow in Oslo?", None),
+    ("What was the temperature in London yesterday?", None),
+    ("How cold was it on Monday in Oslo?", None),
+    ("How cold will it get in Oslo in January?", None),
+    ("What is the temperature in London in Fahrenheit?", None),
+    ("What is the wind speed in Chicago in mph?", None),
+]
+
+# Questions labelled with the names of the cities that the city extractor must find
+LABELLED_LOCATIONS = [
+    ("Tell me about March weather", []),
+    ("Will it rain on Monday in New York?", ["New York"]),
+    ("Is it sunny in May in Madrid?", ["Madrid"]),
+    ("What is the weather in NYC on Sunday?", ["NYC"]),
+    ("How hot is it in Calcutta?", ["Calcutta"]),
+    ("What is the weather like in Frankfurt am Main?", ["Frankfurt am Main"]),
+    ("What is the temperature in Portland, ME?", ["Portland"]),
+    ("Is it warmer in Madrid than in Rome?", ["Madrid", "Rome"]),
+    ("Explain the concept of a thunderstorm.", []),
+]
+
+
+def fast_path(gazetteer: Gazetteer, question: str) -> tuple[str, str, str] | None:
+    """Predict the (metric, day, city) of a question as the fast answer mode does."""
+    classification = classify_question(question)
+    if classification is None:
+        return None
+    locations = gazetteer.extract_all(question)
+    if len(locations) != 1:
+        return None
+    return *classification, locations[0]["name"]
+
+
+def report_accuracy(gazetteer: Gazetteer) -> list[str]:
+    """Print the accuracy and latency of the fast path decisions and return the questions answered fast."""
+    correct, fast, latencies = 0, [], []
+    for question, expected in LABELLED_QUESTIONS:
+        start = time.perf_counter()
+        predicted = fast_path(gazetteer, question)
+        latencies.append((time.perf_counter() - start) * 1000)
+        correct += predicted == expected
+        if predicted is not None:
+            fast.append(question)
+        if predicted != expected:
+            print(f"MISMATCH {question!r}: expected {expected}, got {predicted}")
+
+    # count the fast answers that are correct and the simple questions that were recognized
+    simple = [question for question, expected in LABELLED_QUESTIONS if expected is not None]
+    true_fast = sum(fast_path(gazetteer, q) == e for q, e in LABELLED_QUESTIONS if e is not None)
+    print(f"Accuracy:  {correct / len(LABELLED_QUESTIONS):.0%} ({correct}/{len(LABELLED_QUESTIONS)})")
+    print(f"Precision: {true_fast / max(1, len(fast)):.0%} of fast answers are correct")
+    print(f"Recall:    {true_fast / len(simple):.0%} of simple questions are answered fast")
+    print(f"Latency:   {statistics.median(latencies):.3f} ms median, {max(latencies):.3f} ms max per question")
+    return fast
+
+
+def report_locations(gazetteer: Gazetteer) -> None:
+    """Print the accuracy of the city extractor."""
+    correct = 0
+    for question, expected in LABELLED_LOCATIONS:
+        found = [location["name"] for location in gazetteer.extract_all(question)]
+        correct += found == expected
+        if found != expected:
+            print(f"MISMATCH {question!r}: expected cities {expected}, got {found}")
+    print(f"Cities:    {correct / len(LABELLED_LOCATIONS):.0%} ({correct}/{len(LABELLED_LOCATIONS)}) of the questions")
+
+
+def report_live(questions: list[str]) -> None:
+    """Print the latency of fast answers and agent answers to the same questions."""
+    from bot import setup_agent, query_llm, fast_answer
+
+    agent, _ = setup_agent(model="gpt-4o-mini", temperature=0.5)
+    fast_times, agent_times = [], []
+    for question in questions:
+        # the agent goes second and is served cached weather data, so its latency is a lower bound
+        start = time.perf_counter()
+        result = fast_answer(agent, question)
+        fast_times.append(time.perf_counter() - start)
+        agent.memory.clear()
+        start = time.perf_counter()
+        response = query_llm(agent, question, prefetch=False)
+        agent_times.append(time.perf_counter() - start)
+        agent.memory.clear()
+        print(f"\n{question}\n  fast:  {result and result[0]}\n  agent: {response}")
+    print(f"\nFast answers:  {statistics.median(fast_times):.2f} s median")
+    print(f"Agent answers: {statistics.median(agent_times):.2f} s median")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Report the accuracy and latency of fast answers.")
+    parser.add_argument("--live", action="store_true", help="Compare with the agent using the real APIs.")
+    args = parser.parse_args()
+
+    gazetteer = Gazetteer()
+    fast = report_accuracy(gazetteer)
+    report_locations(gazetteer)
+    if args.live:
+        report_live(fast)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+"""Profile the import time of the app to keep its cold start fast.
+
+Usage:
+    python scripts/import_profile.py [--top 15] [--budget 1.0] [--warm-up]
+
+The app is imported in a fresh interpreter with `-X importtime`. The slowest imports are listed and the script fails if
+modules that must only be imported when the chatbot is built, like LangChain, are imported by the app or if the import
+takes longer than the budget. With --warm-up, the time to build the chatbot on the first question is reported as well.
+"""
+import os
+import sys
+import argparse
+import tempfile
+import subprocess
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Packages that are only imported when the chatbot is built
+DEFERRED_PACKAGES = ("langchain", "langchain_core", "langchain_openai", "openai", "tiktoken")
+
+
+def run(code: str, *flags: str) -> subprocess.CompletedProcess:
+    """Run code in a fresh interpreter in the repository without warm-up and with a temporary cache folder."""
+    with tempfile.TemporaryDirectory() as cache_dir:
+        env = {**os.environ, "WARM_UP": "false", "CACHE_DIR": cache_dir, "OPENAI_API_KEY": "x" * 16}
+        return subprocess.run([sys.executable, *flags, "-c", code], cwd=ROOT, env=env, capture_output=True,
+                              text=True, check=True)
+
+
+def parse_importtime(output: str) -> list[tuple[str, int, float]]:
+    """Parse the `-X importtime` output into (module, depth, cumulative seconds) tuples."""
+    imports = []
+    for line in output.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        _, cumulative, name = line.split("|")
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        imports.append((name.strip(), depth, int(cumulative) / 1e6))
+    return imports
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Profile the import time of the app.")
+    parser.add_argument("--top", type=int, default=15, help="Number of slowest imports to list.")
+    parser.add_argument("--budget", type=float, default=None, help="Maximum import time of the app in seconds.")
+    parser.add_argument("--warm-up", action="store_true", help="Also report the time to build the chatbot.")
+    args = parser.parse_args()
+
+    # list the slowest direct and second level imports
+    imports = parse_importtime(run("import app", "-X", "importtime").stderr)
+    total = next(seconds for name, depth, seconds in imports if name == "app")
+    print(f"Import of the app: {total:.3f} s")
+    print("Slowest imports:")
+    slowest = sorted((item for item in imports if 1 <= item[1] <= 2), key=lambda item: -item[2])
+    for name, depth, seconds in slowest[:args.top]:
+        print(f"  {seconds:7.3f} s  {'  ' * (depth - 1)}{name}")
+
+    # check that the chatbot stack is deferred
+    failed = False
+    deferred = sorted({name for name, _, _ in imports if name.split(".")[0] in DEFERRED_PACKAGES})
+    if deferred:
+        failed = True
+        print(f"FAIL: {len(deferred)} modules of {', '.join(DEFERRED_PACKAGES)} are imported with the app, "
+              f"e.g. {', '.join(deferred[:5])}")
+    if args.budget is not None and total > args.budget:
+        failed = True
+        print(f"FAIL: the import takes longer than the budget of {args.budget:.3f} s")
+
+    # measure the time to build the chatbot on the first question
+    if args.warm_up:
+        code = "import time, app; start = time.perf_counter(); app.get_chatbot(); print(time.perf_counter() - start)"
+        print(f"Build of the chatbot: {float(run(code).stdout.split()[-1]):.3f} s")
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
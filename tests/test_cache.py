@@ -0,0 +1,122 @@
+import pytest
+from api import cache
+from api.cache import MemoryCache, SQLiteCache, WeatherCache
+from api.snapshot import WeatherSnapshot
+
+NOW = 1_700_000_000
+
+
+@pytest.fixture
+def clock(monkeypatch) -> list:
+    """Control the time of the cache."""
+    now = [float(NOW)]
+    monkeypatch.setattr(cache.time, "time", lambda: now[0])
+    return now
+
+
+def snapshot() -> WeatherSnapshot:
+    """Create weather data with all parts."""
+    return WeatherSnapshot(
+        timezone_offset=3600,
+        current={"dt": NOW, "temp": 12.5, "description": "light rain"},
+        daily={"dt": [NOW], "temp_day": [14.0]},
+        hourly={"dt": [NOW, NOW + 3600], "temp": [12.5, 13.0]},
+        minutely={"dt": [NOW, NOW + 60], "precipitation": [0.2, 0.0]},
+    )
+
+
+@pytest.fixture
+def weather_cache(clock) -> WeatherCache:
+    """Create a cache that holds all parts of the weather data of a location."""
+    weather_cache = WeatherCache(backend=MemoryCache(), current_ttl=600, daily_ttl=3600, stale_ttl=3600,
+                                 hourly_ttl=600, minutely_ttl=60)
+    weather_cache.set(52.52, 13.405, snapshot(), ["current", "daily", "hourly", "minutely"])
+    return weather_cache
+
+
+def test_keys_round_coordinates():
+    weather_cache = WeatherCache(backend=MemoryCache(), precision=2)
+    assert weather_cache.key(52.5201, 13.4049) == weather_cache.key(52.52, 13.405) == "52.52,13.40"
+
+
+def test_fresh_data_is_served(weather_cache):
+    weather, expired = weather_cache.get(52.52, 13.405)
+    assert expired == []
+    assert weather.current["temp"] == 12.5
+
+
+def test_timeline_parts_are_only_served_on_request(weather_cache):
+    weather, _ = weather_cache.get(52.52, 13.405)
+    assert weather.hourly is None and weather.minutely is None
+    weather, _ = weather_cache.get(52.52, 13.405, ("current", "daily", "hourly"))
+    assert weather.hourly["temp"] == [12.5, 13.0] and weather.minutely is None
+
+
+def test_expired_parts_are_served_stale(weather_cache, clock):
+    clock[0] += 601
+    weather, expired = weather_cache.get(52.52, 13.405)
+    assert weather is not None
+    assert expired == ["current"]
+
+
+def test_data_is_not_served_after_the_stale_period(weather_cache, clock):
+    clock[0] += 600 + 3600 + 1
+    assert weather_cache.get(52.52, 13.405) == (None, ["current", "daily"])
+
+
+def test_minutely_forecast_is_never_served_stale(weather_cache, clock):
+    parts = ("current", "daily", "minutely")
+    clock[0] += 60
+    assert weather_cache.get(52.52, 13.405, parts)[0] is not None
+    clock[0] += 1
+    assert weather_cache.get(52.52, 13.405, parts) == (None, list(parts))
+    assert weather_cache.get(52.52, 13.405)[0] is not None
+
+
+def test_hourly_forecast_is_never_served_stale(weather_cache, clock):
+    parts = ("current", "daily", "hourly")
+    clock[0] += 601
+    assert weather_cache.get(52.52, 13.405, parts) == (None, list(parts))
+
+
+def test_refetched_parts_are_merged(weather_cache, clock):
+    clock[0] += 601
+    fetched = WeatherSnapshot(timezone_offset=3600, current={"dt": NOW + 601, "temp": 15.0, "description": "clear"},
+                              hourly={"dt": [NOW + 3600], "temp": [13.0]})
+    weather_cache.set(52.52, 13.405, fetched, ["current", "hourly"])
+    weather, expired = weather_cache.get(52.52, 13.405, ("current", "daily", "hourly"))
+    assert expired == []
+    assert weather.current["temp"] == 15.0 and weather.daily["temp_day"] == [14.0]
+    assert weather.hourly["temp"] == [13.0]
+
+
+def test_outdated_data_is_served_regardless_of_age(weather_cache, clock):
+    clock[0] += 10 * 86400
+    assert weather_cache.get(52.52, 13.405)[0] is None
+    assert weather_cache.get_outdated(52.52, 13.405).current["temp"] == 12.5
+    assert weather_cache.get_outdated(0, 0) is None
+
+
+def test_only_one_refresh_runs_per_location(weather_cache):
+    assert weather_cache.start_refresh(52.52, 13.405)
+    assert not weather_cache.start_refresh(52.52, 13.405)
+    weather_cache.end_refresh(52.52, 13.405)
+    assert weather_cache.start_refresh(52.52, 13.405)
+
+
+def test_memory_cache_evicts_least_recently_used():
+    memory = MemoryCache(maxsize=2)
+    memory.set("a", {"value": 1})
+    memory.set("b", {"value": 2})
+    memory.get("a")
+    memory.set("c", {"value": 3})
+    assert memory.get("b") is None
+    assert memory.get("a") == {"value": 1} and memory.get("c") == {"value": 3}
+
+
+def test_sqlite_cache_stores_values(tmp_path):
+    sqlite = SQLiteCache(str(tmp_path / "cache.db"), table="weather")
+    sqlite.set("a", {"value": 1})
+    assert sqlite.get("a") == {"value": 1}
+    sqlite.delete("a")
+    assert sqlite.get("a") is None
@@ -0,0 +1,52 @@
+import pytest
+from bot.fast_answers import classify_question
+
+
+@pytest.mark.parametrize("question, expected", [
+    ("What is the current temperature in London?", ("temp", "now")),
+    ("What is the wind speed in Tokyo?", ("wind_speed", "now")),
+    ("Does it currently rain in New York City?", ("rain", "now")),
+    ("Is it cloudy or sunny in Los Angeles?", ("clouds", "now")),
+    ("How humid is it in Singapore right now?", ("humidity", "now")),
+    ("What's the UV index in Miami?", ("uvi", "now")),
+    ("How windy is it in Chicago?", ("wind_speed", "now")),
+    ("WHAT IS THE TEMPERATURE IN BERLIN?", ("temp", "now")),
+    ("Will it rain tomorrow in Paris?", ("rain", "tomorrow")),
+    ("How cold will it be on Friday in Oslo?", ("temp", "friday")),
+    ("Is it going to snow today in Denver?", ("snow", "today")),
+    ("Temperature in Rio de Janeiro tomorrow?", ("temp", "tomorrow")),
+])
+def test_simple_questions_are_classified(question, expected):
+    assert classify_question(question) == expected
+
+
+@pytest.mark.parametrize("question", [
+    # no single metric
+    "What is the weather like in Frankfurt am Main?",
+    "What is the weather forecast for tomorrow in Paris?",
+    "Is it hot and humid in Bangkok?",
+    "What is your name?",
+    # advice, comparisons and explanations
+    "Should I take an umbrella in London today?",
+    "Is it warmer in Madrid than in Rome?",
+    "Explain the concept of a thunderstorm.",
+    "Why is the sky blue?",
+    # periods other than a single day
+    "How is the weather going to develop over the next few days in Berlin?",
+    "What is the temperature in the morning in Vienna?",
+    "Will it rain this weekend in Dublin?",
+    "How cold will it get in Oslo in January?",
+    "Is it colder on Monday or Tuesday in Oslo?",
+    # the future without a day
+    "Will it rain in London?",
+    "Is it going to snow in Oslo?",
+    # the past
+    "What was the temperature in London yesterday?",
+    "How cold was it on Monday in Oslo?",
+    # other units
+    "What is the temperature in London in Fahrenheit?",
+    "What is the wind speed in Chicago in mph?",
+    "Is it above 50 °F in Boston?",
+])
+def test_other_questions_are_left_to_the_llm(question):
+    assert classify_question(question) is None
@@ -0,0 +1,84 @@
+import pytest
+from api.snapshot import WeatherSnapshot
+from api.timeline import WeatherTimeline
+
+HOUR = 1_700_000_000 - 1_700_000_000 % 3600
+
+
+def timeline(now: int = HOUR + 1800) -> WeatherTimeline:
+    """Create a timeline with two past and six upcoming hours and the minutes from the start of the hour."""
+    times = [HOUR + 3600 * hour for hour in range(-2, 6)]
+    weather = WeatherSnapshot(
+        timezone_offset=3600,
+        hourly={
+            "dt": times,
+            "temp": [30.0, -10.0, 12.0, 14.0, 16.0, 15.0, 11.0, 9.0],
+            "pop": [1.0, 1.0, 0.0, 0.2, 0.6, 0.9, 0.4, 0.0],
+            "rain": [5.0, 5.0, 0.0, 0.0, 0.5, 1.5, 0.25, 0.0],
+            "snow": [0.0] * 8,
+            "wind_speed": [3.0] * 8,
+            "wind_gust": [4.0, 20.0, 5.0, 6.0, 12.0, 8.0, 5.0, 4.0],
+        },
+        minutely={
+            "dt": [HOUR + 60 * minute for minute in range(60)],
+            "precipitation": [9.0] * 30 + [0.0] * 5 + [0.5] * 10 + [2.0] * 5 + [0.0] * 10,
+        },
+    )
+    weather_timeline = WeatherTimeline(weather)
+    weather_timeline.now = now
+    return weather_timeline
+
+
+def test_window_starts_at_the_current_hour():
+    weather_timeline = timeline()
+    assert weather_timeline.hours(3).tolist() == [HOUR, HOUR + 3600, HOUR + 7200]
+    assert weather_timeline.hours(10).tolist() == [HOUR + 3600 * hour for hour in range(6)]
+
+
+def test_window_is_empty_after_the_forecast():
+    weather_timeline = timeline(now=HOUR + 3600 * 7)
+    assert weather_timeline.hours(3).size == 0
+    assert weather_timeline.maximum("temp", 3) is None
+    assert weather_timeline.minimum("temp", 3) is None
+    assert weather_timeline.first_hour("pop", 50, 3) is None
+    assert weather_timeline.total("rain", 3) == 0
+
+
+def test_first_hour_ignores_past_hours():
+    weather_timeline = timeline()
+    assert weather_timeline.first_hour("pop", 50, 6) == HOUR + 7200
+    assert weather_timeline.first_hour("wind_gust", 10, 6) == HOUR + 7200
+    assert weather_timeline.first_hour("pop", 50, 2) is None
+    assert weather_timeline.first_hour("snow", 0, 6) is None
+
+
+def test_extremes_are_taken_from_the_window():
+    weather_timeline = timeline()
+    assert weather_timeline.maximum("temp", 6) == (16.0, HOUR + 7200)
+    assert weather_timeline.minimum("temp", 6) == (9.0, HOUR + 3600 * 5)
+    assert weather_timeline.minimum("temp", 3) == (12.0, HOUR)
+
+
+@pytest.mark.parametrize("hours, rain", [(1, 0.0), (3, 0.5), (6, 2.25), (24, 2.25)])
+def test_totals_sum_the_window(hours, rain):
+    assert timeline().total("rain", hours) == rain
+
+
+def test_probability_of_precipitation_is_in_percent():
+    assert timeline().maximum("pop", 6) == (90.0, HOUR + 3 * 3600)
+
+
+@pytest.mark.parametrize("now, minutes", [
+    (HOUR + 1800, (5, 20, 2.0)),
+    (HOUR + 1200, (0, 10, 9.0)),
+    (HOUR + 2820, (0, 3, 2.0)),
+    (HOUR + 3000, (None, None, 0.0)),
+])
+def test_precipitation_minutes_start_at_the_current_minute(now, minutes):
+    assert timeline(now).precipitation_minutes() == minutes
+
+
+def test_timeline_without_forecasts_is_empty():
+    weather_timeline = WeatherTimeline(WeatherSnapshot(timezone_offset=0))
+    assert weather_timeline.hours(6).size == 0
+    assert weather_timeline.precipitation_minutes() == (None, None, 0.0)
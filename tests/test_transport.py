@@ -0,0 +1,191 @@
+import asyncio
+import httpx
+import pytest
+import requests
+from email.utils import format_datetime
+from datetime import datetime, timedelta, timezone
+from requests.adapters import BaseAdapter
+from api import transport
+from api.transport import (AsyncHTTPTransport, CircuitBreaker, CircuitOpenError, HTTPTransport, QuotaExhaustedError,
+                           retry_after)
+
+URL = "http://weather.test/data/3.0/onecall"
+
+
+class ScriptedAdapter(BaseAdapter):
+    """Adapter that answers requests with a script of (status, headers) tuples or exceptions."""
+    def __init__(self, script: list):
+        super().__init__()
+        self.script = list(script)
+        self.calls = 0
+
+    def send(self, request, **kwargs):
+        self.calls += 1
+        step = self.script.pop(0)
+        if isinstance(step, Exception):
+            raise step
+        status, headers = step
+        response = requests.Response()
+        response.status_code = status
+        response.headers.update(headers)
+        response.request = request
+        response.url = request.url
+        response._content = b"{}"
+        return response
+
+    def close(self):
+        pass
+
+
+class Budget:
+    """Request budget with a fixed number of requests."""
+    def __init__(self, requests: int):
+        self.requests = requests
+
+    def acquire(self) -> bool:
+        if self.requests <= 0:
+            return False
+        self.requests -= 1
+        return True
+
+
+@pytest.fixture
+def sleeps(monkeypatch) -> list:
+    """Record the delays of the transport instead of sleeping."""
+    delays = []
+    monkeypatch.setattr(transport.time, "sleep", delays.append)
+    return delays
+
+
+def scripted(script: list, **kwargs) -> tuple[HTTPTransport, ScriptedAdapter]:
+    """Create a transport whose requests are answered by a script."""
+    adapter = ScriptedAdapter(script)
+    http = HTTPTransport(**kwargs)
+    http.session.mount("http://", adapter)
+    return http, adapter
+
+
+def test_server_errors_are_retried(sleeps):
+    http, adapter = scripted([(503, {}), (502, {}), (200, {})])
+    assert http.get(URL).status_code == 200
+    assert adapter.calls == 3
+    assert len(sleeps) == 2
+
+
+def test_last_server_error_is_returned(sleeps):
+    http, adapter = scripted([(500, {})] * 3, max_retries=2)
+    assert http.get(URL).status_code == 500
+    assert adapter.calls == 3
+
+
+def test_connection_errors_are_retried_and_raised(sleeps):
+    http, adapter = scripted([requests.ConnectionError("refused")] * 2, max_retries=1)
+    with pytest.raises(requests.ConnectionError):
+        http.get(URL)
+    assert adapter.calls == 2
+
+
+def test_client_errors_are_not_retried(sleeps):
+    http, adapter = scripted([(401, {})])
+    assert http.get(URL).status_code == 401
+    assert adapter.calls == 1
+    assert sleeps == []
+
+
+def test_backoff_is_jittered_and_capped():
+    http = HTTPTransport(backoff=0.5, max_backoff=2)
+    assert all(0 <= http.delay(attempt) <= min(2, 0.5 * 2 ** attempt) for attempt in range(6) for _ in range(20))
+
+
+def test_rate_limit_is_retried_after_retry_after(sleeps):
+    http, adapter = scripted([(429, {"Retry-After": "3"}), (200, {})])
+    assert http.get(URL).status_code == 200
+    assert sleeps == [3]
+
+
+def test_rate_limit_with_long_retry_after_is_returned(sleeps):
+    http, adapter = scripted([(429, {"Retry-After": "60"})], max_retry_after=10)
+    assert http.get(URL).status_code == 429
+    assert adapter.calls == 1
+    assert sleeps == []
+
+
+def test_rate_limit_without_retry_after_is_returned(sleeps):
+    http, adapter = scripted([(429, {})])
+    assert http.get(URL).status_code == 429
+    assert adapter.calls == 1
+
+
+def test_rate_limit_on_last_attempt_is_returned(sleeps):
+    http, adapter = scripted([(429, {"Retry-After": "1"})] * 2, max_retries=1)
+    assert http.get(URL).status_code == 429
+    assert adapter.calls == 2
+
+
+def test_retry_after_parses_seconds_and_dates():
+    def response(value: str) -> requests.Response:
+        response = requests.Response()
+        response.headers["Retry-After"] = value
+        return response
+
+    assert retry_after(response("5")) == 5
+    assert 25 < retry_after(response(format_datetime(datetime.now(timezone.utc) + timedelta(seconds=30)))) <= 30
+    assert retry_after(response("soon")) is None
+    assert retry_after(requests.Response()) is None
+
+
+def test_circuit_opens_after_repeated_failures(sleeps):
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=30)
+    http, adapter = scripted([(503, {})] * 2, max_retries=0, breaker=breaker)
+    http.get(URL)
+    http.get(URL)
+    with pytest.raises(CircuitOpenError):
+        http.get(URL)
+    assert adapter.calls == 2
+
+
+def test_circuit_lets_a_single_trial_through_after_the_timeout(monkeypatch):
+    clock = [100.0]
+    monkeypatch.setattr(transport.time, "monotonic", lambda: clock[0])
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=30)
+    breaker.record_failure()
+    assert not breaker.allow()
+    clock[0] += 31
+    assert breaker.allow()
+    assert not breaker.allow()
+    breaker.record_success()
+    assert breaker.allow()
+
+
+def test_each_attempt_is_charged_to_the_quota(sleeps):
+    http, adapter = scripted([(503, {})] * 3)
+    budget = Budget(2)
+    assert http.get(URL, quota=budget).status_code == 503
+    assert adapter.calls == 2
+    assert budget.requests == 0
+
+
+def test_exhausted_quota_sends_no_request():
+    http, adapter = scripted([(200, {})])
+    with pytest.raises(QuotaExhaustedError):
+        http.get(URL, quota=Budget(0))
+    assert adapter.calls == 0
+
+
+def test_async_transport_retries_and_keeps_its_client_across_event_loops():
+    statuses = [503, 429, 200, 200]
+    calls = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        calls.append(request.url)
+        status = statuses.pop(0)
+        return httpx.Response(status, headers={"Retry-After": "0"} if status == 429 else {})
+
+    # the client is replaced when the event loop of the transport starts, so it is set afterwards
+    http = AsyncHTTPTransport(backoff=0)
+    loop = http.loop
+    http._client = client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+    assert asyncio.run(http.get(URL)).status_code == 200
+    assert len(calls) == 3
+    assert asyncio.run(http.get(URL)).status_code == 200
+    assert http.loop is loop and http.client is client